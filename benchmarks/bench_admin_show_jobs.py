@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark receiving a large "show jobs" reply through GearmanAdminClient's command handler
+
+The time per line should stay flat as the reply grows: each received byte is
+searched for a newline once, however the reply is split into reads.
+
+    python benchmarks/bench_admin_show_jobs.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman.admin_client_handler import GearmanAdminClientCommandHandler  # noqa: E402
+from gearman.connection import GearmanConnection  # noqa: E402
+from gearman.protocol import GEARMAN_SERVER_COMMAND_SHOW_JOBS  # noqa: E402
+
+JOB_COUNTS = [10000, 100000, 1000000]
+READ_SIZE = 64 * 1024
+
+
+class ChunkedSocket(object):
+    """Stands in for a socket, handing out at most chunk_size bytes per readiness event"""
+    def __init__(self, data, chunk_size):
+        self.data = memoryview(data)
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def recv_into(self, buffer, nbytes):
+        bytes_read = min(nbytes, self.chunk_size, len(self.data) - self.offset)
+        buffer[:bytes_read] = self.data[self.offset:self.offset + bytes_read]
+        self.offset += bytes_read
+        return bytes_read
+
+
+class SingleConnectionManager(object):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def read_command(self, command_handler):
+        return self.conn.read_command()
+
+    def send_command(self, command_handler, cmd_type, cmd_args):
+        pass
+
+
+def build_reply(job_count):
+    lines = [b'H:localhost:%d\t1\t0\t1\n' % index for index in range(job_count)]
+    lines.append(b'.\n')
+    return b''.join(lines)
+
+
+def receive_reply(reply):
+    conn = GearmanConnection(host='localhost')
+    conn.gearman_socket = ChunkedSocket(reply, READ_SIZE)
+    conn.connected = True
+    conn._is_client_side = True
+    conn._is_server_side = False
+
+    command_handler = GearmanAdminClientCommandHandler(connection_manager=SingleConnectionManager(conn))
+    command_handler.send_text_command(GEARMAN_SERVER_COMMAND_SHOW_JOBS)
+
+    start_time = time.time()
+    while not command_handler.response_ready:
+        conn.read_data_from_socket()
+        conn.read_commands_from_buffer()
+        command_handler.fetch_commands()
+
+    _, jobs = command_handler.pop_response()
+    return jobs, time.time() - start_time
+
+
+def main():
+    print('Receiving "show jobs" replies in %d byte reads' % READ_SIZE)
+    for job_count in JOB_COUNTS:
+        reply = build_reply(job_count)
+        jobs, elapsed = receive_reply(reply)
+        assert len(jobs) == job_count
+        print('  %8d jobs (%5.1f MB): %6.3fs (%.2f us per line)' % (
+            job_count, len(reply) / 1024.0 / 1024.0, elapsed, elapsed / job_count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
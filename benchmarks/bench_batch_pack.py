@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Benchmark packing background SUBMIT_JOB commands in bulk
+
+Every timing is compared against the baseline: the per-command
+pack_binary_command() and send_commands_to_buffer() that python-gearman
+shipped before commands had compiled codecs, copied below.  Runs with 100k
+commands at once, then with batches of one and two commands.
+
+    python benchmarks/bench_batch_pack.py
+"""
+
+from __future__ import print_function
+
+import collections
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import protocol  # noqa: E402
+from gearman.connection import GearmanConnection  # noqa: E402
+
+COMMAND_COUNT = 100000
+SMALL_BATCH_REPEATS = 20000
+REPEAT = 5
+
+
+def baseline_pack_binary_command(cmd_type, cmd_args, is_response=False):
+    """pack_binary_command() as it was before compiled codecs, less its checks for non-binary arguments"""
+    expected_cmd_params = protocol.GEARMAN_PARAMS_FOR_COMMAND.get(cmd_type, None)
+    if expected_cmd_params is None or cmd_type == protocol.GEARMAN_COMMAND_TEXT_COMMAND:
+        raise protocol.ProtocolError('Received unknown binary command')
+
+    if set(expected_cmd_params) != set(cmd_args.keys()):
+        raise protocol.ProtocolError('Received arguments did not match expected arguments')
+
+    magic = protocol.MAGIC_RES_STRING if is_response else protocol.MAGIC_REQ_STRING
+
+    data_items = [cmd_args[param] for param in expected_cmd_params]
+    if any(b'\0' in argument for argument in data_items[:-1]):
+        raise protocol.ProtocolError('Received arguments with NULL byte in non-final argument')
+
+    binary_payload = protocol.NULL_CHAR.join(data_items)
+    payload_size = len(binary_payload)
+    return struct.pack('!4sII%ds' % payload_size, magic, cmd_type, payload_size, binary_payload)
+
+
+class BaselineConnection(object):
+    """The parts of GearmanConnection.send_commands_to_buffer() as it was before bulk packing and outgoing segments"""
+    def __init__(self):
+        self._outgoing_commands = collections.deque()
+        self._outgoing_buffer = b''
+
+    def send_commands_to_buffer(self):
+        if not self._outgoing_commands:
+            return
+
+        packed_data = [self._outgoing_buffer]
+        while self._outgoing_commands:
+            cmd_type, cmd_args = self._outgoing_commands.popleft()
+            packed_data.append(self._pack_command(cmd_type, cmd_args))
+        self._outgoing_buffer = b''.join(packed_data)
+
+    def _pack_command(self, cmd_type, cmd_args):
+        if cmd_type not in protocol.GEARMAN_PARAMS_FOR_COMMAND:
+            raise protocol.ProtocolError('Unknown command')
+
+        if cmd_type == protocol.GEARMAN_COMMAND_TEXT_COMMAND:
+            return protocol.pack_text_command(cmd_type, cmd_args)
+        return baseline_pack_binary_command(cmd_type, cmd_args, False)
+
+
+def build_commands(command_count):
+    return [
+        (protocol.GEARMAN_COMMAND_SUBMIT_JOB_BG, {'task': b'resize', 'unique': b'%032x' % index, 'data': b'x' * 64})
+        for index in range(command_count)
+    ]
+
+
+def baseline_send_to_buffer(conn, commands):
+    conn._outgoing_commands.extend(commands)
+    conn.send_commands_to_buffer()
+    conn._outgoing_buffer = b''
+
+
+def pack_one_by_one(commands):
+    return b''.join(protocol.pack_binary_command(cmd_type, cmd_args) for cmd_type, cmd_args in commands)
+
+
+def pack_in_bulk(commands, trusted=False):
+    return protocol.pack_binary_commands(commands, trusted=trusted)
+
+
+def send_to_buffer(conn, commands):
+    conn._outgoing_commands.extend(commands)
+    conn.send_commands_to_buffer()
+    conn._outgoing_segments.clear()
+    conn._outgoing_size = 0
+
+
+def report(label, elapsed, baseline):
+    print('  %-50s %6.3fs (%4.1fx baseline)' % (label, elapsed, baseline / elapsed))
+
+
+def time_best(fxn, number=1):
+    return min(timeit.repeat(fxn, number=number, repeat=REPEAT))
+
+
+def main():
+    commands = build_commands(COMMAND_COUNT)
+    baseline_conn = BaselineConnection()
+    baseline_conn._outgoing_commands.extend(commands)
+    baseline_conn.send_commands_to_buffer()
+    assert baseline_conn._outgoing_buffer == pack_one_by_one(commands) == pack_in_bulk(commands)
+
+    one_by_one = GearmanConnection(host='localhost')
+    one_by_one.batch_pack_threshold = COMMAND_COUNT + 1
+    in_bulk = GearmanConnection(host='localhost')
+
+    print('Packing %d SUBMIT_JOB_BG commands' % COMMAND_COUNT)
+    baseline = time_best(lambda: baseline_send_to_buffer(baseline_conn, commands))
+    report('baseline send_commands_to_buffer()', baseline, baseline)
+    report('pack_binary_command() per command, joined', time_best(lambda: pack_one_by_one(commands)), baseline)
+    report('pack_binary_commands()', time_best(lambda: pack_in_bulk(commands)), baseline)
+    report('pack_binary_commands(trusted=True)', time_best(lambda: pack_in_bulk(commands, trusted=True)), baseline)
+    report('send_commands_to_buffer(), one by one', time_best(lambda: send_to_buffer(one_by_one, commands)), baseline)
+    report('send_commands_to_buffer(), in bulk', time_best(lambda: send_to_buffer(in_bulk, commands)), baseline)
+
+    for batch_size in (1, 2):
+        small_batch = build_commands(batch_size)
+        print('Sending %d batches of %d SUBMIT_JOB_BG command(s)' % (SMALL_BATCH_REPEATS, batch_size))
+        baseline = time_best(lambda: baseline_send_to_buffer(baseline_conn, small_batch), number=SMALL_BATCH_REPEATS)
+        report('baseline send_commands_to_buffer()', baseline, baseline)
+        report('send_commands_to_buffer(), one by one', time_best(lambda: send_to_buffer(one_by_one, small_batch), number=SMALL_BATCH_REPEATS), baseline)
+        report('send_commands_to_buffer(), in bulk', time_best(lambda: send_to_buffer(in_bulk, small_batch), number=SMALL_BATCH_REPEATS), baseline)
+
+
+if __name__ == '__main__':
+    main()
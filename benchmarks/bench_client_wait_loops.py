@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark GearmanClient waiting on large batches of foreground jobs
+
+Submits N foreground jobs with submit_multiple_jobs() and times how long the
+client takes to see every job accepted and completed, along with the CPU time
+spent in the client's own wait loops.  Runs against the in-process fake job
+server from the test suite, so no Gearman server is needed.  The server finishes
+COMPLETIONS_PER_TICK jobs every 10ms or so, so the client wakes up over and over
+while it waits, like it would with real workers.
+
+    python benchmarks/bench_client_wait_loops.py
+"""
+
+from __future__ import print_function
+
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import GearmanClient  # noqa: E402
+from tests._core_testing import FakeGearmanServer  # noqa: E402
+
+JOB_COUNTS = [10000, 50000, 100000]
+COMPLETIONS_PER_TICK = 1000
+
+
+def wait_loop_seconds(profile_stats):
+    """Time spent in the callbacks that poll_connections_until_stopped() runs after every wakeup
+
+    Leaves out sending the jobs, which wait_until_jobs_accepted() does from its callback
+    """
+    wait_loop_time = 0.0
+    for (_, _, function_name), function_stats in profile_stats.stats.items():
+        if function_name.startswith('continue_while'):
+            wait_loop_time += function_stats[3]
+
+    for (_, _, function_name), function_stats in profile_stats.stats.items():
+        if function_name != 'send_job_request':
+            continue
+
+        for (_, _, caller_name), caller_stats in function_stats[4].items():
+            if caller_name.startswith('continue_while') or caller_name == '_resend_lost_requests':
+                wait_loop_time -= caller_stats[3]
+
+    return wait_loop_time
+
+
+def main():
+    print('Seconds to submit N foreground jobs and wait for them all')
+    print('  %8s %10s %12s' % ('jobs', 'total', 'wait loops'))
+    for job_count in JOB_COUNTS:
+        server = FakeGearmanServer(completions_per_tick=COMPLETIONS_PER_TICK)
+        client = GearmanClient([server.address])
+        jobs = [{'task': 'reverse', 'data': b'row %d' % job_index} for job_index in range(job_count)]
+        try:
+            profiler = cProfile.Profile()
+            start_time = time.time()
+            profiler.enable()
+            completed_requests = client.submit_multiple_jobs(jobs)
+            profiler.disable()
+            elapsed = time.time() - start_time
+            assert all(current_request.complete for current_request in completed_requests)
+        finally:
+            client.shutdown()
+            server.stop()
+
+        print('  %8d %10.2f %12.2f' % (job_count, elapsed, wait_loop_seconds(pstats.Stats(profiler))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark many threads submitting jobs through one ConcurrentGearmanClient
+
+Compares one blocking GearmanClient per thread, which needs a thread and a
+socket per in-flight job, against every thread sharing a
+ConcurrentGearmanClient.  Runs against the in-process fake job server from
+the test suite, so no Gearman server is needed.
+
+    python benchmarks/bench_concurrent_client.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import GearmanClient  # noqa: E402
+from gearman.concurrent_client import ConcurrentGearmanClient  # noqa: E402
+from tests._core_testing import FakeGearmanServer  # noqa: E402
+
+THREAD_COUNT = 50
+JOBS_PER_THREAD = 200
+
+
+def run_threads(target):
+    threads = [threading.Thread(target=target) for _ in range(THREAD_COUNT)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start_time
+
+
+def blocking_clients(server):
+    def submit_jobs():
+        client = GearmanClient([server.address])
+        for _ in range(JOBS_PER_THREAD):
+            client.submit_job('reverse', b'hello')
+        client.shutdown()
+
+    return run_threads(submit_jobs)
+
+
+def shared_concurrent_client(server):
+    client = ConcurrentGearmanClient([server.address])
+
+    def submit_jobs():
+        futures = [client.submit_job('reverse', b'hello') for _ in range(JOBS_PER_THREAD)]
+        for future in futures:
+            future.result()
+
+    elapsed = run_threads(submit_jobs)
+    client.shutdown()
+    return elapsed
+
+
+def main():
+    job_count = THREAD_COUNT * JOBS_PER_THREAD
+    print('%d threads submitting %d jobs each' % (THREAD_COUNT, JOBS_PER_THREAD))
+    for label, run in (
+        ('GearmanClient per thread', blocking_clients),
+        ('shared ConcurrentGearmanClient', shared_concurrent_client),
+    ):
+        server = FakeGearmanServer()
+        try:
+            elapsed = run(server)
+        finally:
+            server.stop()
+        print('  %-32s %6.2fs (%6.0f jobs/s over %d socket(s))' % (label, elapsed, job_count / elapsed, server.connection_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark decoding and dispatching WORK_STATUS frames to a command handler
+
+Compares GearmanCommandHandler.fetch_commands(), which calls its recv_* callbacks
+with the received records, against passing each command through recv_command()
+with keyword arguments.
+
+    python benchmarks/bench_dispatch.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import protocol  # noqa: E402
+from gearman.command_handler import GearmanCommandHandler  # noqa: E402
+
+FRAME_COUNT = 100000
+REPEAT = 5
+
+
+class CountingCommandHandler(GearmanCommandHandler):
+    status_updates = 0
+
+    def recv_work_status(self, job_handle, numerator, denominator):
+        self.status_updates += 1
+        return True
+
+
+class QueuedConnectionManager(object):
+    def __init__(self, commands):
+        self.commands = iter(commands)
+
+    def read_command(self, command_handler):
+        return next(self.commands, None)
+
+
+def build_frames():
+    binary_payload = protocol.NULL_CHAR.join([b'H:lap:1', b'50', b'100'])
+    frame = protocol.COMMAND_HEADER_STRUCT.pack(protocol.MAGIC_RES_STRING, protocol.GEARMAN_COMMAND_WORK_STATUS, len(binary_payload)) + binary_payload
+    return frame * FRAME_COUNT
+
+
+def decode_frames(frames):
+    decoder = protocol.BinaryCommandDecoder(is_response=True)
+    frames_view = memoryview(frames)
+    offset = 0
+    commands = []
+    while offset < len(frames):
+        cmd_type, cmd_args, cmd_len = decoder.decode(frames_view[offset:])
+        commands.append((cmd_type, cmd_args))
+        offset += cmd_len
+    return commands
+
+
+def dispatch_records(commands):
+    command_handler = CountingCommandHandler(QueuedConnectionManager(commands))
+    command_handler.fetch_commands()
+    assert command_handler.status_updates == FRAME_COUNT
+
+
+def dispatch_keywords(commands):
+    command_handler = CountingCommandHandler()
+    for cmd_type, cmd_args in commands:
+        command_handler.recv_command(cmd_type, **cmd_args)
+    assert command_handler.status_updates == FRAME_COUNT
+
+
+def main():
+    frames = build_frames()
+    commands = decode_frames(frames)
+
+    print('Dispatching %d WORK_STATUS frames' % FRAME_COUNT)
+    for label, run in (
+        ('decode', lambda: decode_frames(frames)),
+        ('recv_command(cmd_type, **cmd_args)', lambda: dispatch_keywords(commands)),
+        ('fetch_commands()', lambda: dispatch_records(commands)),
+    ):
+        elapsed = min(timeit.repeat(run, number=1, repeat=REPEAT))
+        print('  %-40s %6.3f us per frame' % (label, elapsed / FRAME_COUNT * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark parsing a burst of small frames out of GearmanConnection's incoming buffer
+
+The time per megabyte should stay flat as the burst grows: parsing is linear
+in the size of the burst, not quadratic.
+
+    python benchmarks/bench_incoming_buffer.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import protocol  # noqa: E402
+from gearman.connection import GearmanConnection  # noqa: E402
+
+BURST_SIZES_IN_MB = [1, 2, 5, 10]
+READ_SIZE = 4096
+
+
+def build_burst(burst_size):
+    frame = protocol.pack_binary_command(
+        protocol.GEARMAN_COMMAND_WORK_COMPLETE,
+        {'job_handle': b'H:localhost:12345', 'data': b'x' * 16},
+        is_response=True
+    )
+    return frame * (burst_size // len(frame))
+
+
+class ChunkedSocket(object):
+    """Stands in for a socket, handing out at most chunk_size bytes per readiness event"""
+    def __init__(self, data, chunk_size):
+        self.data = memoryview(data)
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def recv_into(self, buffer, nbytes):
+        bytes_read = min(nbytes, self.chunk_size, len(self.data) - self.offset)
+        buffer[:bytes_read] = self.data[self.offset:self.offset + bytes_read]
+        self.offset += bytes_read
+        return bytes_read
+
+
+def parse_burst(burst, read_size):
+    conn = GearmanConnection(host='localhost')
+    conn.gearman_socket = ChunkedSocket(burst, read_size)
+    conn.connected = True
+    conn._is_client_side = True
+    conn._is_server_side = False
+    # Every read comes up short, so the connection goes back to the poller after every chunk
+    conn.min_read_size = conn.max_read_size = read_size + 1
+
+    received_commands = 0
+    start_time = time.time()
+    while conn.gearman_socket.offset < len(burst):
+        conn.read_data_from_socket()
+        received_commands += conn.read_commands_from_buffer()
+
+    return received_commands, time.time() - start_time
+
+
+def main():
+    for read_size in (READ_SIZE, None):
+        label = '%d byte reads' % read_size if read_size else 'a single read'
+        print('Parsing bursts delivered in %s' % label)
+        for burst_mb in BURST_SIZES_IN_MB:
+            burst = build_burst(burst_mb * 1024 * 1024)
+            received_commands, elapsed = parse_burst(burst, read_size or len(burst))
+            print('  %3d MB: %8d frames in %6.3fs (%.3fs per MB)' % (
+                burst_mb, received_commands, elapsed, elapsed / burst_mb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Benchmark the extra memory needed to send a large SUBMIT_JOB
+
+Packs and sends a job over a loopback TCP connection, and reports the peak
+memory allocated on top of the job data itself.  Outgoing payloads are queued
+by reference, so this should stay at a few kilobytes no matter the job size.
+
+    python benchmarks/bench_large_submit.py
+"""
+
+from __future__ import print_function
+
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+import gearman.util  # noqa: E402
+from gearman import protocol  # noqa: E402
+from gearman.connection import GearmanConnection  # noqa: E402
+
+PAYLOAD_SIZES_IN_MB = [1, 10, 100]
+
+
+def drain(server_socket, receive_buffer, expected_size):
+    received_size = 0
+    while received_size < expected_size:
+        received_size += server_socket.recv_into(receive_buffer)
+
+
+def send_job(job_data):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    conn = GearmanConnection(host='127.0.0.1', port=listener.getsockname()[1])
+    conn.connect()
+    server_socket, _ = listener.accept()
+    listener.close()
+
+    cmd_args = {'task': b'resize', 'unique': b'1', 'data': job_data}
+    expected_size = len(protocol.pack_binary_command_segments(protocol.GEARMAN_COMMAND_SUBMIT_JOB, dict(cmd_args))[0]) + len(job_data)
+    # Preallocated, so the receiving side doesn't show up in the traced allocations
+    receive_buffer = bytearray(1024 * 1024)
+    receiver = threading.Thread(target=drain, args=(server_socket, receive_buffer, expected_size))
+    receiver.start()
+
+    tracemalloc.start()
+    start_time = time.time()
+    conn.send_command(protocol.GEARMAN_COMMAND_SUBMIT_JOB, cmd_args)
+    conn.send_commands_to_buffer()
+    while conn.writable():
+        gearman.util.select([], [conn], [])
+        conn.send_data_to_socket()
+
+    elapsed = time.time() - start_time
+    _, peak_allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    receiver.join()
+    server_socket.close()
+    conn.close()
+    return peak_allocated, elapsed
+
+
+def main():
+    for payload_mb in PAYLOAD_SIZES_IN_MB:
+        job_data = b'x' * (payload_mb * 1024 * 1024)
+        peak_allocated, elapsed = send_job(job_data)
+        print('%3d MB SUBMIT_JOB: %9d bytes allocated at peak, sent in %6.3fs' % (
+            payload_mb, peak_allocated, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Benchmark packing SUBMIT_JOB commands
+
+    python benchmarks/bench_pack.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import protocol  # noqa: E402
+
+PACK_COUNT = 200000
+DATA_SIZES = [16, 4096, 1024 * 1024]
+
+
+def main():
+    for data_size in DATA_SIZES:
+        cmd_args = {'task': b'resize', 'unique': b'0123456789abcdef', 'data': b'x' * data_size}
+        print('SUBMIT_JOB with %d bytes of data' % data_size)
+        for label, pack_command in (
+            ('pack_binary_command', lambda: protocol.pack_binary_command(protocol.GEARMAN_COMMAND_SUBMIT_JOB, cmd_args)),
+            ('segments', lambda: protocol.pack_binary_command_segments(protocol.GEARMAN_COMMAND_SUBMIT_JOB, cmd_args)),
+            ('segments, trusted', lambda: protocol.pack_binary_command_segments(protocol.GEARMAN_COMMAND_SUBMIT_JOB, cmd_args, trusted=True)),
+        ):
+            elapsed = timeit.timeit(pack_command, number=PACK_COUNT)
+            print('  %-20s %6.3f us per command' % (label, elapsed / PACK_COUNT * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Benchmark the cost of one wakeup for each poller backend in gearman.io
+
+Registers 10, 100 and 1000 idle socket pairs, then repeatedly makes one of
+them readable and times the poll() that reports it, the way a worker waits
+for a NOOP on one of many connections.  Compare backends at your fan-out and
+set GearmanConnectionManager.poller_backend to the fastest one.
+
+    python benchmarks/bench_poller_wakeup.py
+"""
+
+from __future__ import print_function
+
+import os
+import socket
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+import gearman.io  # noqa: E402
+
+CONNECTION_COUNTS = [10, 100, 1000]
+WAKEUPS = 2000
+
+
+def measure_wakeups(backend, socket_pairs):
+    poller = gearman.io.get_connection_poller(backend)
+    try:
+        for local_socket, _ in socket_pairs:
+            poller.register(local_socket, gearman.io.READ)
+
+        state = {'next': 0}
+
+        def wakeup():
+            local_socket, remote_socket = socket_pairs[state['next'] % len(socket_pairs)]
+            state['next'] += 7
+            remote_socket.send(b'x')
+            events = poller.poll(1.0)
+            assert events, 'poll() timed out'
+            local_socket.recv(1)
+
+        return timeit.timeit(wakeup, number=WAKEUPS) / WAKEUPS
+    finally:
+        poller.close()
+
+
+def main():
+    backends = gearman.io.available_poller_backends()
+    print('Microseconds per wakeup, one readable connection out of N')
+    print('  %-12s %s' % ('backend', ''.join('%10d' % count for count in CONNECTION_COUNTS)))
+    results = dict((backend, []) for backend in backends)
+    for connection_count in CONNECTION_COUNTS:
+        socket_pairs = [socket.socketpair() for _ in range(connection_count)]
+        try:
+            for backend in backends:
+                try:
+                    results[backend].append('%10.1f' % (measure_wakeups(backend, socket_pairs) * 1e6))
+                except ValueError:
+                    # select() can't watch file descriptors at or above FD_SETSIZE
+                    results[backend].append('%10s' % 'n/a')
+        finally:
+            for local_socket, remote_socket in socket_pairs:
+                local_socket.close()
+                remote_socket.close()
+
+    for backend in backends:
+        print('  %-12s %s' % (backend, ''.join(results[backend])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Benchmark submit latency with one degraded server in the pool
+
+Submits SUBMIT_COUNT foreground jobs one after another to a pool of
+SERVER_COUNT in-process fake job servers, one of which takes SLOW_DELAY
+seconds to answer anything.  Compares picking a server at random, as
+GearmanClient does by default, with PowerOfTwoChoicesRouter.
+
+    python benchmarks/bench_server_selection.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import GearmanClient  # noqa: E402
+from gearman.routing import PowerOfTwoChoicesRouter  # noqa: E402
+from tests._core_testing import FakeGearmanServer  # noqa: E402
+
+SERVER_COUNT = 3
+SLOW_DELAY = 0.02
+SUBMIT_COUNT = 1000
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def time_submissions(router):
+    servers = [FakeGearmanServer() for _ in range(SERVER_COUNT - 1)] + [FakeGearmanServer(response_delay=SLOW_DELAY)]
+    client = GearmanClient([server.address for server in servers], router=router)
+    latencies = []
+    try:
+        for job_index in range(SUBMIT_COUNT):
+            start_time = time.time()
+            completed_request = client.submit_job('reverse', b'job %d' % job_index)
+            latencies.append(time.time() - start_time)
+            assert completed_request.complete
+
+        slow_jobs = servers[-1].submitted_jobs
+    finally:
+        client.shutdown()
+        for server in servers:
+            server.stop()
+
+    return sorted(latencies), slow_jobs
+
+
+def main():
+    print('Milliseconds per foreground job, with 1 of %d servers answering after %.0fms' % (SERVER_COUNT, SLOW_DELAY * 1000))
+    print('  %-24s %8s %8s %10s' % ('server selection', 'p50', 'p99', 'slow jobs'))
+    for label, router in [('random', None), ('power of two choices', PowerOfTwoChoicesRouter())]:
+        latencies, slow_jobs = time_submissions(router)
+        print('  %-24s %8.2f %8.2f %10d' % (label, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, slow_jobs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmark receiving a large JOB_ASSIGN over a loopback TCP connection
+
+Compares reads sized from the announced frame length against fixed 4 KB reads,
+counting recv_into() calls and poller wakeups for a single job.
+
+    python benchmarks/bench_socket_reads.py
+"""
+
+from __future__ import print_function
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+import gearman.util  # noqa: E402
+from gearman import protocol  # noqa: E402
+from gearman.connection import GearmanConnection  # noqa: E402
+
+PAYLOAD_SIZES_IN_MB = [1, 10, 50]
+
+
+class CountingSocket(object):
+    """Wraps a socket and counts calls to recv_into()"""
+    def __init__(self, wrapped_socket):
+        self.wrapped_socket = wrapped_socket
+        self.recv_calls = 0
+
+    def recv_into(self, buffer, nbytes):
+        self.recv_calls += 1
+        return self.wrapped_socket.recv_into(buffer, nbytes)
+
+    def fileno(self):
+        return self.wrapped_socket.fileno()
+
+    def close(self):
+        self.wrapped_socket.close()
+
+
+def receive_job(frame, bytes_to_read):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    conn = GearmanConnection(host='127.0.0.1', port=listener.getsockname()[1])
+    conn.connect()
+    server_socket, _ = listener.accept()
+    listener.close()
+
+    sender = threading.Thread(target=server_socket.sendall, args=(frame, ))
+    sender.start()
+
+    counting_socket = conn.gearman_socket = CountingSocket(conn.gearman_socket)
+    wakeups = 0
+    start_time = time.time()
+    while not conn.read_commands_from_buffer():
+        gearman.util.select([conn], [], [])
+        wakeups += 1
+        conn.read_data_from_socket(bytes_to_read)
+
+    elapsed = time.time() - start_time
+    sender.join()
+    server_socket.close()
+    conn.close()
+    return counting_socket, wakeups, elapsed
+
+
+def main():
+    for payload_mb in PAYLOAD_SIZES_IN_MB:
+        frame = protocol.pack_binary_command(
+            protocol.GEARMAN_COMMAND_JOB_ASSIGN,
+            {'job_handle': b'H:localhost:1', 'task': b'resize', 'data': b'x' * (payload_mb * 1024 * 1024)},
+            is_response=True
+        )
+        print('%d MB JOB_ASSIGN' % payload_mb)
+        for label, bytes_to_read in (('adaptive reads', None), ('4 KB reads', 4096)):
+            counting_socket, wakeups, elapsed = receive_job(frame, bytes_to_read)
+            print('  %-15s %7d recv_into() calls, %6d wakeups, %6.3fs' % (
+                label, counting_socket.recv_calls, wakeups, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark peak memory when submitting jobs from a generator
+
+Compares materializing every job for submit_multiple_jobs() against pulling
+them lazily with submit_stream(), measuring the peak memory traced while the
+jobs run.  Runs against the in-process fake job server from the test suite,
+so no Gearman server is needed.
+
+    python benchmarks/bench_submit_stream.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import GearmanClient  # noqa: E402
+from tests._core_testing import FakeGearmanServer  # noqa: E402
+
+JOB_COUNTS = [10000, 50000]
+WINDOW = 1000
+
+
+def generate_jobs(job_count):
+    for job_index in range(job_count):
+        yield {'task': 'reverse', 'data': b'row %d' % job_index}
+
+
+def submit_all_at_once(client, job_count):
+    completed_requests = client.submit_multiple_jobs(list(generate_jobs(job_count)))
+    return len(completed_requests)
+
+
+def submit_as_a_stream(client, job_count):
+    return sum(1 for _ in client.submit_stream(generate_jobs(job_count), window=WINDOW))
+
+
+def measure(submit, job_count):
+    server = FakeGearmanServer()
+    client = GearmanClient([server.address])
+    try:
+        tracemalloc.start()
+        start_time = time.time()
+        assert submit(client, job_count) == job_count
+        elapsed = time.time() - start_time
+        _, peak_size = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        client.shutdown()
+        server.stop()
+
+    return elapsed, peak_size
+
+
+def main():
+    print('Peak traced memory while submitting N jobs (window of %d for submit_stream)' % WINDOW)
+    for job_count in JOB_COUNTS:
+        for label, submit in (('submit_multiple_jobs', submit_all_at_once), ('submit_stream', submit_as_a_stream)):
+            elapsed, peak_size = measure(submit, job_count)
+            print('  %8d jobs  %-22s %8.1f MiB %7.2fs' % (job_count, label, peak_size / 1048576.0, elapsed))
+
+
+if __name__ == '__main__':
+    main()
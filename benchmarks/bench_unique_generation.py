@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Benchmark making up uniques for jobs submitted without one
+
+Times UNIQUE_COUNT uniques from each gearman.unique generator, against calling
+os.urandom() for every job as GearmanClient used to, and times building job
+requests for JOB_COUNT jobs with each of them.
+
+    python benchmarks/bench_unique_generation.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))  # noqa
+
+from gearman import GearmanClient, compat  # noqa: E402
+from gearman.unique import UniqueGenerator, ContentHashUniqueGenerator, CounterUniqueGenerator, RandomPoolUniqueGenerator  # noqa: E402
+
+UNIQUE_COUNT = 1000000
+JOB_COUNT = 200000
+
+
+class UrandomUniqueGenerator(UniqueGenerator):
+    """What GearmanClient did before: a getrandom() syscall for every job"""
+    def generate_unique(self, task, encoded_data):
+        return compat.to_hex(os.urandom(16))
+
+
+def time_call(call, *largs):
+    start_time = time.time()
+    call(*largs)
+    return time.time() - start_time
+
+
+def generate_uniques(unique_generator):
+    generate_unique = unique_generator.generate_unique
+    for _ in range(UNIQUE_COUNT):
+        generate_unique('task', b'some job data')
+
+
+def create_requests(unique_generator):
+    client = GearmanClient(['localhost:4730'], unique_generator=unique_generator)
+    for job_index in range(JOB_COUNT):
+        client._create_request_from_dictionary({'task': 'task', 'data': b'job %d' % job_index})
+
+
+def main():
+    print('  %-28s %16s %18s' % ('unique generator', 'ns per unique', 'ns per job request'))
+    for unique_generator in [UrandomUniqueGenerator(), RandomPoolUniqueGenerator(), CounterUniqueGenerator(), ContentHashUniqueGenerator()]:
+        unique_time = time_call(generate_uniques, unique_generator)
+        request_time = time_call(create_requests, unique_generator)
+        print('  %-28s %16.0f %18.0f' % (type(unique_generator).__name__, unique_time * 1e9 / UNIQUE_COUNT, request_time * 1e9 / JOB_COUNT))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import collections
 import logging
 
+from . import compat
 from gearman.command_handler import GearmanCommandHandler
 from gearman.errors import ProtocolError, InvalidAdminClientState
 from gearman.protocol import GEARMAN_COMMAND_ECHO_REQ, GEARMAN_COMMAND_TEXT_COMMAND, \
@@ -23,6 +24,12 @@ EXPECTED_GEARMAN_SERVER_COMMANDS = set([
     GEARMAN_SERVER_COMMAND_SHOW_UNIQUE_JOBS,
 ])
 
+# Every line of a multi-line response goes to the same callback, so we work out its name up front
+RECV_CALLBACK_FOR_SERVER_COMMAND = dict(
+    (server_command, 'recv_server_%s' % server_command.replace(' ', '_'))
+    for server_command in EXPECTED_GEARMAN_SERVER_COMMANDS
+)
+
 
 class GearmanAdminClientCommandHandler(GearmanCommandHandler):
     """Special GEARMAN_COMMAND_TEXT_COMMAND command handler that'll parse text responses from the server"""
@@ -90,13 +97,17 @@ class GearmanAdminClientCommandHandler(GearmanCommandHandler):
         if not self._sent_commands:
             raise InvalidAdminClientState('Received an unexpected server response')
 
+        # Lines arrive from the server as binary strings, but we parse them as text
+        if compat.PY3 and isinstance(raw_text, bytes):
+            raw_text = raw_text.decode('utf-8')
+
         # Peek at the first command
         cmd = self._sent_commands[0]
-        cmd_type = cmd.replace(" ", "_")
-        recv_server_command_function_name = 'recv_server_%s' % cmd_type
+        recv_server_command_function_name = RECV_CALLBACK_FOR_SERVER_COMMAND.get(cmd)
 
-        cmd_callback = getattr(self, recv_server_command_function_name)
+        cmd_callback = getattr(self, recv_server_command_function_name) if recv_server_command_function_name else None
         if not cmd_callback:
+            cmd_type = cmd.replace(" ", "_")
             gearman_logger.error('Could not handle command: %r - %r' % (cmd_type, raw_text))
             raise ValueError('Could not handle command: %r - %r' % (cmd_type, raw_text))
 
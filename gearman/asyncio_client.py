@@ -0,0 +1,326 @@
+# -*- encoding: utf-8
+
+import asyncio
+import collections
+import logging
+
+import gearman.util
+
+from gearman.asyncio_connection_manager import AsyncGearmanConnectionManager
+from gearman.client import GearmanClient, RANDOM_UNIQUE_BYTES
+from gearman.constants import PRIORITY_NONE, JOB_UNKNOWN, JOB_PENDING
+from gearman.errors import ConnectionError, ExceededConnectionAttempts, ServerUnavailable
+
+gearman_logger = logging.getLogger(__name__)
+
+
+class AsyncGearmanClient(AsyncGearmanConnectionManager, GearmanClient):
+    """
+    AsyncGearmanClient :: Interface to submit jobs to a Gearman server from an asyncio event loop
+
+    Works like GearmanClient, except that submitting jobs and fetching their statuses are coroutines.  Requests don't
+    tie up anything while they wait, so one event loop can have as many jobs outstanding as the servers will take.
+    """
+    def __init__(self, host_list=None, random_unique_bytes=RANDOM_UNIQUE_BYTES, router=None, unique_generator=None, task_unique_generators=None,
+                 result_cache=None, retry_policy=None, task_retry_policies=None):
+        super(AsyncGearmanClient, self).__init__(
+            host_list=host_list, random_unique_bytes=random_unique_bytes, router=router, unique_generator=unique_generator,
+            task_unique_generators=task_unique_generators, result_cache=result_cache, retry_policy=retry_policy,
+            task_retry_policies=task_retry_policies)
+
+        # Futures waiting on each request, along with whether they're waiting for it to complete or be accepted
+        self._request_waiters = collections.defaultdict(list)
+        # Futures waiting on a status update for each request, paired with None so they're kept like the ones above
+        self._status_waiters = collections.defaultdict(list)
+
+        # Requests we're connecting to send, so identical jobs submitted meanwhile don't send them again
+        self._requests_being_sent = set()
+
+    async def submit_job(self, task, data, unique=None, priority=PRIORITY_NONE, unique_generator=None, timeout=None, retry_policy=None, **kwargs):
+        """Submit a single job to any gearman server
+
+        With a timeout, we stop waiting on the job that many seconds after submitting it, however long poll_timeout is
+        """
+        job_info = {
+            "task": task,
+            "data": data,
+            "unique": unique,
+            "priority": priority,
+            "unique_generator": unique_generator,
+            "timeout": timeout,
+            "retry_policy": retry_policy,
+        }
+        completed_job_list = await self.submit_multiple_jobs(
+            jobs_to_submit=[job_info], **kwargs
+        )
+        return gearman.util.unlist(completed_job_list)
+
+    async def submit_multiple_jobs(self, jobs_to_submit, background=False, max_retries=0, **kwargs):
+        """
+        Takes a list of jobs as dicts with keys ["task", "data", "unique", "priority"],
+        creates a job for them, assign them connections, and request that they be done.
+
+        """
+        assert type(jobs_to_submit) in (list, tuple, set), "Expected multiple jobs, received 1?"
+
+        requests_to_submit = [
+            self._coalesce_request(self._create_request_from_dictionary(
+                job_info,
+                background=background,
+                max_retries=max_retries
+            )) for job_info in jobs_to_submit
+        ]
+
+        return await self.submit_multiple_requests(requests_to_submit, **kwargs)
+
+    async def submit_multiple_requests(self, job_requests, wait_until_complete=True, poll_timeout=None):
+        """Take GearmanJobRequests, assign them connections, and request that they be done.
+
+        * Waits until our jobs are accepted (should be fast) OR times out
+        * Optionally waits until jobs are all complete
+
+        You MUST check the status of your requests after calling this function as "timed_out" or "state == JOB_UNKNOWN" maybe True
+        """
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+        stopwatch = gearman.util.Stopwatch(poll_timeout)
+
+        # Start waiting before we send anything, as connecting hands control back to the event loop
+        request_waiters = self._wait_for_requests(job_requests, wait_until_complete)
+        try:
+            for current_request in job_requests:
+                # Requests shared with identical jobs only need sending once
+                if current_request.state == JOB_UNKNOWN and current_request not in self._requests_being_sent:
+                    await self._send_shared_request(current_request)
+        except (ExceededConnectionAttempts, ServerUnavailable) as exc:
+            self._forget_waiters(request_waiters)
+            self._fail_unsent_requests(job_requests, exc)
+            raise
+
+        await self._wait_until_resolved(request_waiters, stopwatch.get_time_remaining())
+        return self._mark_timed_out_requests(job_requests, wait_until_complete)
+
+    async def _send_shared_request(self, current_request):
+        self._requests_being_sent.add(current_request)
+        try:
+            await self._send_or_retry_later(current_request)
+        finally:
+            self._requests_being_sent.discard(current_request)
+
+    async def _send_or_retry_later(self, current_request):
+        try:
+            await self.send_job_request(current_request)
+        except ServerUnavailable:
+            if not self._schedule_retry(current_request):
+                raise
+
+    def _send_scheduled_retry(self, current_request):
+        current_request.state = JOB_UNKNOWN
+        asyncio.ensure_future(self._resend_job_request(current_request))
+
+    def _fail_unsent_requests(self, job_requests, exc):
+        """Fail everyone else waiting on requests we were due to send, now that we won't be sending them"""
+        for current_request in job_requests:
+            if current_request.state != JOB_UNKNOWN or current_request in self._requests_being_sent:
+                continue
+
+            self._forget_inflight_request(current_request)
+            for request_waiter, _ in self._request_waiters.pop(current_request, ()):
+                if not request_waiter.done():
+                    request_waiter.set_exception(exc)
+
+    async def wait_until_jobs_accepted(self, job_requests, poll_timeout=None):
+        """Wait until all our jobs have been accepted by the server"""
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+
+        # If our connection failed while we were waiting for a job to be accepted, automatically retry right here
+        for current_request in job_requests:
+            if current_request.state == JOB_UNKNOWN and current_request.job.handle is None and current_request not in self._requests_being_sent:
+                await self._send_shared_request(current_request)
+
+        await self._wait_until_resolved(self._wait_for_requests(job_requests, wait_until_complete=False), poll_timeout)
+        return self._mark_timed_out_requests(job_requests, wait_until_complete=False)
+
+    async def wait_until_jobs_completed(self, job_requests, poll_timeout=None):
+        """Wait until all our jobs have completed or failed"""
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+        await self._wait_until_resolved(self._wait_for_requests(job_requests, wait_until_complete=True), poll_timeout)
+        return self._mark_timed_out_requests(job_requests, wait_until_complete=True)
+
+    async def get_job_status(self, current_request, poll_timeout=None):
+        """Fetch the job status of a single request"""
+        request_list = await self.get_job_statuses([current_request], poll_timeout=poll_timeout)
+        return gearman.util.unlist(request_list)
+
+    async def get_job_statuses(self, job_requests, poll_timeout=None):
+        """Fetch the job status of a multiple requests"""
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+        for current_request in job_requests:
+            current_request.status['last_time_received'] = current_request.status.get('time_received')
+
+            current_connection = current_request.job.connection
+            current_command_handler = self.connection_to_handler_map[current_connection]
+
+            current_command_handler.send_get_status_of_job(current_request)
+
+        return await self.wait_until_job_statuses_received(job_requests, poll_timeout=poll_timeout)
+
+    async def wait_until_job_statuses_received(self, job_requests, poll_timeout=None):
+        """Wait until we received statuses on all our requests"""
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+
+        def is_status_not_updated(current_request):
+            current_status = current_request.status
+            return bool(current_status.get('time_received') == current_status.get('last_time_received'))
+
+        status_waiters = []
+        for current_request in job_requests:
+            if is_status_not_updated(current_request) and current_request.state != JOB_UNKNOWN:
+                status_waiter = asyncio.get_event_loop().create_future()
+                self._status_waiters[current_request].append((status_waiter, None))
+                status_waiters.append((current_request, status_waiter))
+
+        await self._wait_until_resolved(status_waiters, poll_timeout, self._status_waiters)
+
+        for current_request in job_requests:
+            current_request.status = current_request.status or {}
+            current_request.timed_out = is_status_not_updated(current_request)
+
+        return job_requests
+
+    async def establish_request_connection(self, current_request):
+        """Return a live connection for the given hash"""
+        failed_connections = 0
+        for possible_connection in self._request_connection_candidates(current_request):
+            if self.connection_available(possible_connection):
+                try:
+                    chosen_connection = await self.establish_connection(possible_connection)
+                except ConnectionError:
+                    pass
+                else:
+                    return self._on_request_connection_chosen(current_request, chosen_connection, failed_connections)
+
+            failed_connections += 1
+
+        raise ServerUnavailable('Found no valid connections: %r' % self.connection_list)
+
+    async def send_job_request(self, current_request):
+        """Attempt to send out a job request"""
+        self._check_connection_attempts(current_request)
+        chosen_connection = await self.establish_request_connection(current_request)
+        return self._send_job_request_over(current_request, chosen_connection)
+
+    ######################################################
+    ##### Waiting on requests from the event loop ########
+    ######################################################
+    def _is_request_resolved(self, current_request, wait_until_complete):
+        # Jobs we lose track of are as done as they'll ever be, just as they are for GearmanClient
+        if current_request.deadline_expired:
+            return True
+        elif current_request.state == JOB_UNKNOWN:
+            return current_request.job.handle is not None
+        elif wait_until_complete:
+            return current_request.complete
+        else:
+            return current_request.state != JOB_PENDING
+
+    def _wait_for_requests(self, job_requests, wait_until_complete):
+        """Returns a (request, future) pair for each request, with each future resolving once we're done waiting for it"""
+        request_waiters = []
+        for current_request in job_requests:
+            request_waiter = asyncio.get_event_loop().create_future()
+            if self._is_request_resolved(current_request, wait_until_complete):
+                request_waiter.set_result(current_request)
+            else:
+                self._request_waiters[current_request].append((request_waiter, wait_until_complete))
+
+            request_waiters.append((current_request, request_waiter))
+
+        return request_waiters
+
+    async def _wait_until_resolved(self, request_waiters, poll_timeout, all_waiters=None):
+        pending_waiters = [request_waiter for _, request_waiter in request_waiters if not request_waiter.done()]
+        if pending_waiters:
+            await asyncio.wait(pending_waiters, timeout=poll_timeout)
+
+        self._forget_waiters(request_waiters, all_waiters)
+        request_exceptions = [request_waiter.exception() for _, request_waiter in request_waiters if not request_waiter.cancelled()]
+        for request_exception in request_exceptions:
+            if request_exception is not None:
+                raise request_exception
+
+    def _forget_waiters(self, request_waiters, all_waiters=None):
+        """Stop waiting on any requests that timed out"""
+        if all_waiters is None:
+            all_waiters = self._request_waiters
+
+        for current_request, request_waiter in request_waiters:
+            if request_waiter.done():
+                continue
+
+            request_waiter.cancel()
+            remaining_waiters = [waiter_entry for waiter_entry in all_waiters.get(current_request, ()) if waiter_entry[0] is not request_waiter]
+            if remaining_waiters:
+                all_waiters[current_request] = remaining_waiters
+            else:
+                all_waiters.pop(current_request, None)
+
+    def _mark_timed_out_requests(self, job_requests, wait_until_complete):
+        for current_request in job_requests:
+            if wait_until_complete:
+                self._mark_timed_out(current_request, not current_request.complete)
+                if not current_request.timed_out:
+                    self.request_to_rotating_connection_queue.pop(current_request, None)
+            else:
+                self._mark_timed_out(current_request, bool(current_request.state == JOB_PENDING))
+
+        return job_requests
+
+    def on_request_updated(self, current_request):
+        """Called by our command handlers whenever a request changes state, or receives a status"""
+        super(AsyncGearmanClient, self).on_request_updated(current_request)
+
+        current_status = current_request.status
+        if current_request.state == JOB_UNKNOWN or current_status.get('time_received') != current_status.get('last_time_received'):
+            for status_waiter, _ in self._status_waiters.pop(current_request, ()):
+                if not status_waiter.done():
+                    status_waiter.set_result(current_request)
+
+        request_waiters = self._request_waiters.pop(current_request, None)
+        if not request_waiters:
+            return
+
+        # Resend jobs the server never accepted, but we've no idea how far a worker got with any others
+        if current_request.state == JOB_UNKNOWN and current_request.job.handle is None:
+            self._request_waiters[current_request] = request_waiters
+            asyncio.ensure_future(self._resend_job_request(current_request))
+            return
+
+        remaining_waiters = []
+        for request_waiter, wait_until_complete in request_waiters:
+            if request_waiter.done():
+                continue
+            elif self._is_request_resolved(current_request, wait_until_complete):
+                request_waiter.set_result(current_request)
+            else:
+                remaining_waiters.append((request_waiter, wait_until_complete))
+
+        if remaining_waiters:
+            self._request_waiters[current_request] = remaining_waiters
+
+    def _expire_request(self, current_request):
+        super(AsyncGearmanClient, self)._expire_request(current_request)
+        if not current_request.deadline_expired:
+            return
+
+        for request_waiter, _ in self._request_waiters.pop(current_request, ()):
+            if not request_waiter.done():
+                request_waiter.set_result(current_request)
+
+    async def _resend_job_request(self, current_request):
+        try:
+            await self._send_or_retry_later(current_request)
+        except (ExceededConnectionAttempts, ServerUnavailable) as exc:
+            self._forget_inflight_request(current_request)
+            for request_waiter, _ in self._request_waiters.pop(current_request, ()):
+                if not request_waiter.done():
+                    request_waiter.set_exception(exc)
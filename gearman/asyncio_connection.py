@@ -0,0 +1,122 @@
+# -*- encoding: utf-8
+
+import asyncio
+import collections
+import logging
+import ssl
+
+from gearman.connection import GearmanConnection
+
+gearman_logger = logging.getLogger(__name__)
+
+
+class _GearmanProtocol(asyncio.Protocol):
+    """Hands the events from one transport to its AsyncGearmanConnection
+
+    A connection that reconnects gets a new transport, so anything left over from the old one is dropped
+    """
+    def __init__(self, gearman_connection):
+        self.gearman_connection = gearman_connection
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.gearman_connection.connection_made(transport)
+
+    def data_received(self, data):
+        if self.gearman_connection.transport is self.transport:
+            self.gearman_connection.data_received(data)
+
+    def connection_lost(self, exc):
+        if self.gearman_connection.transport is self.transport:
+            self.gearman_connection.connection_lost(exc)
+
+
+class AsyncGearmanConnection(GearmanConnection):
+    """A GearmanConnection driven by an asyncio event loop instead of a poller
+
+    Keeps GearmanConnection's buffers and framing, but an asyncio.Protocol feeds it whatever the transport receives.
+    Commands sent while the loop is busy are packed and written together on its next iteration
+    """
+    def _reset_connection(self):
+        super(AsyncGearmanConnection, self)._reset_connection()
+        self.transport = None
+        self.connection_manager = None
+        self._flush_handle = None
+
+    async def connect(self, connection_manager):
+        """Connect to the server, and tell connection_manager about everything we receive. Raise ConnectionError if connection fails."""
+        if self.connected:
+            self.throw_exception(message='connection already established')
+
+        self._reset_connection()
+        self.connection_manager = connection_manager
+
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.create_connection(lambda: _GearmanProtocol(self), self.gearman_host, self.gearman_port, ssl=self._create_ssl_context())
+        except OSError as socket_exception:
+            self.throw_exception(exception=socket_exception)
+
+    def _create_ssl_context(self):
+        if not self.use_ssl:
+            return None
+
+        # Matches GearmanConnection: the server's certificate must be signed by ca_certs, whatever its hostname
+        ssl_context = ssl.create_default_context(cafile=self.ca_certs)
+        ssl_context.check_hostname = False
+        ssl_context.load_cert_chain(self.certfile, self.keyfile)
+        return ssl_context
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.connected = True
+        self._is_client_side = True
+        self._is_server_side = False
+
+    def data_received(self, data):
+        """Reads data from transport --> buffer --> command queue, then lets our connection manager know"""
+        data_size = len(data)
+        self._reserve_incoming_space(data_size)
+        self._incoming_buffer[self._incoming_end:self._incoming_end + data_size] = data
+        self._incoming_end += data_size
+
+        if self.read_commands_from_buffer():
+            self.connection_manager.handle_read(self)
+
+    def connection_lost(self, exc):
+        self.connected = False
+        if exc is not None:
+            gearman_logger.debug('<%s:%d> connection lost: %r', self.gearman_host, self.gearman_port, exc)
+
+        self.connection_manager.handle_error(self)
+
+    def send_command(self, cmd_type, cmd_args):
+        """Adds a single gearman command to the outgoing command queue, to be written on the loop's next iteration"""
+        super(AsyncGearmanConnection, self).send_command(cmd_type, cmd_args)
+        if self._flush_handle is None and self.connected:
+            self._flush_handle = asyncio.get_event_loop().call_soon(self.send_commands_to_transport)
+
+    def send_commands_to_transport(self):
+        """Packs commands -> buffer, and hands the buffer to our transport"""
+        self._flush_handle = None
+        if not self.connected:
+            return
+
+        self.send_commands_to_buffer()
+        self.transport.writelines(self._outgoing_segments)
+
+        # The transport holds onto anything it couldn't send yet, so these segments are never touched again
+        self._outgoing_segments = collections.deque()
+        self._outgoing_offset = 0
+        self._outgoing_size = 0
+
+    def close(self):
+        """Close our transport and reset all of our connection data"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+
+        if self.transport is not None:
+            self.transport.close()
+
+        self._reset_connection()
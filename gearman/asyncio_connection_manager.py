@@ -0,0 +1,105 @@
+# -*- encoding: utf-8
+
+import asyncio
+import logging
+import time
+
+from gearman.asyncio_connection import AsyncGearmanConnection
+from gearman.connection_manager import GearmanConnectionManager
+from gearman.errors import ConnectionError, InvalidClientState
+
+gearman_logger = logging.getLogger(__name__)
+
+
+class AsyncGearmanConnectionManager(GearmanConnectionManager):
+    """Base class for Gearman clients and workers that run on an asyncio event loop
+
+    Each connection is an AsyncGearmanConnection whose transport calls us back as commands arrive, so there's no
+    polling loop: command handlers are driven straight from the event loop, just as they would be by handle_read()
+    """
+    connection_class = AsyncGearmanConnection
+
+    def __init__(self, *largs, **kwargs):
+        super(AsyncGearmanConnectionManager, self).__init__(*largs, **kwargs)
+
+        # Connections we're in the middle of connecting, so concurrent callers wait on the same attempt
+        self._pending_connections = {}
+
+        # The event loop keeps our deadlines for us, as a timer for each item
+        self._deadline_timers = {}
+
+    def shutdown(self):
+        for pending_connection in list(self._pending_connections.values()):
+            pending_connection.cancel()
+
+        for deadline_timer in self._deadline_timers.values():
+            deadline_timer.cancel()
+        self._deadline_timers.clear()
+
+        super(AsyncGearmanConnectionManager, self).shutdown()
+
+    async def establish_connection(self, current_connection):
+        """Attempt to connect... if not previously connected, create a new CommandHandler to manage this connection's state
+        !NOTE! This function can throw a ConnectionError which deriving ConnectionManagers should catch
+        """
+        assert current_connection in self.connection_list, "Unknown connection - %r" % current_connection
+        if current_connection.connected:
+            return current_connection
+
+        pending_connection = self._pending_connections.get(current_connection)
+        if pending_connection is None:
+            pending_connection = asyncio.ensure_future(self._connect(current_connection))
+            pending_connection.add_done_callback(lambda _: self._pending_connections.pop(current_connection, None))
+            self._pending_connections[current_connection] = pending_connection
+
+        # Don't let one caller giving up cancel the attempt for everyone else
+        await asyncio.shield(pending_connection)
+        return current_connection
+
+    async def _connect(self, current_connection):
+        # !NOTE! May throw a ConnectionError
+        current_connection.circuit_breaker.record_attempt()
+        try:
+            await current_connection.connect(self)
+        except ConnectionError:
+            current_connection.circuit_breaker.record_failure()
+            raise
+
+        # Initiate a new command handler every time we start a new connection
+        current_handler = self.command_handler_class(connection_manager=self)
+
+        self.handler_to_connection_map[current_handler] = current_connection
+        self.connection_to_handler_map[current_connection] = current_handler
+
+        current_handler.initial_state(**self.handler_initial_state)
+
+    def add_deadline(self, item, deadline):
+        """Have the event loop call on_deadline_expired(item) once time.time() reaches deadline, replacing any deadline
+        item already has"""
+        self.cancel_deadline(item)
+        self._deadline_timers[item] = asyncio.get_event_loop().call_later(max(deadline - time.time(), 0.0), self._expire_deadline, item)
+
+    def cancel_deadline(self, item):
+        deadline_timer = self._deadline_timers.pop(item, None)
+        if deadline_timer is not None:
+            deadline_timer.cancel()
+
+    def _expire_deadline(self, item):
+        del self._deadline_timers[item]
+        self.on_deadline_expired(item)
+
+    def handle_read(self, current_connection):
+        """Called by our connections once they've received commands"""
+        if current_connection.circuit_breaker.consecutive_failures:
+            current_connection.circuit_breaker.record_success()
+
+        current_handler = self.connection_to_handler_map.get(current_connection)
+        if current_handler is not None:
+            current_handler.fetch_commands()
+
+    def handle_write(self, current_connection):
+        """Connections write to their transports by themselves"""
+        current_connection.send_commands_to_transport()
+
+    def poll_connections_until_stopped(self, submitted_connections, callback_fxn, timeout=None):
+        raise InvalidClientState('%s is driven by an asyncio event loop and never polls its connections - use the asyncio API' % type(self).__name__)
@@ -0,0 +1,175 @@
+# -*- encoding: utf-8
+
+import asyncio
+import inspect
+import logging
+import random
+import sys
+
+from gearman.asyncio_connection_manager import AsyncGearmanConnectionManager
+from gearman.errors import ConnectionError, ServerUnavailable
+from gearman.worker import GearmanWorker, POLL_TIMEOUT_IN_SECONDS
+
+gearman_logger = logging.getLogger(__name__)
+
+
+class AsyncGearmanWorker(AsyncGearmanConnectionManager, GearmanWorker):
+    """
+    AsyncGearmanWorker :: Interface to accept jobs from a Gearman server on an asyncio event loop
+
+    Task callbacks are coroutine functions, called with the worker and the job just like GearmanWorker's callbacks.
+    Each job runs in its own asyncio task, so the worker keeps serving its connections while jobs are waiting.
+    """
+    # Most jobs we'll run at once.  We only grab another job once one of these has finished
+    max_concurrent_jobs = 1
+
+    def __init__(self, host_list=None, reconnect_backoff=None):
+        super(AsyncGearmanWorker, self).__init__(host_list=host_list, reconnect_backoff=reconnect_backoff)
+
+        # We hold onto our job tasks so they aren't garbage collected while they run
+        self._job_tasks = set()
+        self._running_job_count = 0
+        self._continue_working = False
+        self._work_wakeup = None
+        self._reconnect_tasks = set()
+
+    ########################################################
+    ##### Public methods for general GearmanWorker use #####
+    ########################################################
+    async def work(self, poll_timeout=POLL_TIMEOUT_IN_SECONDS):
+        """Complete tasks from all connections until after_job() returns False, or the task running this is cancelled
+
+        Reconnects to any servers we've lost in the background, once their backoff delays are up
+        """
+        self._continue_working = True
+        self._work_wakeup = asyncio.Event()
+        try:
+            if not await self.establish_worker_connections():
+                raise ServerUnavailable('Found no valid connections in list: %r' % self.connection_list)
+
+            while self._continue_working:
+                self._work_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._work_wakeup.wait(), poll_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+                if self._continue_working:
+                    await self.establish_worker_connections()
+        finally:
+            self._work_wakeup = None
+            self._cancel_reconnects()
+
+            # If we were kicked out of the worker loop, we should shutdown all our connections
+            for current_connection in self.randomized_connections:
+                current_connection.close()
+
+    async def establish_worker_connections(self):
+        """Return a shuffled list of connections that are alive.  Tries connecting to any others, unless they're already
+        waiting to be reconnected, and schedules a reconnect for each one that fails."""
+        self.randomized_connections = list(self.connection_list)
+        random.shuffle(self.randomized_connections)
+
+        output_connections = []
+        for current_connection in self.randomized_connections:
+            if not current_connection.connected and current_connection not in self._reconnecting_connections:
+                await self._connect_or_schedule_reconnect(current_connection)
+
+            if current_connection.connected:
+                output_connections.append(current_connection)
+
+        return output_connections
+
+    async def _connect_or_schedule_reconnect(self, current_connection):
+        # Leave servers with open circuit breakers alone until their reconnects are due
+        if self.connection_available(current_connection):
+            try:
+                await self.establish_connection(current_connection)
+                return
+            except ConnectionError:
+                pass
+
+        self._schedule_reconnect(current_connection)
+
+    def _cancel_reconnects(self):
+        super(AsyncGearmanWorker, self)._cancel_reconnects()
+
+        for reconnect_task in self._reconnect_tasks:
+            reconnect_task.cancel()
+
+    def on_deadline_expired(self, current_connection):
+        """Called by the event loop once it's time to reconnect to a server we've lost"""
+        self._reconnecting_connections.discard(current_connection)
+        if current_connection.connected:
+            return
+
+        reconnect_task = asyncio.ensure_future(self._reconnect(current_connection))
+        self._reconnect_tasks.add(reconnect_task)
+        reconnect_task.add_done_callback(self._reconnect_tasks.discard)
+
+    async def _reconnect(self, current_connection):
+        try:
+            await self.establish_connection(current_connection)
+        except ConnectionError:
+            self._schedule_reconnect(current_connection)
+
+    def wait_until_updates_sent(self, multiple_gearman_jobs, poll_timeout=None):
+        """Our connections write out updates on the event loop's next iteration, so there's nothing to wait for"""
+        pass
+
+    #####################################################
+    ##### Callback methods for GearmanWorkerHandler #####
+    #####################################################
+    def on_job_execute(self, current_job):
+        """Run the job in a task of its own, so our command handler can carry on straight away"""
+        self._running_job_count += 1
+        job_task = asyncio.ensure_future(self._execute_job(current_job))
+        self._job_tasks.add(job_task)
+        job_task.add_done_callback(self._job_tasks.discard)
+        return True
+
+    async def _execute_job(self, current_job):
+        try:
+            try:
+                function_callback = self.worker_abilities[current_job.task]
+                job_result = function_callback(self, current_job)
+                if inspect.isawaitable(job_result):
+                    job_result = await job_result
+            except Exception:
+                self.on_job_exception(current_job, sys.exc_info())
+            else:
+                self.on_job_complete(current_job, job_result)
+        except KeyError:
+            # The connection went away while we were working, taking the server's interest in this job with it
+            gearman_logger.warning('Lost the connection for %r before we could send its result', current_job)
+        finally:
+            self._running_job_count -= 1
+
+        if not self.after_job():
+            self._stop_working()
+        elif self._continue_working:
+            self._grab_next_job()
+
+    def _stop_working(self):
+        self._continue_working = False
+        if self._work_wakeup is not None:
+            self._work_wakeup.set()
+
+    def _grab_next_job(self):
+        """Ask for another job now that we have room for one
+
+        Our command handlers turn down NOOPs while we're running as many jobs as we can, so one of them needs waking up
+        """
+        for current_connection, current_handler in list(self.connection_to_handler_map.items()):
+            if self.has_job_lock():
+                break
+
+            if current_connection.connected:
+                current_handler.recv_noop()
+
+    def set_job_lock(self, command_handler, lock):
+        """Only let a command handler grab a job while we have room to run it"""
+        if lock and self._running_job_count >= self.max_concurrent_jobs:
+            return False
+
+        return super(AsyncGearmanWorker, self).set_job_lock(command_handler, lock)
@@ -0,0 +1,46 @@
+# -*- encoding: utf-8
+
+import time
+
+from gearman.constants import CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+
+
+class CircuitBreaker(object):
+    """Stops us trying a server after failure_threshold failures in a row, bar one probe every probe_interval seconds"""
+    def __init__(self, failure_threshold=3, probe_interval=1.0):
+        assert failure_threshold >= 1, "Expected a threshold of at least 1 failure"
+        assert probe_interval > 0.0, "Expected a positive probe interval"
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.next_probe_time = 0.0
+
+    def __repr__(self):
+        return '<%s state=%s consecutive_failures=%d>' % (type(self).__name__, self.state, self.consecutive_failures)
+
+    def allows_attempt(self, current_time=None):
+        """Whether we should try connecting to the server right now"""
+        if self.state == CIRCUIT_CLOSED:
+            return True
+
+        return (current_time or time.time()) >= self.next_probe_time
+
+    def record_attempt(self, current_time=None):
+        """Called before we try connecting"""
+        if self.state != CIRCUIT_CLOSED:
+            self.state = CIRCUIT_HALF_OPEN
+            self.next_probe_time = (current_time or time.time()) + self.probe_interval
+
+    def record_success(self):
+        """Called once the server has answered us"""
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self, current_time=None):
+        """Called when we can't connect to the server, or lose our connection to it"""
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = CIRCUIT_OPEN
+            self.next_probe_time = (current_time or time.time()) + self.probe_interval
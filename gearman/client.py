@@ -1,25 +1,74 @@
 # -*- encoding: utf-8
 
 import collections
+import itertools
 import logging
-import os
 import random
+import time
 import weakref
 
 import gearman.util
 
-from . import compat
 from gearman.connection_manager import GearmanConnectionManager
 from gearman.client_handler import GearmanClientCommandHandler
-from gearman.constants import PRIORITY_NONE, JOB_UNKNOWN, JOB_PENDING
+from gearman.constants import PRIORITY_NONE, JOB_UNKNOWN, JOB_PENDING, JOB_CREATED, JOB_FAILED, JOB_COMPLETE
 from gearman.errors import ConnectionError, ExceededConnectionAttempts, ServerUnavailable
 from gearman.job import GearmanJobRequest
+from gearman.unique import RandomPoolUniqueGenerator, is_data_unique
 
 gearman_logger = logging.getLogger(__name__)
 
-# This number must be <= GEARMAN_UNIQUE_SIZE in gearman/libgearman/constants.h
+# Random uniques are hex-encoded, so twice this number must fit within GEARMAN_UNIQUE_SIZE in gearman/constants.py
 RANDOM_UNIQUE_BYTES = 16
 
+# Most requests submit_stream() keeps outstanding by default
+STREAM_WINDOW = 100
+
+
+class _RequestTracker(object):
+    """Keeps track of which requests in a batch we're still waiting on, as our command handlers update them
+
+    Saves our wait loops from checking every request in the batch each time they wake up.  Requests whose deadlines
+    have passed are finished with, whatever state they're in
+    """
+    def __init__(self, job_requests, is_request_done, is_request_lost=None):
+        self.is_request_done = is_request_done
+        self.is_request_lost = is_request_lost
+
+        self.remaining_requests = set()
+        self.finished_requests = collections.deque()
+        self.lost_requests = collections.deque()
+
+        for current_request in job_requests:
+            self.add(current_request)
+
+    def add(self, current_request):
+        if current_request.deadline_expired or self.is_request_done(current_request):
+            self.finished_requests.append(current_request)
+            return
+
+        self.remaining_requests.add(current_request)
+        if self.is_request_lost is not None and self.is_request_lost(current_request):
+            self.lost_requests.append(current_request)
+
+    def update(self, current_request):
+        if current_request not in self.remaining_requests:
+            return
+
+        if current_request.deadline_expired or self.is_request_done(current_request):
+            self.remaining_requests.discard(current_request)
+            self.finished_requests.append(current_request)
+        elif self.is_request_lost is not None and self.is_request_lost(current_request):
+            self.lost_requests.append(current_request)
+
+
+class _ScheduledRetry(object):
+    """Stands in for a request in our deadline heap, until it's time to resend it"""
+    __slots__ = ('request', )
+
+    def __init__(self, current_request):
+        self.request = current_request
+
 
 class GearmanClient(GearmanConnectionManager):
     """
@@ -27,23 +76,62 @@ class GearmanClient(GearmanConnectionManager):
     """
     command_handler_class = GearmanClientCommandHandler
 
-    def __init__(self, host_list=None, random_unique_bytes=RANDOM_UNIQUE_BYTES):
+    # Whether foreground jobs submitted while an identical one (same task and unique) is in flight share its request
+    coalesce_requests = True
+
+    def __init__(self, host_list=None, random_unique_bytes=RANDOM_UNIQUE_BYTES, router=None, unique_generator=None, task_unique_generators=None,
+                 result_cache=None, retry_policy=None, task_retry_policies=None):
         super(GearmanClient, self).__init__(host_list=host_list)
 
         self.random_unique_bytes = random_unique_bytes
 
+        # A gearman.unique.UniqueGenerator for jobs submitted without a unique, or None for random ones
+        self.unique_generator = unique_generator or RandomPoolUniqueGenerator(random_unique_bytes)
+        # UniqueGenerators to use instead for particular tasks, by task name
+        self.task_unique_generators = dict(task_unique_generators or {})
+
+        # A gearman.result_cache.ResultCache to answer foreground jobs from, or None to send every job to the servers
+        self.result_cache = result_cache
+
+        # A gearman.routing.ConnectionRouter to pick connections for our requests, or None to pick them at random
+        self.router = router
+
+        # A gearman.retry.RetryPolicy for requests that go wrong, or None to resend lost requests straight away
+        self.retry_policy = retry_policy
+        # RetryPolicies to use instead for particular tasks, by task name
+        self.task_retry_policies = dict(task_retry_policies or {})
+
         # The authoritative copy of all requests that this client knows about
         # Ignores the fact if a request has been bound to a connection or not
         self.request_to_rotating_connection_queue = weakref.WeakKeyDictionary(
             collections.defaultdict(collections.deque))
 
-    def submit_job(self, task, data, unique=None, priority=PRIORITY_NONE, **kwargs):
-        """Submit a single job to any gearman server"""
+        # Every batch of requests our wait loops are waiting on right now
+        self._request_trackers = []
+
+        # Requests our connections haven't finished with, along with when they were sent if they're awaiting a handle
+        self._outstanding_requests = {}
+
+        # Foreground requests we've yet to see complete, by (task, unique), for identical jobs to share
+        self._inflight_requests_by_key = weakref.WeakValueDictionary()
+
+        # Requests waiting out their retry delays, along with the connections we'd rather they didn't go back to
+        self._request_to_scheduled_retry = {}
+        self._request_to_avoided_connection = weakref.WeakKeyDictionary()
+
+    def submit_job(self, task, data, unique=None, priority=PRIORITY_NONE, unique_generator=None, timeout=None, retry_policy=None, **kwargs):
+        """Submit a single job to any gearman server
+
+        With a timeout, we stop waiting on the job that many seconds after submitting it, however long poll_timeout is
+        """
         job_info = {
             "task": task,
             "data": data,
             "unique": unique,
             "priority": priority,
+            "unique_generator": unique_generator,
+            "timeout": timeout,
+            "retry_policy": retry_policy,
         }
         completed_job_list = self.submit_multiple_jobs(
             jobs_to_submit=[job_info], **kwargs
@@ -55,16 +143,20 @@ class GearmanClient(GearmanConnectionManager):
         Takes a list of jobs as dicts with keys ["task", "data", "unique", "priority"],
         creates a job for them, assign them connections, and request that they be done.
 
+        Jobs can each have a "timeout" in seconds, after which we stop waiting on them and mark them "timed_out", so
+        a batch doesn't wait on its slowest job for any longer than that job's own timeout.  They can each have a
+        "retry_policy" too, in place of the one for their task or the client's own.
+
         """
         assert type(jobs_to_submit) in (list, tuple, set), "Expected multiple jobs, received 1?"
 
-        # Convert all job dicts to job request objects
+        # Convert all job dicts to job request objects, sharing any that are already in flight
         requests_to_submit = [
-            self._create_request_from_dictionary(
+            self._coalesce_request(self._create_request_from_dictionary(
                 job_info,
                 background=background,
                 max_retries=max_retries
-            ) for job_info in jobs_to_submit
+            )) for job_info in jobs_to_submit
         ]
 
         return self.submit_multiple_requests(requests_to_submit, **kwargs)
@@ -74,6 +166,7 @@ class GearmanClient(GearmanConnectionManager):
 
         * Blocks until our jobs are accepted (should be fast) OR times out
         * Optionally blocks until jobs are all complete
+        * Stops waiting on each request once its deadline passes, if it has one
 
         You MUST check the status of your requests after calling this function as "timed_out" or "state == JOB_UNKNOWN" maybe True
         """
@@ -91,6 +184,60 @@ class GearmanClient(GearmanConnectionManager):
 
         return processed_requests
 
+    def submit_stream(self, jobs_to_submit, window=STREAM_WINDOW, background=False, max_retries=0, poll_timeout=None):
+        """
+        Takes an iterable of jobs as dicts with keys ["task", "data", "unique", "priority"], and yields their
+        GearmanJobRequests as they complete.
+
+        Jobs are pulled from the iterable lazily, with at most `window` of them outstanding at once, so memory use
+        doesn't grow with the length of the iterable.  If none of the outstanding jobs complete within poll_timeout,
+        they're all yielded with "timed_out" set to make room for more.
+
+        You MUST check the status of the yielded requests as "timed_out" or "state == JOB_UNKNOWN" maybe True
+        """
+        assert window > 0, "Expected a window of at least 1 request"
+        job_iterator = iter(jobs_to_submit)
+
+        # Jobs we lose track of after they're accepted are as done as they'll ever be, but we resend any others
+        request_tracker = _RequestTracker(
+            [],
+            is_request_done=lambda current_request: current_request.complete or bool(current_request.state == JOB_UNKNOWN and current_request.job.handle is not None),
+            is_request_lost=lambda current_request: bool(current_request.state == JOB_UNKNOWN and current_request.job.handle is None)
+        )
+
+        # Stop polling as soon as any job is done
+        def continue_while_none_done(any_activity):
+            self._resend_lost_requests(request_tracker)
+            return not request_tracker.finished_requests
+
+        self._request_trackers.append(request_tracker)
+        try:
+            while True:
+                for job_info in itertools.islice(job_iterator, window - len(request_tracker.remaining_requests)):
+                    current_request = self._create_request_from_dictionary(job_info, background=background, max_retries=max_retries)
+                    if not current_request.complete:
+                        self.send_job_request(current_request)
+                    request_tracker.add(current_request)
+
+                if not (request_tracker.remaining_requests or request_tracker.finished_requests):
+                    break
+
+                self.poll_connections_until_stopped(self.connection_list, continue_while_none_done, timeout=poll_timeout)
+
+                if request_tracker.finished_requests:
+                    done_requests = request_tracker.finished_requests
+                    request_tracker.finished_requests = collections.deque()
+                else:
+                    done_requests = request_tracker.remaining_requests
+                    request_tracker.remaining_requests = set()
+
+                for current_request in done_requests:
+                    self._mark_timed_out(current_request, not request_tracker.is_request_done(current_request))
+                    self.request_to_rotating_connection_queue.pop(current_request, None)
+                    yield current_request
+        finally:
+            self._request_trackers.remove(request_tracker)
+
     def wait_until_jobs_accepted(self, job_requests, poll_timeout=None):
         """Go into a select loop until all our jobs have moved to STATE_PENDING"""
         assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
@@ -100,18 +247,21 @@ class GearmanClient(GearmanConnectionManager):
 
         # Poll until we know we've gotten acknowledgement that our job's been accepted
         # If our connection fails while we're waiting for it to be accepted, automatically retry right here
-        def continue_while_jobs_pending(any_activity):
-            for current_request in job_requests:
-                if current_request.state == JOB_UNKNOWN:
-                    self.send_job_request(current_request)
+        request_tracker = _RequestTracker(
+            job_requests,
+            is_request_done=lambda current_request: current_request.state not in (JOB_PENDING, JOB_UNKNOWN),
+            is_request_lost=lambda current_request: bool(current_request.state == JOB_UNKNOWN)
+        )
 
-            return any(is_request_pending(current_request) for current_request in job_requests)
+        def continue_while_jobs_pending(any_activity):
+            self._resend_lost_requests(request_tracker)
+            return bool(request_tracker.remaining_requests)
 
-        self.poll_connections_until_stopped(self.connection_list, continue_while_jobs_pending, timeout=poll_timeout)
+        self._poll_tracked_requests(request_tracker, continue_while_jobs_pending, timeout=poll_timeout)
 
         # Mark any job still in the queued state to poll_timeout
         for current_request in job_requests:
-            current_request.timed_out = is_request_pending(current_request)
+            self._mark_timed_out(current_request, is_request_pending(current_request))
 
         return job_requests
 
@@ -124,24 +274,66 @@ class GearmanClient(GearmanConnectionManager):
 
         # Poll until we get responses for all our functions
         # Do NOT attempt to auto-retry connection failures as we have no idea how for a worker got
-        def continue_while_jobs_incomplete(any_activity):
-            for current_request in job_requests:
-                if is_request_incomplete(current_request) and current_request.state != JOB_UNKNOWN:
-                    return True
+        request_tracker = _RequestTracker(
+            job_requests,
+            is_request_done=lambda current_request: current_request.complete or current_request.state == JOB_UNKNOWN
+        )
 
-            return False
+        def continue_while_jobs_incomplete(any_activity):
+            return bool(request_tracker.remaining_requests)
 
-        self.poll_connections_until_stopped(self.connection_list, continue_while_jobs_incomplete, timeout=poll_timeout)
+        self._poll_tracked_requests(request_tracker, continue_while_jobs_incomplete, timeout=poll_timeout)
 
         # Mark any job still in the queued state to poll_timeout
         for current_request in job_requests:
-            current_request.timed_out = is_request_incomplete(current_request)
+            self._mark_timed_out(current_request, is_request_incomplete(current_request))
 
             if not current_request.timed_out:
                 self.request_to_rotating_connection_queue.pop(current_request, None)
 
         return job_requests
 
+    def iter_completed(self, job_requests, timeout=None):
+        """Yield each request as soon as its job completes, fails or raises an exception
+
+        Requests we lose track of are yielded in state JOB_UNKNOWN, and requests whose deadlines pass are yielded with
+        "timed_out" set as soon as they do.  Any still running after timeout seconds are yielded last with "timed_out" set
+        """
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+        stopwatch = gearman.util.Stopwatch(timeout)
+
+        request_tracker = _RequestTracker(
+            job_requests,
+            is_request_done=lambda current_request: current_request.complete or current_request.exception is not None or current_request.state == JOB_UNKNOWN
+        )
+
+        # Stop polling as soon as any job is finished, so it can be handed over straight away
+        def continue_while_none_finished(any_activity):
+            return not request_tracker.finished_requests
+
+        self._request_trackers.append(request_tracker)
+        try:
+            while request_tracker.finished_requests or request_tracker.remaining_requests:
+                if not request_tracker.finished_requests:
+                    time_remaining = stopwatch.get_time_remaining()
+                    if time_remaining == 0.0:
+                        break
+
+                    self.poll_connections_until_stopped(self.connection_list, continue_while_none_finished, timeout=time_remaining)
+                    continue
+
+                current_request = request_tracker.finished_requests.popleft()
+                self._mark_timed_out(current_request, not request_tracker.is_request_done(current_request))
+                self.request_to_rotating_connection_queue.pop(current_request, None)
+                yield current_request
+        finally:
+            self._request_trackers.remove(request_tracker)
+
+        for current_request in job_requests:
+            if current_request in request_tracker.remaining_requests:
+                self._mark_timed_out(current_request, True)
+                yield current_request
+
     def get_job_status(self, current_request, poll_timeout=None):
         """Fetch the job status of a single request"""
         request_list = self.get_job_statuses([current_request], poll_timeout=poll_timeout)
@@ -168,15 +360,16 @@ class GearmanClient(GearmanConnectionManager):
             current_status = current_request.status
             return bool(current_status.get('time_received') == current_status.get('last_time_received'))
 
+        request_tracker = _RequestTracker(
+            job_requests,
+            is_request_done=lambda current_request: not is_status_not_updated(current_request) or current_request.state == JOB_UNKNOWN
+        )
+
         # Poll to make sure we send out our request for a status update
         def continue_while_status_not_updated(any_activity):
-            for current_request in job_requests:
-                if is_status_not_updated(current_request) and current_request.state != JOB_UNKNOWN:
-                    return True
-
-            return False
+            return bool(request_tracker.remaining_requests)
 
-        self.poll_connections_until_stopped(self.connection_list, continue_while_status_not_updated, timeout=poll_timeout)
+        self._poll_tracked_requests(request_tracker, continue_while_status_not_updated, timeout=poll_timeout)
 
         for current_request in job_requests:
             current_request.status = current_request.status or {}
@@ -189,26 +382,72 @@ class GearmanClient(GearmanConnectionManager):
         Takes a dictionary with fields ["task", "unique", "data", "priority"] and
         returns the corresponding ``GearmanJobRequest``.
 
+        Jobs without a unique get one from the dictionary's "unique_generator", falling back on the one for their task
+        and then the client's own.
         """
+        use_result_cache = bool(self.result_cache is not None and not background and self.result_cache.caches_task(job_info['task']))
+
         # Make sure we have a unique identifier for ALL our tasks
+        encoded_data = None
         job_unique = job_info.get('unique')
         if not job_unique:
-            job_unique = compat.to_hex(os.urandom(self.random_unique_bytes))
+            unique_generator = job_info.get('unique_generator') or self.task_unique_generators.get(job_info['task']) or self.unique_generator
+            if unique_generator.uses_data or use_result_cache:
+                encoded_data = self.data_encoder.encode(job_info['data'])
+            job_unique = unique_generator.generate_unique(job_info['task'], encoded_data)
 
         current_job = self.job_class(connection=None, handle=None, task=job_info['task'], unique=job_unique, data=job_info['data'])
 
         initial_priority = job_info.get('priority', PRIORITY_NONE)
 
+        job_timeout = job_info.get('timeout')
+        deadline = None if job_timeout is None else time.time() + job_timeout
+
         max_attempts = max_retries + 1
-        return GearmanJobRequest(
+        current_request = GearmanJobRequest(
             current_job,
             initial_priority=initial_priority,
             background=background,
-            max_attempts=max_attempts
+            max_attempts=max_attempts,
+            deadline=deadline,
+            retry_policy=job_info.get('retry_policy')
         )
 
+        # Requests we find in our cache are complete before they're even submitted
+        if use_result_cache:
+            unique_given = bool(job_info.get('unique')) and not is_data_unique(job_info['unique'])
+            if not unique_given and encoded_data is None:
+                encoded_data = self.data_encoder.encode(job_info['data'])
+
+            encoded_result = self.result_cache.lookup(current_request, encoded_data, unique_given=unique_given)
+            if encoded_result is not None:
+                current_request.result = self.data_encoder.decode(encoded_result)
+                current_request.state = JOB_COMPLETE
+
+        return current_request
+
     def establish_request_connection(self, current_request):
         """Return a live connection for the given hash"""
+        failed_connections = 0
+        for possible_connection in self._request_connection_candidates(current_request):
+            # Servers with open circuit breakers count as broken, without our having to try them
+            if self.connection_available(possible_connection):
+                try:
+                    chosen_connection = self.establish_connection(possible_connection)
+                except ConnectionError:
+                    pass
+                else:
+                    return self._on_request_connection_chosen(current_request, chosen_connection, failed_connections)
+
+            failed_connections += 1
+
+        raise ServerUnavailable('Found no valid connections: %r' % self.connection_list)
+
+    def _request_connection_candidates(self, current_request):
+        """The connections to try sending a request to, in the order we should try them"""
+        if self.router is not None:
+            return self._route_request(current_request)
+
         # We'll keep track of the connections we're attempting to use so if we ever have to retry, we can use this history
         rotating_connections = self.request_to_rotating_connection_queue.get(current_request, None)
         if not rotating_connections:
@@ -218,34 +457,237 @@ class GearmanClient(GearmanConnectionManager):
             rotating_connections = collections.deque(shuffled_connection_list)
             self.request_to_rotating_connection_queue[current_request] = rotating_connections
 
-        failed_connections = 0
-        chosen_connection = None
-        for possible_connection in rotating_connections:
-            try:
-                chosen_connection = self.establish_connection(possible_connection)
-                break
-            except ConnectionError:
-                # Rotate our server list so we'll skip all our broken servers
-                failed_connections += 1
-
-        if not chosen_connection:
-            raise ServerUnavailable('Found no valid connections: %r' % self.connection_list)
-
-        # Rotate our server list so we'll skip all our broken servers
-        rotating_connections.rotate(-failed_connections)
+        # Retries move on to the next server, rather than going back to the one that let them down
+        avoided_connection = self._request_to_avoided_connection.pop(current_request, None)
+        if avoided_connection is not None and rotating_connections[0] is avoided_connection:
+            rotating_connections.rotate(-1)
+
+        return list(rotating_connections)
+
+    def _route_request(self, current_request):
+        routed_connections = self.router.route(current_request, self.connection_list)
+
+        # Retries try the connection that let them down last
+        avoided_connection = self._request_to_avoided_connection.pop(current_request, None)
+        if avoided_connection in routed_connections:
+            routed_connections = [current_connection for current_connection in routed_connections if current_connection is not avoided_connection]
+            routed_connections.append(avoided_connection)
+
+        return routed_connections
+
+    def _on_request_connection_chosen(self, current_request, chosen_connection, failed_connections):
+        # Our router always gives us the same connections in the same order, so there's no history to keep
+        if self.router is None:
+            # Rotate our server list so we'll skip all our broken servers
+            self.request_to_rotating_connection_queue[current_request].rotate(-failed_connections)
+
         return chosen_connection
 
     def send_job_request(self, current_request):
         """Attempt to send out a job request"""
+        self._check_connection_attempts(current_request)
+        chosen_connection = self.establish_request_connection(current_request)
+        return self._send_job_request_over(current_request, chosen_connection)
+
+    def _check_connection_attempts(self, current_request):
         if current_request.connection_attempts >= current_request.max_connection_attempts:
             raise ExceededConnectionAttempts('Exceeded %d connection attempt(s) :: %r' % (current_request.max_connection_attempts, current_request))
 
-        chosen_connection = self.establish_request_connection(current_request)
-
+    def _send_job_request_over(self, current_request, chosen_connection):
         current_request.job.connection = chosen_connection
         current_request.connection_attempts += 1
         current_request.timed_out = False
 
         current_command_handler = self.connection_to_handler_map[chosen_connection]
         current_command_handler.send_job_request(current_request)
+        self._add_outstanding_request(current_request)
+        self._on_request_sent(current_request)
         return current_request
+
+    def _on_request_sent(self, current_request):
+        if current_request.deadline is not None:
+            self.add_deadline(current_request, current_request.deadline)
+
+        # Retry budgets grow with the requests we send, but not with our retries
+        if current_request.connection_attempts == 1:
+            retry_policy = self._get_retry_policy(current_request)
+            if retry_policy is not None:
+                retry_policy.on_request_sent(current_request)
+
+    #####################################################
+    ##### Callback methods for GearmanClientHandler #####
+    #####################################################
+    def on_request_updated(self, current_request):
+        """Called by our command handlers whenever a request changes state, or receives a status"""
+        if current_request in self._outstanding_requests:
+            self._update_outstanding_request(current_request)
+
+        # Requests we're retrying aren't done with yet, whatever just happened to them
+        if (current_request.state == JOB_FAILED or (current_request.state == JOB_UNKNOWN and current_request.job.handle is None)) and self._retry_request_later(current_request):
+            return
+
+        if self._inflight_requests_by_key and (current_request.complete or current_request.state == JOB_UNKNOWN):
+            self._forget_inflight_request(current_request)
+
+        if current_request.deadline is not None and current_request.complete:
+            self.cancel_deadline(current_request)
+
+        if current_request.state == JOB_COMPLETE and self.result_cache is not None and self.result_cache.is_waiting_on(current_request):
+            self.result_cache.on_request_complete(current_request, self.data_encoder.encode(current_request.result))
+
+        for request_tracker in self._request_trackers:
+            request_tracker.update(current_request)
+
+    def on_deadline_expired(self, item):
+        """Called by our poll loop once a request's deadline passes, or it's time to resend a request we're retrying"""
+        if isinstance(item, _ScheduledRetry):
+            del self._request_to_scheduled_retry[item.request]
+            self._send_scheduled_retry(item.request)
+        else:
+            self._expire_request(item)
+
+    def awaiting_deadlines(self):
+        """Requests waiting to be retried may yet find a server, even once we've no live connections"""
+        return bool(self._request_to_scheduled_retry)
+
+    def _expire_request(self, current_request):
+        """Stop our wait loops waiting on a request whose deadline has passed"""
+        if current_request.complete:
+            return
+
+        scheduled_retry = self._request_to_scheduled_retry.pop(current_request, None)
+        if scheduled_retry is not None:
+            self.cancel_deadline(scheduled_retry)
+
+        current_request.deadline_expired = True
+        self._mark_timed_out(current_request, True)
+        self.request_to_rotating_connection_queue.pop(current_request, None)
+
+        for request_tracker in self._request_trackers:
+            request_tracker.update(current_request)
+
+    def _coalesce_request(self, current_request):
+        """Return the request already in flight for the same foreground job, if there is one, otherwise this request
+
+        The servers would merge the two jobs anyway, so sharing the request saves submitting it twice.  Requests with
+        deadlines are never shared, as each caller's deadline is their own
+        """
+        if current_request.background or current_request.complete or current_request.deadline is not None or not self.coalesce_requests:
+            return current_request
+
+        # Jobs whose unique stands in for their data are only the same job if their data is
+        if is_data_unique(current_request.job.unique):
+            return current_request
+
+        request_key = (current_request.job.task, current_request.job.unique)
+        inflight_request = self._inflight_requests_by_key.get(request_key)
+        if inflight_request is not None and not inflight_request.complete:
+            return inflight_request
+
+        self._inflight_requests_by_key[request_key] = current_request
+        return current_request
+
+    def _forget_inflight_request(self, current_request):
+        request_key = (current_request.job.task, current_request.job.unique)
+        if self._inflight_requests_by_key.get(request_key) is current_request:
+            del self._inflight_requests_by_key[request_key]
+
+    def _add_outstanding_request(self, current_request):
+        current_request.job.connection.outstanding_requests += 1
+        self._outstanding_requests[current_request] = time.time()
+
+    def _update_outstanding_request(self, current_request):
+        """Keep each connection's load up to date, for routers that balance requests by it"""
+        current_connection = current_request.job.connection
+        time_sent = self._outstanding_requests[current_request]
+        if time_sent is not None and current_request.state == JOB_CREATED:
+            current_connection.record_job_created_rtt(time.time() - time_sent)
+            self._outstanding_requests[current_request] = None
+
+        # Background jobs are finished with as soon as they're accepted
+        if current_request.complete or current_request.state == JOB_UNKNOWN or (current_request.background and current_request.state == JOB_CREATED):
+            self._forget_outstanding_request(current_request)
+
+    def _forget_outstanding_request(self, current_request):
+        if current_request in self._outstanding_requests:
+            del self._outstanding_requests[current_request]
+            current_request.job.connection.outstanding_requests -= 1
+
+    def _mark_timed_out(self, current_request, timed_out):
+        """Flag whether we gave up waiting on a request, which no longer counts towards its connection's load if we did"""
+        current_request.timed_out = timed_out
+        if timed_out:
+            self._forget_outstanding_request(current_request)
+
+    def _poll_tracked_requests(self, request_tracker, callback_fxn, timeout=None):
+        self._request_trackers.append(request_tracker)
+        try:
+            return self.poll_connections_until_stopped(self.connection_list, callback_fxn, timeout=timeout)
+        finally:
+            self._request_trackers.remove(request_tracker)
+
+    def _resend_lost_requests(self, request_tracker):
+        # A request can be lost more than once before we get round to it, but only needs resending once
+        while request_tracker.lost_requests:
+            current_request = request_tracker.lost_requests.popleft()
+            if current_request.state == JOB_UNKNOWN and not current_request.deadline_expired:
+                self._send_or_retry_later(current_request)
+
+    ############################################################
+    ##### Retrying requests according to their RetryPolicy #####
+    ############################################################
+    def _get_retry_policy(self, current_request):
+        return current_request.retry_policy or self.task_retry_policies.get(current_request.job.task) or self.retry_policy
+
+    def _retry_request_later(self, current_request):
+        """Schedule a retry for a request that's failed, or been lost before its server accepted it, if its policy says so"""
+        if current_request.state == JOB_FAILED:
+            retry_policy = self._get_retry_policy(current_request)
+            if retry_policy is None or not retry_policy.retry_failed_jobs:
+                return False
+
+        return self._schedule_retry(current_request)
+
+    def _schedule_retry(self, current_request):
+        """Have our poll loop resend a request once its policy's retry delay is up, returning False if the policy
+        gives up on it instead"""
+        retry_policy = self._get_retry_policy(current_request)
+        if retry_policy is None or current_request.deadline_expired:
+            return False
+
+        retry_delay = retry_policy.get_retry_delay(current_request)
+        if retry_delay is None:
+            return False
+
+        previous_connection = current_request.job.connection
+        if previous_connection is not None:
+            self._request_to_avoided_connection[current_request] = previous_connection
+
+            # The server we're leaving mustn't hand this request back to us if it goes down later
+            previous_handler = self.connection_to_handler_map.get(previous_connection)
+            if previous_handler is not None:
+                previous_handler.forget_request(current_request)
+
+        # Requests waiting to be retried stay JOB_PENDING, so our wait loops carry on waiting for them
+        current_request.initialize_request()
+        current_request.state = JOB_PENDING
+        current_request.job.connection = None
+        current_request.job.handle = None
+        current_request.retry_count += 1
+        current_request.max_connection_attempts = max(current_request.max_connection_attempts, current_request.connection_attempts + 1)
+
+        scheduled_retry = _ScheduledRetry(current_request)
+        self._request_to_scheduled_retry[current_request] = scheduled_retry
+        self.add_deadline(scheduled_retry, time.time() + retry_delay)
+        return True
+
+    def _send_scheduled_retry(self, current_request):
+        current_request.state = JOB_UNKNOWN
+        self._send_or_retry_later(current_request)
+
+    def _send_or_retry_later(self, current_request):
+        try:
+            self.send_job_request(current_request)
+        except ServerUnavailable:
+            if not self._schedule_retry(current_request):
+                raise
@@ -48,12 +48,25 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
         self._register_request(current_request)
         self.send_command(GEARMAN_COMMAND_GET_STATUS, job_handle=current_request.job.handle)
 
+    def forget_request(self, current_request):
+        """Stop tracking a request that's being resent to another server"""
+        if self.handle_to_request_map.get(current_request.job.handle) is current_request:
+            del self.handle_to_request_map[current_request.job.handle]
+
+        if current_request in self.requests_awaiting_handles:
+            self.requests_awaiting_handles.remove(current_request)
+
     def on_io_error(self):
-        for pending_request in self.requests_awaiting_handles:
-            pending_request.state = JOB_UNKNOWN
+        # Requests that have since moved on to another connection aren't ours to lose
+        failed_connection = self.connection_manager.handler_to_connection_map.get(self)
+        affected_requests = [current_request for current_request in self.requests_awaiting_handles if current_request.job.connection is failed_connection]
+        affected_requests.extend(current_request for current_request in compat.itervalues(self.handle_to_request_map) if current_request.job.connection is failed_connection)
 
-        for inflight_request in compat.itervalues(self.handle_to_request_map):
-            inflight_request.state = JOB_UNKNOWN
+        for current_request in affected_requests:
+            current_request.state = JOB_UNKNOWN
+
+        for current_request in affected_requests:
+            self.connection_manager.on_request_updated(current_request)
 
     def _register_request(self, current_request):
         self.handle_to_request_map[current_request.job.handle] = current_request
@@ -78,6 +91,7 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
         current_request.state = JOB_CREATED
         self._register_request(current_request)
 
+        self.connection_manager.on_request_updated(current_request)
         return True
 
     def recv_work_data(self, job_handle, data):
@@ -113,6 +127,8 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
             'denominator': int(denominator),
             'time_received': time.time()
         }
+
+        self.connection_manager.on_request_updated(current_request)
         return True
 
     def recv_work_complete(self, job_handle, data):
@@ -123,6 +139,7 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
         current_request.result = self.decode_data(data)
         current_request.state = JOB_COMPLETE
 
+        self.connection_manager.on_request_updated(current_request)
         return True
 
     def recv_work_fail(self, job_handle):
@@ -132,6 +149,7 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
 
         current_request.state = JOB_FAILED
 
+        self.connection_manager.on_request_updated(current_request)
         return True
 
     def recv_work_exception(self, job_handle, data):
@@ -143,6 +161,7 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
 
         current_request.exception = self.decode_data(data)
 
+        self.connection_manager.on_request_updated(current_request)
         return True
 
     def recv_status_res(self, job_handle, known, running, numerator, denominator):
@@ -160,4 +179,5 @@ class GearmanClientCommandHandler(GearmanCommandHandler):
             'time_received': time.time()
         }
 
+        self.connection_manager.on_request_updated(current_request)
         return True
@@ -1,6 +1,7 @@
 import logging
+from gearman import compat
 from gearman.errors import UnknownCommandError
-from gearman.protocol import get_command_name
+from gearman.protocol import GEARMAN_COMMAND_TO_NAME, GEARMAN_PARAMS_FOR_COMMAND, get_command_name
 
 gearman_logger = logging.getLogger(__name__)
 
@@ -12,6 +13,8 @@ class GearmanCommandHandler(object):
     """
     def __init__(self, connection_manager=None):
         self.connection_manager = connection_manager
+        self._dispatch_table = None
+        self._positional_dispatch_table = None
 
     def __repr__(self):
         return '%s(connection_manager=%r)' % (
@@ -32,16 +35,79 @@ class GearmanCommandHandler(object):
         """Convenience function :: handle object -> binary string packing"""
         return self.connection_manager.data_encoder.encode(data)
 
+    @classmethod
+    def _recv_callback_names(cls):
+        """Maps every command this class handles to the name of its recv_* callback, worked out once per class"""
+        callback_names = cls.__dict__.get('_cached_recv_callback_names')
+        if callback_names is not None:
+            return callback_names
+
+        # Subclasses that override recv_command get every command passed through it instead
+        callback_names = {}
+        overriding_classes = cls.__mro__[:cls.__mro__.index(GearmanCommandHandler)]
+        if not any('recv_command' in klass.__dict__ for klass in overriding_classes):
+            for cmd_type, gearman_command_name in GEARMAN_COMMAND_TO_NAME.items():
+                recv_command_function_name = gearman_command_name.lower().replace('gearman_command_', 'recv_')
+                if getattr(cls, recv_command_function_name, None) is not None:
+                    callback_names[cmd_type] = recv_command_function_name
+
+        cls._cached_recv_callback_names = callback_names
+        return callback_names
+
+    @classmethod
+    def _positional_cmd_types(cls):
+        """The commands whose recv_* callbacks take the protocol's arguments in the protocol's order, worked out once
+        per class.  Any others are passed their arguments by name"""
+        positional_cmd_types = cls.__dict__.get('_cached_positional_cmd_types')
+        if positional_cmd_types is not None:
+            return positional_cmd_types
+
+        positional_cmd_types = frozenset(
+            cmd_type for cmd_type, recv_command_function_name in cls._recv_callback_names().items()
+            if tuple(compat.get_arg_names(getattr(cls, recv_command_function_name))[1:]) == tuple(GEARMAN_PARAMS_FOR_COMMAND[cmd_type])
+        )
+
+        cls._cached_positional_cmd_types = positional_cmd_types
+        return positional_cmd_types
+
+    def _get_dispatch_table(self):
+        """Maps cmd_type to our bound recv_* callback"""
+        if self._dispatch_table is None:
+            self._dispatch_table = dict(
+                (cmd_type, getattr(self, recv_command_function_name))
+                for cmd_type, recv_command_function_name in self._recv_callback_names().items()
+            )
+
+        return self._dispatch_table
+
+    def _get_positional_dispatch_table(self):
+        """Maps cmd_type to the recv_* callbacks we can pass received command records straight to"""
+        if self._positional_dispatch_table is None:
+            positional_cmd_types = self._positional_cmd_types()
+            self._positional_dispatch_table = dict(
+                (cmd_type, cmd_callback) for cmd_type, cmd_callback in self._get_dispatch_table().items() if cmd_type in positional_cmd_types
+            )
+
+        return self._positional_dispatch_table
+
     def fetch_commands(self):
         """Called by a Connection Manager to notify us that we have pending commands"""
+        dispatch_table = self._get_positional_dispatch_table()
+
         continue_working = True
         while continue_working:
             cmd_tuple = self.connection_manager.read_command(self)
             if cmd_tuple is None:
                 break
 
+            # Received commands are records holding their arguments in protocol order, which our callbacks
+            # usually take them in too.  Any that don't get them by name through recv_command
             cmd_type, cmd_args = cmd_tuple
-            continue_working = self.recv_command(cmd_type, **cmd_args)
+            cmd_callback = dispatch_table.get(cmd_type)
+            if cmd_callback is None:
+                continue_working = self.recv_command(cmd_type, **cmd_args)
+            else:
+                continue_working = cmd_callback(*cmd_args)
 
     def send_command(self, cmd_type, **cmd_args):
         """Hand off I/O to the connection mananger"""
@@ -49,17 +115,17 @@ class GearmanCommandHandler(object):
 
     def recv_command(self, cmd_type, **cmd_args):
         """Maps any command to a recv_* callback function"""
-        completed_work = None
-
-        gearman_command_name = get_command_name(cmd_type)
-        if bool(gearman_command_name == cmd_type) or not gearman_command_name.startswith('GEARMAN_COMMAND_'):
-            unknown_command_msg = 'Could not handle command: %r - %r' % (gearman_command_name, cmd_args)
-            gearman_logger.error(unknown_command_msg)
-            raise ValueError(unknown_command_msg)
+        cmd_callback = self._get_dispatch_table().get(cmd_type)
+        if cmd_callback is None:
+            gearman_command_name = get_command_name(cmd_type)
+            if bool(gearman_command_name == cmd_type) or not gearman_command_name.startswith('GEARMAN_COMMAND_'):
+                unknown_command_msg = 'Could not handle command: %r - %r' % (gearman_command_name, cmd_args)
+                gearman_logger.error(unknown_command_msg)
+                raise ValueError(unknown_command_msg)
 
-        recv_command_function_name = gearman_command_name.lower().replace('gearman_command_', 'recv_')
+            recv_command_function_name = gearman_command_name.lower().replace('gearman_command_', 'recv_')
+            cmd_callback = getattr(self, recv_command_function_name, None)
 
-        cmd_callback = getattr(self, recv_command_function_name, None)
         if not cmd_callback:
             missing_callback_msg = 'Could not handle command: %r - %r' % (get_command_name(cmd_type), cmd_args)
             gearman_logger.error(missing_callback_msg)
@@ -1,5 +1,6 @@
 # -*- encoding: utf-8
 
+import inspect
 import sys
 
 PY2 = sys.version_info[0] == 2
@@ -10,24 +11,44 @@ if PY3:
     binary_type = bytes
     unicode_type = str
 
-    def array_to_bytes(arr):
-        return arr.tobytes()
-
     def itervalues(d):
         return d.values()
 
+    viewkeys = dict.keys
+
     def to_hex(binary_str):
         return binary_str.hex()
 
+    def get_arg_names(function):
+        return inspect.getfullargspec(function).args
+
 else:
     binary_type = str
     unicode_type = unicode
 
-    def array_to_bytes(arr):
-        return arr.tostring()
-
     def itervalues(d):
         return d.itervalues()
 
+    viewkeys = dict.viewkeys
+
     def to_hex(binary_str):
         return binary_str.encode('hex')
+
+    def get_arg_names(function):
+        return inspect.getargspec(function).args
+
+
+def array_to_bytes(arr):
+    """Bytes from a byte string, memoryview or array (only Python 2 arrays lack tobytes())"""
+    if isinstance(arr, binary_type):
+        return arr
+    elif PY3 or isinstance(arr, memoryview):
+        return arr.tobytes()
+    return arr.tostring()
+
+
+def to_bytes(given_string):
+    """Encode text as UTF-8, leaving byte strings (and things that hold bytes) as bytes"""
+    if isinstance(given_string, unicode_type):
+        return given_string.encode('utf-8')
+    return array_to_bytes(given_string)
@@ -0,0 +1,260 @@
+# -*- encoding: utf-8
+
+import collections
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+
+import gearman.io
+from gearman.client import GearmanClient, STREAM_WINDOW
+from gearman.constants import JOB_UNKNOWN, JOB_CREATED
+from gearman.errors import ConnectionError, ExceededConnectionAttempts, GearmanError, InvalidClientState, ServerUnavailable
+
+gearman_logger = logging.getLogger(__name__)
+
+
+class ConcurrentGearmanClient(GearmanClient):
+    """
+    ConcurrentGearmanClient :: Submits jobs from any number of threads, and returns a Future for each of them
+
+    A single background I/O thread owns every connection and the poller.  Submitting a job hands it over to the
+    I/O thread and returns straight away, so thousands of requests can be in flight over a handful of sockets.
+
+    Each Future resolves to the GearmanJobRequest once it's complete, the same way GearmanClient.submit_job()
+    returns it: check its state for JOB_COMPLETE or JOB_FAILED.  Future callbacks run on the I/O thread.
+
+    Foreground jobs submitted while an identical job is in flight share its request, so their Futures resolve to the
+    request that was actually sent.  Futures for requests whose deadlines pass resolve straight away, with
+    "timed_out" set on the request.  A poll_timeout stands in for the deadline of each job it's given with.
+
+    Only submit_job(), submit_multiple_jobs(), submit_multiple_requests() and shutdown() are thread-safe.  The
+    GearmanClient methods that poll for an answer (get_job_status(), the wait_until_*() methods, submit_stream() and
+    iter_completed()) would poll alongside the I/O thread, so they raise InvalidClientState instead: wait on the
+    Futures, with concurrent.futures.wait() or as_completed() for several at once.
+    """
+    def __init__(self, host_list=None, **kwargs):
+        super(ConcurrentGearmanClient, self).__init__(host_list=host_list, **kwargs)
+
+        # Requests handed over by other threads, along with whether we resolve them once complete or once accepted
+        self._submitted_requests = collections.deque()
+        self._request_to_futures = {}
+        self._requests_to_resend = collections.deque()
+
+        self._waker = gearman.io.Waker()
+        self._io_thread = None
+        self._io_thread_lock = threading.Lock()
+        self._running = False
+        self._shut_down = False
+
+    def submit_multiple_requests(self, job_requests, wait_until_complete=True, poll_timeout=None):
+        """Hand GearmanJobRequests over to the I/O thread, and return a Future for each of them
+
+        With wait_until_complete=False, the Futures resolve as soon as the server has accepted their jobs.  With a
+        poll_timeout, it becomes the deadline of every request that doesn't have a sooner one
+        """
+        assert type(job_requests) in (list, tuple, set), "Expected multiple job requests, received 1?"
+        self._start_io_thread()
+
+        if poll_timeout is not None:
+            poll_deadline = time.time() + poll_timeout
+            for current_request in job_requests:
+                if not current_request.complete and (current_request.deadline is None or current_request.deadline > poll_deadline):
+                    current_request.deadline = poll_deadline
+
+        futures = []
+        for current_request in job_requests:
+            future = Future()
+            futures.append(future)
+
+            # Requests answered from our result cache have nothing to wait for
+            if current_request.complete:
+                future.set_result(current_request)
+            else:
+                self._submitted_requests.append((current_request, future, wait_until_complete))
+
+        self._waker.wake()
+        return futures
+
+    def shutdown(self):
+        """Stop the I/O thread, fail any outstanding Futures and close our connections"""
+        with self._io_thread_lock:
+            if self._shut_down:
+                return
+
+            self._shut_down = True
+            self._running = False
+            io_thread = self._io_thread
+
+        if io_thread is not None:
+            self._waker.wake()
+            io_thread.join()
+
+        self._fail_outstanding_requests(GearmanError('Client was shut down'))
+        super(ConcurrentGearmanClient, self).shutdown()
+        self._waker.close()
+
+    def get_job_status(self, current_request, poll_timeout=None):
+        raise self._polling_error('get_job_status')
+
+    def get_job_statuses(self, job_requests, poll_timeout=None):
+        raise self._polling_error('get_job_statuses')
+
+    def wait_until_jobs_accepted(self, job_requests, poll_timeout=None):
+        raise self._polling_error('wait_until_jobs_accepted')
+
+    def wait_until_jobs_completed(self, job_requests, poll_timeout=None):
+        raise self._polling_error('wait_until_jobs_completed')
+
+    def wait_until_job_statuses_received(self, job_requests, poll_timeout=None):
+        raise self._polling_error('wait_until_job_statuses_received')
+
+    def submit_stream(self, jobs_to_submit, window=STREAM_WINDOW, background=False, max_retries=0, poll_timeout=None):
+        raise self._polling_error('submit_stream')
+
+    def iter_completed(self, job_requests, timeout=None):
+        raise self._polling_error('iter_completed')
+
+    def poll_connections_until_stopped(self, submitted_connections, callback_fxn, timeout=None):
+        raise self._polling_error('poll_connections_until_stopped')
+
+    def _polling_error(self, method_name):
+        return InvalidClientState('%s.%s() would poll connections that belong to the I/O thread - wait on the Futures from submit_job() instead' % (type(self).__name__, method_name))
+
+    def _start_io_thread(self):
+        with self._io_thread_lock:
+            if self._shut_down:
+                raise GearmanError('Client was shut down')
+            if self._running:
+                return
+            if self._io_thread is not None:
+                raise GearmanError('Client I/O thread has stopped, see the log for why')
+
+            self._running = True
+            self._io_thread = threading.Thread(target=self._run_io_loop, name='gearman-client-io')
+            self._io_thread.daemon = True
+            self._io_thread.start()
+
+    ###########################################
+    # Everything below runs on the I/O thread #
+    ###########################################
+
+    def _run_io_loop(self):
+        poller = self._get_poller()
+        poller.register(self._waker, gearman.io.READ)
+        try:
+            while True:
+                # Drain before looking for work, so anything handed over after this still wakes us up
+                self._waker.drain()
+                if not self._running:
+                    break
+
+                self._send_submitted_requests()
+
+                live_connections = [current_connection for current_connection in self.connection_list if current_connection.connected]
+                self._register_connections_with_poller(live_connections, poller)
+                connection_map = dict((current_connection.fileno(), current_connection) for current_connection in live_connections)
+
+                read_connections, write_connections, dead_connections = self.poll_connections_once(poller, connection_map, timeout=self.get_time_until_next_deadline())
+                self.handle_connection_activity(read_connections, write_connections, dead_connections)
+                self.expire_deadlines()
+        except Exception as exc:
+            gearman_logger.exception('Client I/O thread stopped unexpectedly')
+            self._running = False
+            self._fail_outstanding_requests(exc)
+        finally:
+            poller.unregister(self._waker)
+
+    def _send_submitted_requests(self):
+        while self._submitted_requests:
+            current_request, future, wait_until_complete = self._submitted_requests.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            # Identical jobs submitted from other threads share the request we've already sent for them
+            shared_request = super(ConcurrentGearmanClient, self)._coalesce_request(current_request)
+            if shared_request is not current_request and shared_request in self._request_to_futures:
+                self._request_to_futures[shared_request].append((future, wait_until_complete))
+                continue
+
+            self._request_to_futures[current_request] = [(future, wait_until_complete)]
+            self._send_request(current_request)
+
+        while self._requests_to_resend:
+            current_request = self._requests_to_resend.popleft()
+            if current_request in self._request_to_futures:
+                self._send_request(current_request)
+
+    def _send_request(self, current_request):
+        try:
+            self._send_or_retry_later(current_request)
+        except (ExceededConnectionAttempts, ServerUnavailable) as exc:
+            self._resolve_request(current_request, exception=exc)
+
+    def _send_scheduled_retry(self, current_request):
+        current_request.state = JOB_UNKNOWN
+        if current_request in self._request_to_futures:
+            self._send_request(current_request)
+
+    def _coalesce_request(self, current_request):
+        """We share requests on the I/O thread, once they're handed over"""
+        return current_request
+
+    def on_request_updated(self, current_request):
+        """Called by our command handlers whenever a request changes state"""
+        super(ConcurrentGearmanClient, self).on_request_updated(current_request)
+
+        future_entries = self._request_to_futures.get(current_request)
+        if not future_entries:
+            return
+
+        if current_request.state == JOB_UNKNOWN:
+            # Resend jobs the server never accepted, but we've no idea how far a worker got with any others
+            if current_request.job.handle is None:
+                self._requests_to_resend.append(current_request)
+            else:
+                self._resolve_request(current_request, exception=ConnectionError('Lost connection to the server running %r' % current_request))
+            return
+
+        if current_request.complete:
+            self._resolve_request(current_request)
+        elif current_request.state == JOB_CREATED:
+            remaining_entries = [future_entry for future_entry in future_entries if future_entry[1]]
+            if not remaining_entries:
+                self._resolve_request(current_request)
+                return
+
+            # Resolve the Futures that were only waiting on the server to accept this job
+            for future, wait_until_complete in future_entries:
+                if not wait_until_complete:
+                    future.set_result(current_request)
+
+            self._request_to_futures[current_request] = remaining_entries
+
+    def _expire_request(self, current_request):
+        super(ConcurrentGearmanClient, self)._expire_request(current_request)
+
+        if current_request.deadline_expired and current_request in self._request_to_futures:
+            self._resolve_request(current_request)
+
+    def _resolve_request(self, current_request, exception=None):
+        future_entries = self._request_to_futures.pop(current_request)
+        if exception is not None or current_request.complete:
+            self.request_to_rotating_connection_queue.pop(current_request, None)
+            self._forget_inflight_request(current_request)
+
+        for future, _ in future_entries:
+            if exception is None:
+                future.set_result(current_request)
+            else:
+                future.set_exception(exception)
+
+    def _fail_outstanding_requests(self, exception):
+        for current_request in list(self._request_to_futures):
+            self._resolve_request(current_request, exception=exception)
+
+        while self._submitted_requests:
+            _, future, _ = self._submitted_requests.popleft()
+            if future.set_running_or_notify_cancel():
+                future.set_exception(exception)
@@ -1,18 +1,20 @@
 # -*- encoding: utf-8
 
-import array
 import collections
+import errno
 import logging
 import socket
 import ssl
 import struct
-import time
+import warnings
 
 import gearman.compat as compat
+from gearman.circuit_breaker import CircuitBreaker
 from gearman.errors import ConnectionError, ProtocolError, ServerUnavailable
 from gearman.constants import DEFAULT_GEARMAN_PORT, _DEBUG_MODE_
-from gearman.protocol import GEARMAN_PARAMS_FOR_COMMAND, GEARMAN_COMMAND_TEXT_COMMAND, NULL_CHAR, \
-    get_command_name, pack_binary_command, parse_binary_command, parse_text_command, pack_text_command
+from gearman.protocol import GEARMAN_PARAMS_FOR_COMMAND, GEARMAN_COMMAND_TEXT_COMMAND, \
+    BinaryCommandDecoder, get_command_name, pack_binary_command_segments, pack_binary_commands, parse_text_line, \
+    pack_text_command
 
 gearman_logger = logging.getLogger(__name__)
 
@@ -29,7 +31,31 @@ class GearmanConnection(object):
 
     All I/O and buffering should be done in this class
     """
-    connect_cooldown_seconds = 1.0
+    # Failures in a row before we stop connecting to the server, and how long we wait before trying it again
+    circuit_failure_threshold = 3
+    circuit_probe_interval = 1.0
+
+    # Deprecated: set circuit_probe_interval instead.  Subclasses that still set this get it as their probe interval
+    connect_cooldown_seconds = None
+
+    # Bounds on how many bytes a single recv_into() asks for.  Within these
+    # bounds, reads are sized to fit the frame we're waiting on
+    min_read_size = 4096
+    max_read_size = 1024 * 1024
+
+    # Outgoing data smaller than this is copied into a shared write buffer.
+    # Anything larger is queued by reference and handed to sendmsg() as is
+    outgoing_copy_threshold = 16 * 1024
+
+    # Most segments handed to a single sendmsg() call (IOV_MAX is at least 1024 on Linux and BSD)
+    max_send_segments = 1024
+
+    # Once this many commands are waiting to be sent, small ones are packed together in bulk.  Bulk packing is
+    # quicker even for a single command, so only raise this to pack commands one by one
+    batch_pack_threshold = 1
+
+    # How much each new JOB_CREATED round trip counts towards job_created_rtt
+    rtt_smoothing = 0.2
 
     def __init__(self, host=None, port=DEFAULT_GEARMAN_PORT, keyfile=None, certfile=None, ca_certs=None):
         port = port or DEFAULT_GEARMAN_PORT
@@ -47,6 +73,19 @@ class GearmanConnection(object):
         if all([self.keyfile, self.certfile, self.ca_certs]):
             self.use_ssl = True
 
+        # How loaded the server is, as seen by a client: the requests it hasn't finished with yet, and an
+        # exponentially weighted average of how many seconds it takes to answer a job submission with JOB_CREATED
+        self.outstanding_requests = 0
+        self.job_created_rtt = None
+
+        probe_interval = self.circuit_probe_interval
+        if self.connect_cooldown_seconds is not None:
+            warnings.warn('connect_cooldown_seconds is deprecated, set circuit_probe_interval instead', DeprecationWarning, stacklevel=2)
+            probe_interval = self.connect_cooldown_seconds
+
+        # Outlives our sockets, so we remember how the server's been doing across reconnects
+        self.circuit_breaker = CircuitBreaker(failure_threshold=self.circuit_failure_threshold, probe_interval=probe_interval)
+
         self._reset_connection()
 
     def __repr__(self):
@@ -64,19 +103,40 @@ class GearmanConnection(object):
         self.connected = False
         self.gearman_socket = None
 
-        self.allowed_connect_time = 0.0
+        # Set once the server has hung up on us, after sending data we haven't handled yet
+        self.remote_disconnected = False
 
         self._is_client_side = None
         self._is_server_side = None
 
         # Reset all our raw data buffers
-        self._incoming_buffer = array.array("b")
-        self._outgoing_buffer = b""
+        # _incoming_buffer is preallocated: bytes in [_incoming_offset, _incoming_end) are
+        # received but unparsed, and bytes after _incoming_end are free space for recv_into()
+        self._incoming_buffer = bytearray()
+        self._incoming_offset = 0
+        self._incoming_end = 0
+        self._recent_frame_size = 0
+        # How much of a partially received text line we've already searched for a newline
+        self._text_scan_size = 0
+
+        # Created once we know which side of the connection we're on
+        self._binary_decoder = None
+        # Unsent data is a queue of segments, the first of which has been sent up to _outgoing_offset
+        self._outgoing_segments = collections.deque()
+        self._outgoing_offset = 0
+        self._outgoing_size = 0
 
         # Toss all commands we may have sent or received
         self._incoming_commands = collections.deque()
         self._outgoing_commands = collections.deque()
 
+    def record_job_created_rtt(self, rtt):
+        """Fold another JOB_CREATED round trip into job_created_rtt"""
+        if self.job_created_rtt is None:
+            self.job_created_rtt = rtt
+        else:
+            self.job_created_rtt += self.rtt_smoothing * (rtt - self.job_created_rtt)
+
     def fileno(self):
         """Implements fileno() for use with select.select()"""
         if not self.gearman_socket:
@@ -90,35 +150,30 @@ class GearmanConnection(object):
 
     def writable(self):
         """Returns True if we have data to write"""
-        return self.connected and bool(self._outgoing_commands or self._outgoing_buffer)
+        return self.connected and bool(self._outgoing_commands or self._outgoing_segments)
 
     def readable(self):
         """Returns True if we might have data to read"""
         return self.connected
 
-    def connect(self):
-        """Connect to the server. Raise ConnectionError if connection fails."""
+    def connect(self, timeout=None):
+        """Connect to the server, giving up after timeout seconds if given. Raise ConnectionError if connection fails."""
         if self.connected:
             self.throw_exception(message='connection already established')
 
-        current_time = time.time()
-        if current_time < self.allowed_connect_time:
-            self.throw_exception(message='attempted to connect before required cooldown')
-
-        self.allowed_connect_time = current_time + self.connect_cooldown_seconds
-
         self._reset_connection()
 
-        self._create_client_socket()
+        self._create_client_socket(timeout)
 
         self.connected = True
         self._is_client_side = True
         self._is_server_side = False
 
-    def _create_client_socket(self):
+    def _create_client_socket(self, timeout=None):
         """Creates a client side socket and subsequently binds/configures our socket options"""
         try:
             client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client_socket.settimeout(timeout)
 
             if self.use_ssl:
                 client_socket = ssl.wrap_socket(client_socket,
@@ -154,67 +209,175 @@ class GearmanConnection(object):
     def read_commands_from_buffer(self):
         """Reads data from buffer --> command_queue"""
         received_commands = 0
-        while True:
-            cmd_type, cmd_args, cmd_len = self._unpack_command(self._incoming_buffer)
-            if not cmd_len:
+        start_offset = self._incoming_offset
+        buffer_view = memoryview(self._incoming_buffer)
+        try:
+            while self._incoming_offset < self._incoming_end:
+                # Text responses come a line at a time, but binary commands start with a NULL byte
+                if self._incoming_buffer[self._incoming_offset] != 0 and not (self._binary_decoder and self._binary_decoder.pending_packet_size):
+                    text_commands = self._read_text_commands()
+                    if not text_commands:
+                        break
+
+                    received_commands += text_commands
+                    continue
+
+                cmd_type, cmd_args, cmd_len = self._unpack_command(buffer_view[self._incoming_offset:self._incoming_end])
+                if not cmd_len:
+                    break
+
+                received_commands += 1
+
+                # Store our command on the command queue
+                # Move our read offset forward by the number of bytes we just read
+                self._incoming_commands.append((cmd_type, cmd_args))
+                self._incoming_offset += cmd_len
+        finally:
+            # A bytearray cannot be resized while a memoryview of it is alive
+            del buffer_view
+
+        if received_commands:
+            average_frame_size = (self._incoming_offset - start_offset) // received_commands
+            self._recent_frame_size = (3 * self._recent_frame_size + average_frame_size) // 4
+
+        self._compact_incoming_buffer()
+        return received_commands
+
+    def _read_text_commands(self):
+        """Reads every complete line of text from the front of the buffer --> command_queue
+
+        Searches for newlines from a moving offset, so each received byte is looked at once no matter how many lines
+        a response holds or how many reads a single line takes to arrive
+        """
+        received_commands = 0
+        incoming_buffer = self._incoming_buffer
+        while self._incoming_offset < self._incoming_end and incoming_buffer[self._incoming_offset] != 0:
+            line_end = incoming_buffer.find(b'\n', self._incoming_offset + self._text_scan_size, self._incoming_end)
+            if line_end == -1:
+                self._text_scan_size = self._incoming_end - self._incoming_offset
                 break
 
-            received_commands += 1
+            cmd_type, cmd_args = parse_text_line(bytes(incoming_buffer[self._incoming_offset:line_end]))
+            if _DEBUG_MODE_:
+                gearman_logger.debug('%s - Recv - %s - %r', hex(id(self)), get_command_name(cmd_type), cmd_args)
 
-            # Store our command on the command queue
-            # Move the self._incoming_buffer forward by the number of bytes we just read
             self._incoming_commands.append((cmd_type, cmd_args))
-            self._incoming_buffer = self._incoming_buffer[cmd_len:]
+            self._incoming_offset = line_end + 1
+            self._text_scan_size = 0
+            received_commands += 1
 
         return received_commands
 
-    def read_data_from_socket(self, bytes_to_read=4096):
-        """Reads data from socket --> buffer"""
+    def _compact_incoming_buffer(self):
+        """Rewind the incoming buffer once everything in it has been parsed"""
+        if self._incoming_offset < self._incoming_end:
+            return
+
+        self._incoming_offset = 0
+        self._incoming_end = 0
+
+        # Don't hold onto the memory used by an unusually large frame
+        if len(self._incoming_buffer) > self.max_read_size:
+            del self._incoming_buffer[self.max_read_size:]
+
+    def _reserve_incoming_space(self, read_size):
+        """Make sure there are at least read_size free bytes after _incoming_end"""
+        if len(self._incoming_buffer) - self._incoming_end >= read_size:
+            return
+
+        # Slide any unparsed bytes to the front of the buffer before growing it
+        if self._incoming_offset:
+            unparsed_size = self._incoming_end - self._incoming_offset
+            self._incoming_buffer[:unparsed_size] = self._incoming_buffer[self._incoming_offset:self._incoming_end]
+            self._incoming_offset = 0
+            self._incoming_end = unparsed_size
+
+        shortfall = read_size - (len(self._incoming_buffer) - self._incoming_end)
+        if shortfall > 0:
+            self._incoming_buffer.extend(bytearray(max(shortfall, len(self._incoming_buffer))))
+
+    def _next_read_size(self):
+        """Size the next read to fit the rest of a partially received frame, or a recently typical frame"""
+        unparsed_size = self._incoming_end - self._incoming_offset
+
+        # The decoder knows the size of a binary command once it has seen its header
+        expected_frame_size = 0
+        if self._binary_decoder is not None:
+            expected_frame_size = self._binary_decoder.pending_packet_size
+
+        read_size = max(expected_frame_size - unparsed_size, self._recent_frame_size)
+        return min(max(read_size, self.min_read_size), self.max_read_size)
+
+    def read_data_from_socket(self, bytes_to_read=None, until_would_block=False):
+        """Reads data from socket --> buffer
+
+        Keeps reading until the socket is drained, so one readiness event picks up everything the kernel has buffered.
+        Edge-triggered pollers only tell us about new data, so they need until_would_block: rather than trusting a short
+        read, we keep going until the socket would block or the server hangs up.
+        Returns the number of unparsed bytes in the buffer
+        """
         if not self.connected:
             self.throw_exception(message='disconnected')
 
-        recv_buffer = ''
-
+        total_bytes_read = 0
         while True:
-            try:
-                recv_buffer = self.gearman_socket.recv(bytes_to_read)
-            except ssl.SSLError as e:
-                # if we would block, ignore the error
-                if e.errno in [ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE]:
-                    continue
-                else:
-                    self.throw_exception(exception=e)
-            except socket.error as socket_exception:
-                self.throw_exception(exception=socket_exception)
+            read_size = bytes_to_read or self._next_read_size()
+            bytes_read = self._recv_into_buffer(read_size)
+            if bytes_read is None:
+                break
 
-            if len(recv_buffer) == 0:
+            if bytes_read == 0:
+                # Hand over what we already have, and let whoever's reading know they've had the last of it
+                if total_bytes_read:
+                    self.remote_disconnected = True
+                    break
                 self.throw_exception(message='remote disconnected')
-            break
 
-        # SSL has an internal buffer we need to empty out
-        if self.use_ssl:
-            remaining = self.gearman_socket.pending()
-            while remaining:
-                recv_buffer += self.gearman_socket.recv(remaining)
-                remaining = self.gearman_socket.pending()
+            self._incoming_end += bytes_read
+            total_bytes_read += bytes_read
+
+            if not until_would_block and self._socket_drained(bytes_read, read_size):
+                break
+
+        return self._incoming_end - self._incoming_offset
 
-        self._incoming_buffer.fromstring(recv_buffer)
-        return len(self._incoming_buffer)
+    def _recv_into_buffer(self, read_size):
+        """Receives up to read_size bytes into the free end of our buffer, returning None if the socket would block"""
+        self._reserve_incoming_space(read_size)
+
+        receive_view = memoryview(self._incoming_buffer)[self._incoming_end:self._incoming_end + read_size]
+        try:
+            return self.gearman_socket.recv_into(receive_view, read_size)
+        except ssl.SSLError as e:
+            # if we would block, we've drained the socket
+            if e.errno not in [ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE]:
+                self.throw_exception(exception=e)
+        except socket.error as socket_exception:
+            if socket_exception.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.throw_exception(exception=socket_exception)
+        finally:
+            del receive_view
+
+        return None
+
+    def _socket_drained(self, bytes_read, read_size):
+        """A short read means the kernel had nothing more for us, but SSL has an internal buffer we need to empty out"""
+        return bytes_read < read_size and not (self.use_ssl and self.gearman_socket.pending())
 
     def _unpack_command(self, given_buffer):
-        """Conditionally unpack a binary command or a text based server command"""
+        """Unpack a binary command, text based server commands are read by _read_text_commands()"""
         assert self._is_client_side is not None, "Ambiguous connection state"
 
+        if self._binary_decoder is None:
+            # We'll be expecting a response if we know we're a client side command
+            self._binary_decoder = BinaryCommandDecoder(is_response=bool(self._is_client_side))
+
         if not given_buffer:
             cmd_type = None
             cmd_args = None
             cmd_len = 0
-        elif struct.pack("B", given_buffer[0]) == NULL_CHAR:
-            # We'll be expecting a response if we know we're a client side command
-            is_response = bool(self._is_client_side)
-            cmd_type, cmd_args, cmd_len = parse_binary_command(given_buffer, is_response=is_response)
         else:
-            cmd_type, cmd_args, cmd_len = parse_text_command(given_buffer)
+            cmd_type, cmd_args, cmd_len = self._binary_decoder.decode(given_buffer)
 
         if _DEBUG_MODE_ and cmd_type is not None:
             gearman_logger.debug('%s - Recv - %s - %r', hex(id(self)), get_command_name(cmd_type), cmd_args)
@@ -227,61 +390,113 @@ class GearmanConnection(object):
 
     def send_commands_to_buffer(self):
         """Sends and packs commands -> buffer"""
-        if not self._outgoing_commands:
+        if len(self._outgoing_commands) >= self.batch_pack_threshold and not _DEBUG_MODE_:
+            self._send_command_batch_to_buffer()
             return
 
-        packed_data = [self._outgoing_buffer]
         while self._outgoing_commands:
             cmd_type, cmd_args = self._outgoing_commands.popleft()
-            packed_command = self._pack_command(cmd_type, cmd_args)
-            packed_data.append(packed_command)
-        try:
-            self._outgoing_buffer = b''.join(packed_data)
-        except TypeError:
-            # We might be dealing with GEARMAN_COMMAND_TEXT_COMMAND so unpack
-            # that manually and convert its values. I believe we're still okay
-            # to return bytes.
-            self._outgoing_buffer = ""
-            for packed in packed_data:
-                if isinstance(packed, compat.binary_type):
-                    self._outgoing_buffer = "{}{}".format(self._outgoing_buffer, packed.decode("utf-8"))
-                else:
-                    self._outgoing_buffer = "{}{}".format(self._outgoing_buffer, packed)
-            self._outgoing_buffer = bytes(self._outgoing_buffer, "utf-8")
-
-    def send_data_to_socket(self):
+            for segment in self._pack_command(cmd_type, cmd_args):
+                self._queue_outgoing_data(segment)
+
+    def _send_command_batch_to_buffer(self):
+        """Packs runs of small binary commands in bulk, and everything else one by one"""
+        is_response = bool(self._is_server_side)
+        command_batch = []
+        while self._outgoing_commands:
+            cmd_type, cmd_args = self._outgoing_commands.popleft()
+
+            # Large payloads are queued by reference rather than copied into the batch
+            if cmd_type != GEARMAN_COMMAND_TEXT_COMMAND and len(cmd_args.get('data', b'')) < self.outgoing_copy_threshold:
+                command_batch.append((cmd_type, cmd_args))
+                continue
+
+            if command_batch:
+                self._queue_outgoing_data(pack_binary_commands(command_batch, is_response, trusted=True))
+                command_batch = []
+
+            for segment in self._pack_command(cmd_type, cmd_args):
+                self._queue_outgoing_data(segment)
+
+        if command_batch:
+            self._queue_outgoing_data(pack_binary_commands(command_batch, is_response, trusted=True))
+
+    def _queue_outgoing_data(self, data):
+        """Append data to the outgoing segments, copying it only if it's small"""
+        data_size = len(data)
+        if not data_size:
+            return
+
+        self._outgoing_size += data_size
+        if data_size >= self.outgoing_copy_threshold:
+            self._outgoing_segments.append(memoryview(data))
+        elif self._outgoing_segments and isinstance(self._outgoing_segments[-1], bytearray):
+            self._outgoing_segments[-1] += data
+        else:
+            self._outgoing_segments.append(bytearray(data))
+
+    def _consume_outgoing_data(self, bytes_sent):
+        """Drop bytes_sent bytes from the head of the outgoing segments"""
+        self._outgoing_size -= bytes_sent
+        bytes_sent += self._outgoing_offset
+        while self._outgoing_segments and bytes_sent >= len(self._outgoing_segments[0]):
+            bytes_sent -= len(self._outgoing_segments.popleft())
+
+        self._outgoing_offset = bytes_sent
+
+    def _send_outgoing_segments(self):
+        """Send as many outgoing segments as we can with a single system call"""
+        first_segment = memoryview(self._outgoing_segments[0])[self._outgoing_offset:]
+
+        # SSL sockets can't scatter-gather, and sendmsg() isn't available everywhere
+        if self.use_ssl or not hasattr(self.gearman_socket, 'sendmsg') or len(self._outgoing_segments) == 1:
+            return self.gearman_socket.send(first_segment)
+
+        segment_count = min(len(self._outgoing_segments), self.max_send_segments)
+        send_segments = [first_segment]
+        send_segments.extend(memoryview(self._outgoing_segments[index]) for index in range(1, segment_count))
+        return self.gearman_socket.sendmsg(send_segments)
+
+    def send_data_to_socket(self, until_would_block=False):
         """Send data from buffer -> socket
 
+        Sends once, or with until_would_block, until we run out of data or the socket would block, for edge-triggered
+        pollers that won't tell us the socket is still writable.
         Returns remaining size of the output buffer
         """
         if not self.connected:
             self.throw_exception(message='disconnected')
 
-        if not self._outgoing_buffer:
-            return 0
+        while self._outgoing_segments:
+            bytes_sent = self._send_from_buffer()
+            if bytes_sent is None:
+                break
 
-        while True:
-            try:
-                bytes_sent = self.gearman_socket.send(self._outgoing_buffer)
-            except ssl.SSLError as e:
-                if e.errno == ssl.SSL_ERROR_WANT_READ:
-                    continue
-                elif e.errno == ssl.SSL_ERROR_WANT_WRITE:
-                    continue
-                else:
-                    self.throw_exception(exception=e)
-            except socket.error as socket_exception:
-                self.throw_exception(exception=socket_exception)
+            self._consume_outgoing_data(bytes_sent)
+            if not until_would_block:
+                break
 
-            if bytes_sent == 0:
-                self.throw_exception(message='remote disconnected')
-            break
+        return self._outgoing_size
+
+    def _send_from_buffer(self):
+        """Sends what we can of our outgoing segments, returning None if the socket would block"""
+        try:
+            bytes_sent = self._send_outgoing_segments()
+        except ssl.SSLError as e:
+            if e.errno not in [ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE]:
+                self.throw_exception(exception=e)
+            return None
+        except socket.error as socket_exception:
+            if socket_exception.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.throw_exception(exception=socket_exception)
+            return None
 
-        self._outgoing_buffer = self._outgoing_buffer[bytes_sent:]
-        return len(self._outgoing_buffer)
+        if bytes_sent == 0:
+            self.throw_exception(message='remote disconnected')
+        return bytes_sent
 
     def _pack_command(self, cmd_type, cmd_args):
-        """Converts a command to its raw binary format"""
+        """Converts a command to a list of raw binary segments"""
         if cmd_type not in GEARMAN_PARAMS_FOR_COMMAND:
             raise ProtocolError('Unknown command: %r' % get_command_name(cmd_type))
 
@@ -289,11 +504,15 @@ class GearmanConnection(object):
             gearman_logger.debug('%s - Send - %s - %r', hex(id(self)), get_command_name(cmd_type), cmd_args)
 
         if cmd_type == GEARMAN_COMMAND_TEXT_COMMAND:
-            return pack_text_command(cmd_type, cmd_args)
+            text_command = pack_text_command(cmd_type, cmd_args)
+            if not isinstance(text_command, compat.binary_type):
+                text_command = text_command.encode('utf-8')
+            return [text_command]
         else:
             # We'll be sending a response if we know we're a server side command
+            # Our commands come from command handlers, which name their arguments after the protocol
             is_response = bool(self._is_server_side)
-            return pack_binary_command(cmd_type, cmd_args, is_response)
+            return pack_binary_command_segments(cmd_type, cmd_args, is_response, trusted=True)
 
     def close(self):
         """Shutdown our existing socket and reset all of our connection data"""
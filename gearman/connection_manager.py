@@ -1,7 +1,10 @@
 # -*- encoding: utf-8
 
 import errno
+import heapq
+import itertools
 import logging
+import time
 
 from . import compat
 import gearman.io
@@ -59,6 +62,9 @@ class GearmanConnectionManager(object):
 
     data_encoder = NoopEncoder
 
+    # One of gearman.io.POLLER_BACKENDS, or None to use epoll where available and select otherwise
+    poller_backend = None
+
     def __init__(self, host_list=None):
         assert self.command_handler_class is not None, 'GearmanClientBase did not receive a command handler class'
 
@@ -86,6 +92,16 @@ class GearmanConnectionManager(object):
 
         self.handler_initial_state = {}
 
+        # One poller for our lifetime, along with the (fileno, events) each connection is registered for
+        self._poller = None
+        self._poller_registrations = {}
+        self._poller_edge_triggered = False
+
+        # Min-heap of [deadline, sequence, item] entries, where cancelled entries have their item set to None
+        self._deadline_heap = []
+        self._item_to_deadline_entry = {}
+        self._deadline_sequence = itertools.count()
+
     def __repr__(self):
         return '<%s connection_list=%r>' % (
             type(self).__name__, self.connection_list)
@@ -95,6 +111,11 @@ class GearmanConnectionManager(object):
         for gearman_connection in self.connection_list:
             gearman_connection.close()
 
+        if self._poller is not None:
+            self._poller.close()
+            self._poller = None
+        self._poller_registrations.clear()
+
     ###################################
     # Connection management functions #
     ###################################
@@ -118,7 +139,7 @@ class GearmanConnectionManager(object):
 
         return client_connection
 
-    def establish_connection(self, current_connection):
+    def establish_connection(self, current_connection, connect_timeout=None):
         """Attempt to connect... if not previously connected, create a new CommandHandler to manage this connection's state
         !NOTE! This function can throw a ConnectionError which deriving ConnectionManagers should catch
         """
@@ -127,7 +148,12 @@ class GearmanConnectionManager(object):
             return current_connection
 
         # !NOTE! May throw a ConnectionError
-        current_connection.connect()
+        current_connection.circuit_breaker.record_attempt()
+        try:
+            current_connection.connect(timeout=connect_timeout)
+        except ConnectionError:
+            current_connection.circuit_breaker.record_failure()
+            raise
 
         # Initiate a new command handler every time we start a new connection
         current_handler = self.command_handler_class(connection_manager=self)
@@ -140,11 +166,17 @@ class GearmanConnectionManager(object):
         current_handler.initial_state(**self.handler_initial_state)
         return current_connection
 
+    def connection_available(self, current_connection):
+        """Whether current_connection is live, or worth trying to connect.  Lets us skip servers whose circuit
+        breakers are open without paying for a ConnectionError"""
+        return current_connection.connected or current_connection.circuit_breaker.allows_attempt()
+
     def poll_connections_once(self, poller, connection_map, timeout=None):
         # a timeout of -1 when used with epoll will block until there
         # is activity. Select does not support negative timeouts, so this
         # is translated to a timeout=None when falling back to select
-        timeout = timeout or -1
+        if timeout is None:
+            timeout = -1
 
         readable = set()
         writable = set()
@@ -186,62 +218,104 @@ class GearmanConnectionManager(object):
         failed_connections = ex_connections | dead_connections
         return rd_connections, wr_connections, failed_connections
 
+    def _get_poller(self):
+        """Returns the poller we keep for our lifetime, so connections stay registered from one poll to the next"""
+        if self._poller is None:
+            self._poller = gearman.io.get_connection_poller(self.poller_backend)
+            self._poller_edge_triggered = getattr(self._poller, 'edge_triggered', False)
+
+        return self._poller
+
     def _register_connections_with_poller(self, connections, poller):
+        """Make sure the poller watches each connection for the events it's interested in
+
+        We remember what each connection is registered for, so we only tell the poller about changes
+        """
         for conn in connections:
             # possible that not all connections have been established yet
             if not conn.gearman_socket:
+                self._unregister_connection_from_poller(conn, poller)
                 continue
-            try:
-                poller.unregister(conn)
-            except IOError as exc:
-                if exc.errno != errno.ENOENT:
-                    raise
+
             events = 0
             if conn.readable():
                 events |= gearman.io.READ
             if conn.writable():
                 events |= gearman.io.WRITE
+
+            registration = (conn.fileno(), events)
+            previous_registration = self._poller_registrations.get(conn)
+            if previous_registration != registration:
+                self._update_poller_registration(conn, poller, previous_registration, events)
+                self._poller_registrations[conn] = registration
+
+    def _update_poller_registration(self, conn, poller, previous_registration, events):
+        """Modify a connection's registration if it's kept its fileno, and register it afresh otherwise"""
+        if previous_registration is not None and previous_registration[0] == conn.fileno():
+            try:
+                poller.modify(conn, events)
+            except IOError as exc:
+                # Closing a socket removes it from epoll, so a reconnect that reuses the fileno needs registering
+                if exc.errno != errno.ENOENT:
+                    raise
+                self._unregister_connection_from_poller(conn, poller)
+                poller.register(conn, events)
+        else:
+            if previous_registration is not None:
+                self._unregister_connection_from_poller(conn, poller)
             poller.register(conn, events)
 
+    def _unregister_connection_from_poller(self, conn, poller):
+        if self._poller_registrations.pop(conn, None) is None:
+            return
+
+        try:
+            poller.unregister(conn)
+        except (ConnectionError, IOError, ValueError):
+            # The socket has already gone away, and closing it took it out of the poller
+            pass
+
     def poll_connections_until_stopped(self, submitted_connections, callback_fxn, timeout=None):
         """Continue to poll our connections until we receive a stopping condition"""
         stopwatch = gearman.util.Stopwatch(timeout)
         submitted_connections = set(submitted_connections)
-        connection_map = {}
 
         any_activity = False
+        self.expire_deadlines()
         callback_ok = callback_fxn(any_activity)
-        connection_ok = any(current_connection.connected for current_connection in submitted_connections)
-        poller = gearman.io.get_connection_poller()
-        if connection_ok:
+        connection_ok = self._has_live_connections(submitted_connections)
+        poller = self._get_poller()
+
+        # Connections left over from polling a different set of connections would only wake us up for nothing
+        for conn in list(self._poller_registrations):
+            if conn not in submitted_connections:
+                self._unregister_connection_from_poller(conn, poller)
+
+        while connection_ok and callback_ok:
+            # Dead connections can come back, if something reconnects them while we're polling
+            self._register_connections_with_poller(submitted_connections, poller)
             connection_map = {
                 conn.fileno(): conn
                 for conn in submitted_connections
                 if conn.connected
             }
 
-        while connection_ok and callback_ok:
-            self._register_connections_with_poller(submitted_connections, poller)
-
             time_remaining = stopwatch.get_time_remaining()
             if time_remaining == 0.0:
                 break
 
-            # Do a single robust select and handle all connection activity
-            read_connections, write_connections, dead_connections = self.poll_connections_once(poller, connection_map, timeout=time_remaining)
+            # Do a single robust select and handle all connection activity, waking up in time for our nearest deadline
+            poll_timeout = self._shorten_to_next_deadline(time_remaining)
+            read_connections, write_connections, dead_connections = self.poll_connections_once(poller, connection_map, timeout=poll_timeout)
 
             # Handle reads and writes and close all of the dead connections
             read_connections, write_connections, dead_connections = self.handle_connection_activity(read_connections, write_connections, dead_connections)
 
             any_activity = any([read_connections, write_connections, dead_connections])
-
-            # Do not retry dead connections on the next iteration of the loop, as we closed them in handle_error
-            submitted_connections -= dead_connections
+            self.expire_deadlines()
 
             callback_ok = callback_fxn(any_activity)
-            connection_ok = any(current_connection.connected for current_connection in submitted_connections)
-
-        poller.close()
+            connection_ok = self._has_live_connections(submitted_connections)
 
         # We should raise here if we have no alive connections (don't go into a select polling loop with no connections)
         if not connection_ok:
@@ -249,27 +323,113 @@ class GearmanConnectionManager(object):
 
         return bool(connection_ok and callback_ok)
 
+    def _has_live_connections(self, submitted_connections):
+        # Something waiting on one of our deadlines may yet reconnect, so it's worth polling on without connections
+        return any(current_connection.connected for current_connection in submitted_connections) or self.awaiting_deadlines()
+
+    #################################
+    # Deadline management functions #
+    #################################
+
+    def add_deadline(self, item, deadline):
+        """Have our poll loop call on_deadline_expired(item) once time.time() reaches deadline, replacing any deadline
+        item already has"""
+        self.cancel_deadline(item)
+
+        deadline_entry = [deadline, next(self._deadline_sequence), item]
+        self._item_to_deadline_entry[item] = deadline_entry
+        heapq.heappush(self._deadline_heap, deadline_entry)
+
+    def cancel_deadline(self, item):
+        """Forget item's deadline, if it has one"""
+        deadline_entry = self._item_to_deadline_entry.pop(item, None)
+        if deadline_entry is None:
+            return
+
+        # Taking an entry out of the middle of the heap is expensive, so we mark it cancelled and skip it later.  Should
+        # cancelled entries come to outnumber the live ones, we rebuild the heap without them
+        deadline_entry[-1] = None
+        if len(self._deadline_heap) > 2 * len(self._item_to_deadline_entry) + 16:
+            self._deadline_heap = [current_entry for current_entry in self._deadline_heap if current_entry[-1] is not None]
+            heapq.heapify(self._deadline_heap)
+
+    def get_time_until_next_deadline(self):
+        """Return the seconds left until our nearest deadline, or None if we have no deadlines"""
+        while self._deadline_heap and self._deadline_heap[0][-1] is None:
+            heapq.heappop(self._deadline_heap)
+
+        if not self._deadline_heap:
+            return None
+
+        return max(self._deadline_heap[0][0] - time.time(), 0.0)
+
+    def _shorten_to_next_deadline(self, time_remaining):
+        time_until_deadline = self.get_time_until_next_deadline()
+        if time_until_deadline is None:
+            return time_remaining
+        elif time_remaining is None:
+            return time_until_deadline
+
+        return min(time_remaining, time_until_deadline)
+
+    def expire_deadlines(self):
+        """Call on_deadline_expired() for every item whose deadline has passed, returning whether there were any"""
+        current_time = time.time()
+        any_expired = False
+        while self._deadline_heap and self._deadline_heap[0][0] <= current_time:
+            _, _, current_item = heapq.heappop(self._deadline_heap)
+            if current_item is None:
+                continue
+
+            # Expire items one at a time, so any left behind by on_deadline_expired() raising stay in the heap
+            del self._item_to_deadline_entry[current_item]
+            any_expired = True
+            self.on_deadline_expired(current_item)
+
+        return any_expired
+
+    def on_deadline_expired(self, item):
+        """Called by our poll loop once an item's deadline has passed"""
+        pass
+
+    def awaiting_deadlines(self):
+        """Whether our poll loop should keep running for a deadline, even once we've no live connections"""
+        return False
+
     def handle_read(self, current_connection):
         """Handle all our pending socket data"""
         current_handler = self.connection_to_handler_map[current_connection]
 
         # Transfer data from socket -> buffer
-        current_connection.read_data_from_socket()
+        current_connection.read_data_from_socket(until_would_block=self._poller_edge_triggered)
 
         # Transfer command from buffer -> command queue
         current_connection.read_commands_from_buffer()
 
+        # Hearing back from the server closes its circuit breaker
+        if current_connection.circuit_breaker.consecutive_failures:
+            current_connection.circuit_breaker.record_success()
+
         # Notify the handler that we have commands to fetch
         current_handler.fetch_commands()
 
+        # Our poller may never tell us about a hang up that arrived along with the data we just handled
+        if current_connection.remote_disconnected:
+            current_connection.throw_exception(message='remote disconnected')
+
     def handle_write(self, current_connection):
         # Transfer command from command queue -> buffer
         current_connection.send_commands_to_buffer()
 
         # Transfer data from buffer -> socket
-        current_connection.send_data_to_socket()
+        current_connection.send_data_to_socket(until_would_block=self._poller_edge_triggered)
 
     def handle_error(self, current_connection):
+        current_connection.circuit_breaker.record_failure()
+
+        if self._poller is not None:
+            self._unregister_connection_from_poller(current_connection, self._poller)
+
         dead_handler = self.connection_to_handler_map.pop(current_connection, None)
         if dead_handler:
             dead_handler.on_io_error()
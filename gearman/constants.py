@@ -1,6 +1,12 @@
 _DEBUG_MODE_ = False
 DEFAULT_GEARMAN_PORT = 4730
 
+# Size of gearmand's buffer for a job's unique, including its NUL terminator (GEARMAN_MAX_UNIQUE_SIZE in gearmand)
+GEARMAN_UNIQUE_SIZE = 64
+
+# A unique that tells gearmand to use the job's data as its unique
+GEARMAN_UNIQUE_FROM_DATA = b'-'
+
 PRIORITY_NONE = None
 PRIORITY_LOW  = 'LOW'
 PRIORITY_HIGH = 'HIGH'
@@ -10,3 +16,7 @@ JOB_PENDING  = 'PENDING'   # Request has been submitted, pending handle
 JOB_CREATED  = 'CREATED'   # Request has been accepted
 JOB_FAILED   = 'FAILED'    # Request received an explicit fail
 JOB_COMPLETE = 'COMPLETE'  # Request received an explicit complete
+
+CIRCUIT_CLOSED    = 'CLOSED'     # Server is healthy, connect to it whenever we need to
+CIRCUIT_OPEN      = 'OPEN'       # Server keeps failing, skip it until its next probe is due
+CIRCUIT_HALF_OPEN = 'HALF_OPEN'  # Probing the server with a single connection attempt
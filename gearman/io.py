@@ -1,4 +1,13 @@
+import errno
+import os
 import select
+import sys
+import time
+
+try:
+    import selectors
+except ImportError:  # Python 2
+    selectors = None
 
 import gearman.errors
 import gearman.util
@@ -8,24 +17,57 @@ _EPOLLIN = 0x01
 _EPOLLOUT = 0x04
 _EPOLLERR = 0x08
 _EPOLLHUP = 0x10
+_EPOLLET = 1 << 31
 
 READ = _EPOLLIN
 WRITE = _EPOLLOUT
 ERROR = _EPOLLERR | _EPOLLHUP
 
 
-def get_connection_poller():
+def get_connection_poller(backend=None):
     """
-    Returns a select.epoll-like object. Depending on the platform, this will
-    either be:
+    Returns a select.epoll-like object. The backend is one of the names in
+    POLLER_BACKENDS:
+        - "epoll": select.epoll, level-triggered
+        - "epoll_edge": select.epoll, edge-triggered
+        - "poll": select.poll
+        - "selectors": selectors.DefaultSelector, the best selector for the
+          platform (Python 3 only)
+        - "select": gearman.io._Select, which uses select.select and can
+          only watch file descriptors below FD_SETSIZE (usually 1024)
+
+    Without a backend, this will either be:
         - On modern Linux system, with python >= 2.6: select.epoll
         - On all other systems: gearman.io._Select: an object that mimics
           select.epoll, but uses select.select
     """
-    if hasattr(select, "epoll"):
-        return select.epoll()
-    else:
-        return _Select()
+    if backend is None:
+        backend = 'epoll' if hasattr(select, 'epoll') else 'select'
+
+    poller_class = POLLER_BACKENDS.get(backend)
+    if poller_class is None:
+        raise gearman.errors.GearmanError(
+            'Poller backend %r is not available on this platform, choose one of %r' % (backend, available_poller_backends()))
+
+    return poller_class()
+
+
+def available_poller_backends():
+    """Returns the names of the poller backends that work on this platform"""
+    return sorted(POLLER_BACKENDS)
+
+
+def _events_for_select_results(readable, writable, errors):
+    """Turns the connections select.select reported into (fileno, events) pairs, as epoll.poll would"""
+    events = {}
+    for conn in readable:
+        events[conn.fileno()] = events.get(conn.fileno(), 0) | READ
+    for conn in writable:
+        events[conn.fileno()] = events.get(conn.fileno(), 0) | WRITE
+    for conn in errors:
+        events[conn.fileno()] = events.get(conn.fileno(), 0) | ERROR
+
+    return events.items()
 
 
 def _find_bad_connections(connections):
@@ -126,11 +168,13 @@ class _Select(object):
             # is activity
             timeout = None
 
-        connections = (self.read | self.write | self.error)
+        if not (self.read or self.write or self.error):
+            # select won't wait on nothing, but our caller still wants to wait out its timeout
+            if timeout:
+                time.sleep(timeout)
+            return []
 
-        success = False
-        while not success and connections:
-            connections -= errors
+        while self.read or self.write or self.error:
             try:
                 r, w, e = gearman.util.select(
                     self.read,
@@ -141,20 +185,237 @@ class _Select(object):
                 readable = set(r)
                 writable = set(w)
                 errors |= set(e)  # this set could already be populated
-                success = True
+                break
             except (select.error, gearman.errors.ConnectionError):
-                bad_conns = _find_bad_connections(connections)
-                map(self.read.discard, bad_conns)
-                map(self.write.discard, bad_conns)
-                map(self.error.discard, bad_conns)
+                # Only work out which connections are bad once select has failed
+                bad_conns = _find_bad_connections(self.read | self.write | self.error)
+                for conn in bad_conns:
+                    self.unregister(conn)
                 errors |= set(bad_conns)
 
-        events = {}
-        for conn in readable:
-            events[conn.fileno()] = events.get(conn.fileno(), 0) | READ
-        for conn in writable:
-            events[conn.fileno()] = events.get(conn.fileno(), 0) | WRITE
-        for conn in errors:
-            events[conn.fileno()] = events.get(conn.fileno(), 0) | ERROR
+        return _events_for_select_results(readable, writable, errors)
+
+
+class _EdgeTriggeredEpoll(object):
+    """
+    A select.epoll that reports edge-triggered events.
+
+    A connection is only reported again once new data arrives or, for writes,
+    once it's registered again, so callers must drain sockets on every event.
+    The connection manager has GearmanConnection read until the socket would
+    block, and modifies a connection's events whenever it has something new
+    to write.
+    """
+    edge_triggered = True
+
+    def __init__(self):
+        self._epoll = select.epoll()
+
+    def close(self):
+        self._epoll.close()
+
+    def fileno(self):
+        return self._epoll.fileno()
+
+    def register(self, fd, evmask):
+        self._epoll.register(fd, evmask | _EPOLLET)
+
+    def modify(self, fd, evmask):
+        self._epoll.modify(fd, evmask | _EPOLLET)
+
+    def unregister(self, fd):
+        self._epoll.unregister(fd)
+
+    def poll(self, timeout):
+        return self._epoll.poll(timeout)
+
+
+class _FilenoPoller(object):
+    """
+    Base class for `select.epoll`-like objects built on pollers that watch
+    plain file descriptors.
+
+    Unlike epoll, these keep watching a file descriptor after its socket has
+    been closed. We remember the fileno each connection was registered under,
+    so a connection can be unregistered after its socket has gone, and a
+    reused fileno is handed over to the connection that now owns it.
+    """
+
+    def __init__(self):
+        self._filenos = {}
+        self._connections = {}
+
+    def register(self, fd, evmask):
+        if fd in self._filenos:
+            raise ValueError("Connection already registered: %d" % self._filenos[fd])
+
+        fileno = fd.fileno()
+        stale_fd = self._connections.get(fileno)
+        if stale_fd is not None:
+            self.unregister(stale_fd)
+
+        self._filenos[fd] = fileno
+        self._connections[fileno] = fd
+        self._register_fileno(fileno, evmask)
+
+    def modify(self, fd, evmask):
+        fileno = self._filenos.get(fd)
+        if fileno is None:
+            raise IOError(errno.ENOENT, 'Connection not registered: %r' % (fd, ))
+
+        self._modify_fileno(fileno, evmask)
+
+    def unregister(self, fd):
+        fileno = self._filenos.pop(fd, None)
+        if fileno is None:
+            raise IOError(errno.ENOENT, 'Connection not registered: %r' % (fd, ))
+
+        del self._connections[fileno]
+        self._unregister_fileno(fileno)
+
+
+class _Poll(_FilenoPoller):
+    """
+    A `select.epoll`-like object that uses select.poll.
+
+    poll() shares its event bits with epoll, but takes its timeout in
+    milliseconds.
+    """
+
+    def __init__(self):
+        super(_Poll, self).__init__()
+        self._poll = select.poll()
+
+    def close(self):
+        pass
+
+    def _register_fileno(self, fileno, evmask):
+        self._poll.register(fileno, evmask)
+
+    def _modify_fileno(self, fileno, evmask):
+        self._poll.modify(fileno, evmask)
+
+    def _unregister_fileno(self, fileno):
+        self._poll.unregister(fileno)
+
+    def poll(self, timeout):
+        if timeout is None or timeout < 0.0:
+            return self._poll.poll()
+        return self._poll.poll(timeout * 1000.0)
+
+
+class _Selectors(_FilenoPoller):
+    """
+    A `select.epoll`-like object that uses selectors.DefaultSelector.
+
+    Selectors can't watch a file descriptor for no events at all, so those
+    are left out of the selector until they're interested in some.
+    """
+
+    def __init__(self):
+        super(_Selectors, self).__init__()
+        self._selector = selectors.DefaultSelector()
+
+    def close(self):
+        self._selector.close()
+
+    def _register_fileno(self, fileno, evmask):
+        selector_events = self._selector_events(evmask)
+        if selector_events:
+            self._selector.register(fileno, selector_events)
+
+    def _modify_fileno(self, fileno, evmask):
+        selector_events = self._selector_events(evmask)
+        if fileno not in self._selector.get_map():
+            if selector_events:
+                self._selector.register(fileno, selector_events)
+        elif selector_events:
+            self._selector.modify(fileno, selector_events)
+        else:
+            self._selector.unregister(fileno)
+
+    def _unregister_fileno(self, fileno):
+        if fileno in self._selector.get_map():
+            self._selector.unregister(fileno)
+
+    @staticmethod
+    def _selector_events(evmask):
+        selector_events = 0
+        if evmask & READ:
+            selector_events |= selectors.EVENT_READ
+        if evmask & WRITE:
+            selector_events |= selectors.EVENT_WRITE
+        return selector_events
+
+    def poll(self, timeout):
+        if timeout is not None and timeout < 0.0:
+            timeout = None
+
+        events = []
+        for key, selector_events in self._selector.select(timeout):
+            evmask = 0
+            if selector_events & selectors.EVENT_READ:
+                evmask |= READ
+            if selector_events & selectors.EVENT_WRITE:
+                evmask |= WRITE
+            events.append((key.fd, evmask))
+
+        return events
+
+
+POLLER_BACKENDS = {'select': _Select}
+if hasattr(select, 'epoll'):
+    POLLER_BACKENDS['epoll'] = select.epoll
+    POLLER_BACKENDS['epoll_edge'] = _EdgeTriggeredEpoll
+if hasattr(select, 'poll'):
+    POLLER_BACKENDS['poll'] = _Poll
+if selectors is not None:
+    POLLER_BACKENDS['selectors'] = _Selectors
+
+
+class Waker(object):
+    """
+    Lets other threads wake up a thread blocked in a poller's poll().
+
+    Register the Waker with the poller for gearman.io.READ, call wake() from
+    any thread, and drain() from the polling thread before looking for more
+    work. Uses an eventfd where the platform has one, and a self-pipe
+    otherwise.
+    """
+
+    def __init__(self):
+        if hasattr(os, 'eventfd'):
+            self._read_fd = self._write_fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self._wake_value = (1).to_bytes(8, sys.byteorder)
+        else:
+            import fcntl
+
+            self._read_fd, self._write_fd = os.pipe()
+            for fd in (self._read_fd, self._write_fd):
+                flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+                fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self._wake_value = b'x'
 
-        return events.items()
+    def fileno(self):
+        return self._read_fd
+
+    def wake(self):
+        try:
+            os.write(self._write_fd, self._wake_value)
+        except OSError as exc:
+            # A full pipe will wake the poller up anyway
+            if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def drain(self):
+        try:
+            while os.read(self._read_fd, 4096):
+                pass
+        except OSError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def close(self):
+        os.close(self._read_fd)
+        if self._write_fd != self._read_fd:
+            os.close(self._write_fd)
@@ -30,7 +30,7 @@ class GearmanJob(object):
 
 class GearmanJobRequest(object):
     """Represents a job request... used in GearmanClient to represent job states"""
-    def __init__(self, gearman_job, initial_priority=PRIORITY_NONE, background=False, max_attempts=1):
+    def __init__(self, gearman_job, initial_priority=PRIORITY_NONE, background=False, max_attempts=1, deadline=None, retry_policy=None):
         self.gearman_job = gearman_job
 
         self.priority = initial_priority
@@ -39,15 +39,23 @@ class GearmanJobRequest(object):
         self.connection_attempts = 0
         self.max_connection_attempts = max_attempts
 
+        # The time.time() by which this request must be done, or None to wait on it for as long as our caller does
+        self.deadline = deadline
+
+        # A gearman.retry.RetryPolicy for this request, or None to use its client's
+        self.retry_policy = retry_policy
+        self.retry_count = 0
+
         self.initialize_request()
 
     def __repr__(self):
-        return '%s(gearman_job=%r, initial_priority=%r, background=%r, max_attempts=%r)' % (
+        return '%s(gearman_job=%r, initial_priority=%r, background=%r, max_attempts=%r, deadline=%r)' % (
             type(self).__name__,
             self.gearman_job,
             self.priority,
             self.background,
-            self.max_connection_attempts
+            self.max_connection_attempts,
+            self.deadline
         )
 
     def initialize_request(self):
@@ -67,6 +75,9 @@ class GearmanJobRequest(object):
         self.state = JOB_UNKNOWN
         self.timed_out = False
 
+        # Set once our deadline passes, after which we stop waiting on this request
+        self.deadline_expired = False
+
     def reset(self):
         self.initialize_request()
         self.connection = None
@@ -1,3 +1,4 @@
+import operator
 import struct
 
 from . import compat
@@ -10,6 +11,7 @@ MAGIC_RES_STRING = b'%sRES' % NULL_CHAR
 MAGIC_REQ_STRING = b'%sREQ' % NULL_CHAR
 
 COMMAND_HEADER_SIZE = 12
+COMMAND_HEADER_STRUCT = struct.Struct('!4sII')
 
 # Gearman commands 1-9
 GEARMAN_COMMAND_CAN_DO = 1
@@ -174,100 +176,318 @@ def submit_cmd_for_background_priority(background, priority):
     return cmd_type
 
 
+class GearmanCommandRecord(tuple):
+    """The arguments of a single received command, in the order given by GEARMAN_PARAMS_FOR_COMMAND
+
+    One record class is generated per command, see GEARMAN_RECORD_FOR_COMMAND.  Records are plain
+    tuples to the command handlers, which call their recv_* callbacks with ``*record``.  They still
+    read like the argument dicts they replace: ``record['data']``, ``record.data``, ``dict(record)``
+    and ``**record`` all work, and a record compares equal to the matching dict.
+    """
+    __slots__ = ()
+
+    cmd_type = None
+    _fields = ()
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % field_value for field_value in zip(self._fields, self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return tuple.__getitem__(self, key)
+
+        try:
+            return tuple.__getitem__(self, self._fields.index(key))
+        except ValueError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return list(zip(self._fields, self))
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return self[key]
+        return default
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+
+def _command_record_class(cmd_type, cmd_params):
+    command_name = get_command_name(cmd_type).replace('GEARMAN_COMMAND_', '')
+    class_attributes = dict(
+        (param, property(operator.itemgetter(index)))
+        for index, param in enumerate(cmd_params)
+    )
+    class_attributes.update(__slots__=(), cmd_type=cmd_type, _fields=tuple(cmd_params))
+
+    class_name = ''.join(word.capitalize() for word in command_name.split('_'))
+    return type(class_name, (GearmanCommandRecord, ), class_attributes)
+
+
+GEARMAN_RECORD_FOR_COMMAND = dict(
+    (cmd_type, _command_record_class(cmd_type, cmd_params))
+    for cmd_type, cmd_params in GEARMAN_PARAMS_FOR_COMMAND.items()
+)
+TEXT_COMMAND_RECORD = GEARMAN_RECORD_FOR_COMMAND[GEARMAN_COMMAND_TEXT_COMMAND]
+
+
+class BinaryCommandCodec(object):
+    """Packs and unpacks the arguments of a single binary command, in the order given by GEARMAN_PARAMS_FOR_COMMAND
+
+    One codec is compiled per command up front, see GEARMAN_CODEC_FOR_COMMAND
+    """
+    def __init__(self, cmd_type, cmd_params):
+        self.cmd_type = cmd_type
+        self.cmd_params = tuple(cmd_params)
+        self.cmd_param_set = frozenset(cmd_params)
+        self.record_class = GEARMAN_RECORD_FOR_COMMAND[cmd_type]
+
+        # Only the last argument may contain NULL bytes, every other argument is followed by one
+        self.leading_params = self.cmd_params[:-1]
+        self.final_param = self.cmd_params[-1] if self.cmd_params else None
+
+        # Fetches a tuple of every argument in order, in a single call
+        if len(self.cmd_params) > 1:
+            self.get_arguments = operator.itemgetter(*self.cmd_params)
+        else:
+            self.get_arguments = lambda cmd_args: tuple(cmd_args[param] for param in self.cmd_params)
+
+    def __repr__(self):
+        return '%s(cmd_type=%r, cmd_params=%r)' % (type(self).__name__, get_command_name(self.cmd_type), self.cmd_params)
+
+    def pack_segments(self, cmd_args, magic, trusted=False):
+        """Returns the header followed by the arguments and their separators, without copying any argument
+
+        Trusted callers name their arguments after GEARMAN_PARAMS_FOR_COMMAND, so we skip comparing the argument names
+        """
+        if not trusted and self.cmd_param_set != set(cmd_args):
+            raise ProtocolError('Received arguments did not match expected arguments: %r != %r' % (set(self.cmd_param_set), set(cmd_args)))
+
+        if self.final_param is None:
+            return [COMMAND_HEADER_STRUCT.pack(magic, self.cmd_type, 0)]
+
+        try:
+            segments = [None]
+            payload_size = 0
+            for param in self.leading_params:
+                argument = _binary_argument(cmd_args[param], cmd_args)
+
+                # Now check that all but the last argument are free of \0 as per the protocol spec.
+                if NULL_CHAR in argument:
+                    raise ProtocolError('Received arguments with NULL byte in non-final argument')
+
+                segments.append(argument)
+                segments.append(NULL_CHAR)
+                payload_size += len(argument) + 1
+
+            final_argument = _binary_argument(cmd_args[self.final_param], cmd_args)
+        except KeyError:
+            raise ProtocolError('Received arguments did not match expected arguments: %r != %r' % (set(self.cmd_param_set), set(cmd_args)))
+
+        segments.append(final_argument)
+        payload_size += len(final_argument)
+
+        # Pack the header in the !4sII format, ahead of the arguments
+        segments[0] = COMMAND_HEADER_STRUCT.pack(magic, self.cmd_type, payload_size)
+        return segments
+
+    def unpack(self, binary_payload):
+        """Returns the GearmanCommandRecord for the payload of a command"""
+        split_arguments = []
+
+        if self.cmd_params:
+            binary_payload = compat.array_to_bytes(binary_payload)
+            split_arguments = binary_payload.split(NULL_CHAR, len(self.cmd_params) - 1)
+        elif binary_payload:
+            raise ProtocolError('Expected no binary payload: %s' % get_command_name(self.cmd_type))
+
+        # This is a sanity check on the binary_payload.split() phase
+        # We should never be able to get here with any VALID gearman data
+        if len(split_arguments) != len(self.cmd_params):
+            raise ProtocolError('Received %d argument(s), expecting %d argument(s): %s' % (len(split_arguments), len(self.cmd_params), get_command_name(self.cmd_type)))
+
+        # The split arguments are already in protocol order, so they become the record as is
+        return tuple.__new__(self.record_class, split_arguments)
+
+
+def _binary_argument(value, cmd_args):
+    if isinstance(value, compat.binary_type):
+        return value
+    elif isinstance(value, str) or isinstance(value, compat.unicode_type):
+        # Postel's: Provide Python 2 => Python 3 compatibility.
+        return value.encode()
+    else:
+        raise ProtocolError('Received non-binary arguments: %r' % cmd_args)
+
+
+# GEARMAN_COMMAND_TEXT_COMMAND is a faked command that we use to support
+# server text-based commands, so it has no binary codec
+GEARMAN_CODEC_FOR_COMMAND = dict(
+    (cmd_type, BinaryCommandCodec(cmd_type, cmd_params))
+    for cmd_type, cmd_params in GEARMAN_PARAMS_FOR_COMMAND.items()
+    if cmd_type != GEARMAN_COMMAND_TEXT_COMMAND
+)
+
+
 def parse_binary_command(in_buffer, is_response=True):
-    """Parse data and return (command type, command arguments dict, command size)
+    """Parse data and return (command type, command arguments record, command size)
     or (None, None, data) if there's not enough data for a complete command.
     """
-    in_buffer_size = len(in_buffer)
-    magic = None
-    cmd_type = None
-    cmd_args = None
-    cmd_len = 0
-    expected_packet_size = None
+    return BinaryCommandDecoder(is_response=is_response).decode(in_buffer)
 
-    # If we don't have enough data to parse, error early
-    if in_buffer_size < COMMAND_HEADER_SIZE:
-        return cmd_type, cmd_args, cmd_len
 
-    # By default, we'll assume we're dealing with a gearman command
-    magic, cmd_type, cmd_len = struct.unpack('!4sII', in_buffer[:COMMAND_HEADER_SIZE])
+class BinaryCommandDecoder(object):
+    """Decodes binary commands from a stream that may arrive a few bytes at a time
+
+    Once a header has been validated, the decoder remembers it and waits until the
+    whole command is available, rather than parsing the header again on every call.
+    """
+    def __init__(self, is_response=True):
+        self.is_response = is_response
+        self.reset()
+
+    def __repr__(self):
+        return '%s(is_response=%r)' % (type(self).__name__, self.is_response)
+
+    def reset(self):
+        """Forget about any partially received command"""
+        self.pending_cmd_type = None
+        self.pending_codec = None
+
+        # Size of the pending command, including its header. 0 if we haven't seen a header yet
+        self.pending_packet_size = 0
+
+    def decode(self, in_buffer):
+        """Decode the command at the start of in_buffer, like parse_binary_command()
 
-    received_bad_response = is_response and bool(magic != MAGIC_RES_STRING)
-    received_bad_request = not is_response and bool(magic != MAGIC_REQ_STRING)
-    if received_bad_response or received_bad_request:
-        raise ProtocolError('Malformed Magic')
+        in_buffer must start at the same command boundary until that command is returned.
+        """
+        in_buffer_size = len(in_buffer)
+        if not self.pending_packet_size:
+            # If we don't have enough data to parse, error early
+            if in_buffer_size < COMMAND_HEADER_SIZE:
+                return None, None, 0
 
-    expected_cmd_params = GEARMAN_PARAMS_FOR_COMMAND.get(cmd_type)
+            self._decode_header(in_buffer)
 
-    # GEARMAN_COMMAND_TEXT_COMMAND is a faked command that we use to support
-    # server text-based commands
-    if (expected_cmd_params is None) or (cmd_type == GEARMAN_COMMAND_TEXT_COMMAND):
-        raise ProtocolError('Received unknown binary command: %s' % cmd_type)
+        # If everything indicates this is a valid command, we should check to see
+        # if we have enough stuff to read in our buffer
+        expected_packet_size = self.pending_packet_size
+        if in_buffer_size < expected_packet_size:
+            return None, None, 0
 
-    # If everything indicates this is a valid command, we should check to see
-    # if we have enough stuff to read in our buffer
-    expected_packet_size = COMMAND_HEADER_SIZE + cmd_len
-    if in_buffer_size < expected_packet_size:
-        return None, None, 0
+        cmd_type = self.pending_cmd_type
+        codec = self.pending_codec
+        self.reset()
 
-    binary_payload = in_buffer[COMMAND_HEADER_SIZE:expected_packet_size]
-    split_arguments = []
+        cmd_args = codec.unpack(in_buffer[COMMAND_HEADER_SIZE:expected_packet_size])
+        return cmd_type, cmd_args, expected_packet_size
 
-    if expected_cmd_params:
-        binary_payload = compat.array_to_bytes(binary_payload)
-        split_arguments = binary_payload.split(NULL_CHAR, len(expected_cmd_params) - 1)
-    elif binary_payload:
-        raise ProtocolError('Expected no binary payload: %s' % get_command_name(cmd_type))
+    def _decode_header(self, in_buffer):
+        # By default, we'll assume we're dealing with a gearman command
+        magic, cmd_type, cmd_len = COMMAND_HEADER_STRUCT.unpack_from(in_buffer)
 
-    # This is a sanity check on the binary_payload.split() phase
-    # We should never be able to get here with any VALID gearman data
-    if len(split_arguments) != len(expected_cmd_params):
-        raise ProtocolError('Received %d argument(s), expecting %d argument(s): %s' % (len(split_arguments), len(expected_cmd_params), get_command_name(cmd_type)))
+        received_bad_response = self.is_response and bool(magic != MAGIC_RES_STRING)
+        received_bad_request = not self.is_response and bool(magic != MAGIC_REQ_STRING)
+        if received_bad_response or received_bad_request:
+            raise ProtocolError('Malformed Magic')
 
-    # Iterate through the split arguments and assign them labels based on their order
-    cmd_args = dict((param_label, param_value) for param_label, param_value in zip(expected_cmd_params, split_arguments))
-    return cmd_type, cmd_args, expected_packet_size
+        codec = GEARMAN_CODEC_FOR_COMMAND.get(cmd_type)
+        if codec is None:
+            raise ProtocolError('Received unknown binary command: %s' % cmd_type)
+
+        self.pending_cmd_type = cmd_type
+        self.pending_codec = codec
+        self.pending_packet_size = COMMAND_HEADER_SIZE + cmd_len
 
 
 def pack_binary_command(cmd_type, cmd_args, is_response=False):
     """Packs the given command using the parameter ordering specified in GEARMAN_PARAMS_FOR_COMMAND.
     *NOTE* Expects that all arguments in cmd_args are already str's.
     """
-    expected_cmd_params = GEARMAN_PARAMS_FOR_COMMAND.get(cmd_type, None)
-    if expected_cmd_params is None or cmd_type == GEARMAN_COMMAND_TEXT_COMMAND:
+    return b''.join(pack_binary_command_segments(cmd_type, cmd_args, is_response=is_response))
+
+
+def pack_binary_command_segments(cmd_type, cmd_args, is_response=False, trusted=False):
+    """Packs the given command as a list of segments to be written back to back:
+    the header, then each argument with a NULL separator between them.
+
+    Only the header is newly allocated; arguments (such as large job data) are never copied.
+    Set trusted if the argument names are known to match GEARMAN_PARAMS_FOR_COMMAND.
+    """
+    codec = GEARMAN_CODEC_FOR_COMMAND.get(cmd_type)
+    if codec is None:
         raise ProtocolError('Received unknown binary command: %s' % get_command_name(cmd_type))
 
-    expected_parameter_set = set(expected_cmd_params)
-    received_parameter_set = set(cmd_args.keys())
-    if expected_parameter_set != received_parameter_set:
-        raise ProtocolError('Received arguments did not match expected arguments: %r != %r' % (expected_parameter_set, received_parameter_set))
+    # Select the right expected magic
+    if is_response:
+        magic = MAGIC_RES_STRING
+    else:
+        magic = MAGIC_REQ_STRING
+
+    return codec.pack_segments(cmd_args, magic, trusted=trusted)
+
 
+def pack_binary_commands(commands, is_response=False, trusted=False):
+    """Packs a sequence of (cmd_type, cmd_args) tuples into a single binary string
+
+    Meant for sending many small commands at once: each command's arguments are
+    joined and sized in one pass, then every command is written out in one allocation.
+    """
     # Select the right expected magic
     if is_response:
         magic = MAGIC_RES_STRING
     else:
         magic = MAGIC_REQ_STRING
 
-    for key, value in cmd_args.items():
-        if not isinstance(value, compat.binary_type):
-            if isinstance(value, str) or isinstance(value, compat.unicode_type):
-                # Postel's: Provide Python 2 => Python 3 compatibility.
-                cmd_args[key] = value.encode()
-            else:
-                raise ProtocolError('Received non-binary arguments: %r' % cmd_args)
+    pack_header = COMMAND_HEADER_STRUCT.pack
+    join_arguments = NULL_CHAR.join
+
+    packed_commands = []
+    for cmd_type, cmd_args in commands:
+        codec = GEARMAN_CODEC_FOR_COMMAND.get(cmd_type)
+        if codec is None:
+            raise ProtocolError('Received unknown binary command: %s' % get_command_name(cmd_type))
+
+        if not trusted and codec.cmd_param_set != compat.viewkeys(cmd_args):
+            raise ProtocolError('Received arguments did not match expected arguments: %r != %r' % (set(codec.cmd_param_set), set(cmd_args)))
 
-    data_items = [cmd_args[param] for param in expected_cmd_params]
+        try:
+            arguments = codec.get_arguments(cmd_args)
+            binary_payload = join_arguments(arguments)
+        except (KeyError, TypeError):
+            # Missing or non-binary arguments: take the slow path, which encodes or complains as needed
+            packed_commands.extend(codec.pack_segments(cmd_args, magic, trusted=trusted))
+            continue
 
-    # Now check that all but the last argument are free of \0 as per the protocol spec.
-    if any(b'\0' in argument for argument in data_items[:-1]):
-        raise ProtocolError('Received arguments with NULL byte in non-final argument')
+        # Only the separators may be NULL bytes, up until the last argument
+        if arguments and binary_payload.count(NULL_CHAR, 0, len(binary_payload) - len(arguments[-1])) != len(arguments) - 1:
+            raise ProtocolError('Received arguments with NULL byte in non-final argument')
 
-    binary_payload = NULL_CHAR.join(data_items)
+        packed_commands.append(pack_header(magic, cmd_type, len(binary_payload)))
+        packed_commands.append(binary_payload)
 
-    # Pack the header in the !4sII format then append the binary payload
-    payload_size = len(binary_payload)
-    packing_format = '!4sII%ds' % payload_size
-    return struct.pack(packing_format, magic, cmd_type, payload_size, binary_payload)
+    return b''.join(packed_commands)
 
 
 def parse_text_command(in_buffer):
@@ -279,15 +499,19 @@ def parse_text_command(in_buffer):
         return cmd_type, cmd_args, cmd_len
 
     text_command, in_buffer = compat.array_to_bytes(in_buffer).split(b'\n', 1)
+    cmd_type, cmd_args = parse_text_line(text_command)
+    cmd_len = len(text_command) + 1
+
+    return cmd_type, cmd_args, cmd_len
+
+
+def parse_text_line(text_command):
+    """Parse a single line of a text response, without its trailing newline, and return (command type, command arguments record)"""
     if NULL_CHAR in text_command:
         raise ProtocolError('Received unexpected character: %s' % text_command)
 
     # Fake gearman command "TEXT_COMMAND" used to process server admin client responses
-    cmd_type = GEARMAN_COMMAND_TEXT_COMMAND
-    cmd_args = dict(raw_text=text_command)
-    cmd_len = len(text_command) + 1
-
-    return cmd_type, cmd_args, cmd_len
+    return GEARMAN_COMMAND_TEXT_COMMAND, tuple.__new__(TEXT_COMMAND_RECORD, (text_command, ))
 
 
 def pack_text_command(cmd_type, cmd_args):
@@ -0,0 +1,166 @@
+# -*- encoding: utf-8
+
+import collections
+import sqlite3
+import threading
+import time
+import weakref
+
+from . import compat
+from gearman.unique import CONTENT_HASH, is_data_unique
+
+# Most results a ResultCache keeps by default
+DEFAULT_MAX_SIZE = 1024
+
+
+class ResultStore(object):
+    """Where a ResultCache keeps its results, as encoded byte strings
+
+    Stores decide which results to evict once they're full, and must forget results once they expire.  A ResultCache
+    only calls its store from one thread at a time
+    """
+    def get(self, cache_key):  # pragma: no cover
+        """Return the encoded result stored for cache_key, or None if there isn't one or it's expired"""
+        raise NotImplementedError
+
+    def set(self, cache_key, encoded_result, expires_at):  # pragma: no cover
+        """Store an encoded result until time.time() passes expires_at, or for as long as we have room if that's None"""
+        raise NotImplementedError
+
+
+class MemoryResultStore(ResultStore):
+    """Keeps up to max_size results in memory, evicting the least recently used"""
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        assert max_size > 0, "Expected room for at least 1 result"
+        self.max_size = max_size
+        self._results = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, cache_key):
+        cached_entry = self._results.pop(cache_key, None)
+        if cached_entry is None:
+            return None
+
+        encoded_result, expires_at = cached_entry
+        if expires_at is not None and expires_at <= time.time():
+            return None
+
+        # Reinsert the result, making it the most recently used
+        self._results[cache_key] = cached_entry
+        return encoded_result
+
+    def set(self, cache_key, encoded_result, expires_at):
+        self._results.pop(cache_key, None)
+        self._results[cache_key] = (encoded_result, expires_at)
+
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+
+class SqliteResultStore(ResultStore):
+    """Keeps up to max_size results in an SQLite database, evicting the least recently used
+
+    The database outlives the process, so results can be shared with other processes on the same machine
+    """
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        assert max_size > 0, "Expected room for at least 1 result"
+        self.max_size = max_size
+
+        # Our ResultCache makes sure we're only used from one thread at a time
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS gearman_results ('
+            'cache_key BLOB PRIMARY KEY, encoded_result BLOB, expires_at REAL, last_used REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS gearman_results_last_used ON gearman_results (last_used)')
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM gearman_results').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def get(self, cache_key):
+        cached_row = self._db.execute('SELECT encoded_result, expires_at FROM gearman_results WHERE cache_key = ?', (cache_key, )).fetchone()
+        if cached_row is None:
+            return None
+
+        encoded_result, expires_at = cached_row
+        current_time = time.time()
+        if expires_at is not None and expires_at <= current_time:
+            self._db.execute('DELETE FROM gearman_results WHERE cache_key = ?', (cache_key, ))
+            return None
+
+        self._db.execute('UPDATE gearman_results SET last_used = ? WHERE cache_key = ?', (current_time, cache_key))
+        return bytes(encoded_result)
+
+    def set(self, cache_key, encoded_result, expires_at):
+        self._db.execute(
+            'INSERT OR REPLACE INTO gearman_results (cache_key, encoded_result, expires_at, last_used) VALUES (?, ?, ?, ?)',
+            (cache_key, sqlite3.Binary(encoded_result), expires_at, time.time()))
+        self._db.execute(
+            'DELETE FROM gearman_results WHERE cache_key IN '
+            '(SELECT cache_key FROM gearman_results ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_size, ))
+
+
+class ResultCache(object):
+    """Caches the results of foreground jobs for tasks that always give the same result for the same job
+
+    Only caches the tasks in task_ttls, each for its number of seconds (or until evicted, if that's None).  Jobs are
+    looked up by their task and unique, or by their task and a hash of their data if they were submitted without a
+    unique.  Only successful results are cached: failures and exceptions aren't.
+
+    Safe to share between threads, and between clients that use the same data encoder
+    """
+    def __init__(self, task_ttls, store=None, max_size=DEFAULT_MAX_SIZE):
+        self.task_ttls = dict(task_ttls)
+        self.store = store if store is not None else MemoryResultStore(max_size)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # Requests we've missed, waiting to have their results cached
+        self._request_to_cache_key = weakref.WeakKeyDictionary()
+
+    def __repr__(self):
+        return '<%s tasks=%r hits=%d misses=%d>' % (type(self).__name__, sorted(self.task_ttls), self.hits, self.misses)
+
+    def caches_task(self, task):
+        return task in self.task_ttls
+
+    def lookup(self, current_request, encoded_data, unique_given=True):
+        """Return the encoded result we have cached for this request, or None and remember to cache its result
+
+        Jobs whose unique is '-' are looked up by their data, as gearmand would
+        """
+        current_job = current_request.job
+        if unique_given and not is_data_unique(current_job.unique):
+            cache_key = b'unique\x00' + compat.to_bytes(current_job.task) + b'\x00' + compat.to_bytes(current_job.unique)
+        else:
+            cache_key = b'data\x00' + compat.to_bytes(current_job.task) + b'\x00' + compat.to_bytes(CONTENT_HASH.generate_unique(current_job.task, encoded_data))
+
+        with self._lock:
+            encoded_result = self.store.get(cache_key)
+            if encoded_result is None:
+                self.misses += 1
+                self._request_to_cache_key[current_request] = cache_key
+            else:
+                self.hits += 1
+
+        return encoded_result
+
+    def on_request_complete(self, current_request, encoded_result):
+        """Cache the result of a request we missed"""
+        with self._lock:
+            cache_key = self._request_to_cache_key.pop(current_request, None)
+            if cache_key is None:
+                return
+
+            time_to_live = self.task_ttls[current_request.job.task]
+            expires_at = None if time_to_live is None else time.time() + time_to_live
+            self.store.set(cache_key, encoded_result, expires_at)
+
+    def is_waiting_on(self, current_request):
+        return current_request in self._request_to_cache_key
@@ -0,0 +1,90 @@
+# -*- encoding: utf-8
+
+import random
+import threading
+
+
+class RetryPolicy(object):
+    """Decides whether, and how soon, a GearmanClient resends a request it lost or couldn't send"""
+    # Whether to resubmit foreground jobs whose workers report WORK_FAIL
+    retry_failed_jobs = False
+
+    def get_retry_delay(self, current_request):  # pragma: no cover
+        """Return how many seconds to wait before resending current_request, or None to give up on it"""
+        raise NotImplementedError
+
+    def on_request_sent(self, current_request):
+        """Called whenever we send a request for the first time"""
+        pass
+
+
+class ExponentialBackoffRetryPolicy(RetryPolicy):
+    """Retries up to max_retries times, the nth retry waiting up to base_delay * 2 ** n seconds (capped at max_delay)"""
+    def __init__(self, max_retries=3, base_delay=0.1, max_delay=10.0, retry_failed_jobs=False, budget=None):
+        assert max_retries >= 0, "Expected a maximum of 0 or more retries"
+        assert 0.0 < base_delay <= max_delay, "Expected a base delay between 0 and max_delay"
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_failed_jobs = retry_failed_jobs
+        self.budget = budget
+
+    def __repr__(self):
+        return '<%s max_retries=%d base_delay=%r max_delay=%r retry_failed_jobs=%r>' % (
+            type(self).__name__, self.max_retries, self.base_delay, self.max_delay, self.retry_failed_jobs)
+
+    def get_retry_delay(self, current_request):
+        if current_request.retry_count >= self.max_retries:
+            return None
+
+        if self.budget is not None and not self.budget.withdraw():
+            return None
+
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** current_request.retry_count))
+
+    def on_request_sent(self, current_request):
+        if self.budget is not None:
+            self.budget.deposit()
+
+
+class RetryBudget(object):
+    """Allows one retry for every 1 / ratio requests sent, saving up to max_tokens of them"""
+    def __init__(self, ratio=0.1, max_tokens=10):
+        assert ratio > 0.0, "Expected requests to add to the budget"
+        assert max_tokens >= 1, "Expected room for at least 1 retry"
+        self.ratio = ratio
+        self.max_tokens = float(max_tokens)
+        self.tokens = float(max_tokens)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s ratio=%r tokens=%.1f/%.1f>' % (type(self).__name__, self.ratio, self.tokens, self.max_tokens)
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """Take a retry out of the budget, returning False if there isn't one left"""
+        with self._lock:
+            if self.tokens < 1.0:
+                return False
+
+            self.tokens -= 1.0
+            return True
+
+
+class DecorrelatedJitterBackoff(object):
+    """Spaces out a GearmanWorker's reconnects: each delay is random, between base_delay and 3 times the last one"""
+    def __init__(self, base_delay=1.0, max_delay=60.0):
+        assert 0.0 < base_delay <= max_delay, "Expected a base delay between 0 and max_delay"
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def __repr__(self):
+        return '<%s base_delay=%r max_delay=%r>' % (type(self).__name__, self.base_delay, self.max_delay)
+
+    def get_delay(self, previous_delay=None):
+        """Return how many seconds to wait before the next reconnect, given the delay we waited before the last one"""
+        previous_delay = previous_delay or self.base_delay
+        return min(self.max_delay, random.uniform(self.base_delay, previous_delay * 3))
@@ -0,0 +1,110 @@
+# -*- encoding: utf-8
+
+import bisect
+import hashlib
+import random
+import struct
+
+from . import compat
+
+# Points each server gets on a ConsistentHashRouter's ring, before weighting
+VIRTUAL_NODES = 160
+
+RING_POINT_STRUCT = struct.Struct('!Q')
+
+
+def _hash_to_ring_point(key):
+    return RING_POINT_STRUCT.unpack_from(hashlib.md5(key).digest())[0]
+
+
+def connection_address(current_connection):
+    """The "host:port" a connection is known by when routing"""
+    return '%s:%s' % (current_connection.gearman_host, current_connection.gearman_port)
+
+
+class ConnectionRouter(object):
+    """Decides which connections a GearmanClient tries for each request, instead of picking them at random"""
+    def route(self, current_request, connection_list):  # pragma: no cover
+        """Return the connections in connection_list to try for current_request, best first"""
+        raise NotImplementedError
+
+
+class ConsistentHashRouter(ConnectionRouter):
+    """Routes requests by their (task, unique) pair around a ring of servers, weighted by "host:port" in weights
+
+    Weights can be any positive number, whole or not.  Servers without one have a weight of 1
+    """
+    def __init__(self, virtual_nodes=VIRTUAL_NODES, weights=None):
+        assert virtual_nodes > 0, "Expected at least 1 virtual node per server"
+        self.virtual_nodes = virtual_nodes
+        self.weights = dict(weights or {})
+        assert all(weight > 0 for weight in self.weights.values()), "Expected positive server weights"
+
+        # Weights needn't be whole numbers, but every server gets at least one point on the ring
+        self._point_counts = dict(
+            (current_address, max(1, int(round(virtual_nodes * weight)))) for current_address, weight in self.weights.items()
+        )
+
+        self._ring_connections = None
+        self._ring_points = []
+        self._ring_owners = []
+
+    def route(self, current_request, connection_list):
+        if tuple(connection_list) != self._ring_connections:
+            self._build_ring(connection_list)
+
+        if not self._ring_points:
+            return []
+
+        request_key = compat.to_bytes(current_request.job.task) + b'\x00' + compat.to_bytes(current_request.job.unique)
+        ring_index = bisect.bisect(self._ring_points, _hash_to_ring_point(request_key))
+
+        # Walk clockwise around the ring, so each server's fallback is the same every time
+        routed_connections = []
+        seen_connections = set()
+        ring_size = len(self._ring_owners)
+        for ring_offset in range(ring_size):
+            current_connection = self._ring_owners[(ring_index + ring_offset) % ring_size]
+            if current_connection in seen_connections:
+                continue
+
+            seen_connections.add(current_connection)
+            routed_connections.append(current_connection)
+            if len(routed_connections) == len(self._ring_connections):
+                break
+
+        return routed_connections
+
+    def _build_ring(self, connection_list):
+        ring = []
+        for current_connection in connection_list:
+            current_address = connection_address(current_connection)
+            point_count = self._point_counts.get(current_address, self.virtual_nodes)
+            for point_index in range(point_count):
+                ring_point = _hash_to_ring_point(compat.to_bytes('%s-%d' % (current_address, point_index)))
+                ring.append((ring_point, current_address, current_connection))
+
+        # Break ties on the address rather than the connection, so every client builds the same ring
+        ring.sort(key=lambda ring_entry: ring_entry[:2])
+
+        self._ring_connections = tuple(connection_list)
+        self._ring_points = [ring_point for ring_point, _, _ in ring]
+        self._ring_owners = [current_connection for _, _, current_connection in ring]
+
+
+def connection_load(current_connection):
+    """How long a new request on this connection can expect to wait, relative to the other connections"""
+    return (current_connection.outstanding_requests + 1) * (current_connection.job_created_rtt or 0.0), current_connection.outstanding_requests
+
+
+class PowerOfTwoChoicesRouter(ConnectionRouter):
+    """Routes each request to the less loaded of two servers picked at random"""
+    def route(self, current_request, connection_list):
+        routed_connections = list(connection_list)
+        random.shuffle(routed_connections)
+
+        # Everything after our two choices is only there to fall back on, should we fail to connect to them
+        if len(routed_connections) > 1 and connection_load(routed_connections[1]) < connection_load(routed_connections[0]):
+            routed_connections[0], routed_connections[1] = routed_connections[1], routed_connections[0]
+
+        return routed_connections
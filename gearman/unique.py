@@ -0,0 +1,138 @@
+# -*- encoding: utf-8
+
+import hashlib
+import itertools
+import os
+import weakref
+
+from . import compat
+from gearman.constants import GEARMAN_UNIQUE_FROM_DATA, GEARMAN_UNIQUE_SIZE
+
+# Longest unique gearmand will take, leaving room for its NUL terminator
+MAX_UNIQUE_LENGTH = GEARMAN_UNIQUE_SIZE - 1
+
+# How many uniques a RandomPoolUniqueGenerator reads from os.urandom() at once
+RANDOM_POOL_SIZE = 4096
+
+# Whether we can have forked children reset their generators, rather than checking our pid for every unique
+FORK_HOOKS = hasattr(os, 'register_at_fork')
+
+# Generators that have to change what they hand out in forked children
+_fork_sensitive_generators = weakref.WeakSet()
+
+
+def is_data_unique(unique):
+    """Whether a job's unique is gearmand's '-', standing in for the job's data"""
+    return unique is not None and compat.to_bytes(unique) == GEARMAN_UNIQUE_FROM_DATA
+
+
+def _watch_for_forks(unique_generator):
+    _fork_sensitive_generators.add(unique_generator)
+
+
+def _reset_generators_after_fork():
+    for unique_generator in list(_fork_sensitive_generators):
+        unique_generator._reset_after_fork()
+
+
+if FORK_HOOKS:
+    os.register_at_fork(after_in_child=_reset_generators_after_fork)
+
+
+class UniqueGenerator(object):
+    """Makes up the unique for every job a GearmanClient submits without one"""
+    # Whether generate_unique() needs the job's data, encoded by the client's data_encoder
+    uses_data = False
+
+    def generate_unique(self, task, encoded_data):  # pragma: no cover
+        """Return a unique of at most MAX_UNIQUE_LENGTH characters for a job"""
+        raise NotImplementedError
+
+
+class RandomPoolUniqueGenerator(UniqueGenerator):
+    """Hex-encoded random uniques, read from os.urandom() RANDOM_POOL_SIZE at a time
+
+    Starts a fresh pool after a fork, so parent and child never hand out the same uniques
+    """
+    def __init__(self, unique_bytes=16, pool_size=RANDOM_POOL_SIZE):
+        assert 0 < unique_bytes * 2 <= MAX_UNIQUE_LENGTH, "Random uniques must fit in %d hex characters" % MAX_UNIQUE_LENGTH
+        self.unique_length = unique_bytes * 2
+        self.pool_size = pool_size
+        self._reset_after_fork()
+        _watch_for_forks(self)
+
+    def _reset_after_fork(self):
+        self._pool_pid = os.getpid()
+        self._pool = iter(())
+
+    def generate_unique(self, task, encoded_data):
+        if not FORK_HOOKS and self._pool_pid != os.getpid():
+            self._reset_after_fork()
+
+        # next() on a list iterator is atomic, so threads never share a unique.  Should two threads find the pool
+        # empty at once, they each read a whole new pool
+        try:
+            return next(self._pool)
+        except StopIteration:
+            random_hex = compat.to_hex(os.urandom(self.pool_size * self.unique_length // 2))
+            self._pool = iter([random_hex[pool_offset:pool_offset + self.unique_length] for pool_offset in range(0, len(random_hex), self.unique_length)])
+            return next(self._pool)
+
+
+class CounterUniqueGenerator(UniqueGenerator):
+    """Uniques made of a random prefix for this process, followed by a counter
+
+    Far cheaper than random uniques, and every one is different for as long as the process lives.  Starts a fresh
+    prefix after a fork
+    """
+    def __init__(self, prefix_bytes=8):
+        assert 0 < prefix_bytes * 2 + 17 <= MAX_UNIQUE_LENGTH, "Counter uniques must fit in %d characters" % MAX_UNIQUE_LENGTH
+        self.prefix_bytes = prefix_bytes
+        self._reset_after_fork()
+        _watch_for_forks(self)
+
+    def _reset_after_fork(self):
+        self._prefix_pid = os.getpid()
+        self._prefix = compat.to_hex(os.urandom(self.prefix_bytes)) + '-'
+
+        # next() on an itertools.count is atomic, so threads never share a number
+        self._counter = itertools.count(1)
+
+    def generate_unique(self, task, encoded_data):
+        if not FORK_HOOKS and self._prefix_pid != os.getpid():
+            self._reset_after_fork()
+
+        return '%s%x' % (self._prefix, next(self._counter))
+
+
+class ContentHashUniqueGenerator(UniqueGenerator):
+    """Uniques hashed from a job's task and data, so identical jobs get identical uniques
+
+    gearmand runs a job just once for every client waiting on the same task and unique, so this merges identical jobs
+    that are queued or running at the same time.  Uses blake2b where hashlib has it, and sha256 otherwise
+    """
+    uses_data = True
+
+    def __init__(self, digest_bytes=16):
+        assert 0 < digest_bytes * 2 <= MAX_UNIQUE_LENGTH, "Hashed uniques must fit in %d hex characters" % MAX_UNIQUE_LENGTH
+        self.digest_bytes = digest_bytes
+
+    def generate_unique(self, task, encoded_data):
+        task = compat.to_bytes(task)
+
+        # Length-prefix the task, so no task and data pair runs into another
+        content_hash = _new_content_hash(self.digest_bytes)
+        content_hash.update(compat.to_bytes('%d:' % len(task)))
+        content_hash.update(task)
+        content_hash.update(compat.to_bytes(encoded_data))
+        return compat.to_hex(content_hash.digest()[:self.digest_bytes])
+
+
+# Shared by anyone asking for content-addressed uniques for particular tasks or jobs, as it keeps no state
+CONTENT_HASH = ContentHashUniqueGenerator()
+
+
+def _new_content_hash(digest_bytes):
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b(digest_size=digest_bytes)
+    return hashlib.sha256()
@@ -2,25 +2,40 @@
 
 import random
 import sys
+import time
 
 from gearman.connection_manager import GearmanConnectionManager
+from gearman.retry import DecorrelatedJitterBackoff
 from gearman.worker_handler import GearmanWorkerCommandHandler
-from gearman.errors import ConnectionError
+from gearman.errors import ConnectionError, ServerUnavailable
 
 POLL_TIMEOUT_IN_SECONDS = 60.0
 
+# Longest we let a reconnect hold up our other connections, waiting on a server that doesn't answer
+RECONNECT_TIMEOUT = 1.0
+
 
 class GearmanWorker(GearmanConnectionManager):
     """
     GearmanWorker :: Interface to accept jobs from a Gearman server
+
+    Servers we can't reach are reconnected to in the background while we keep working, after delays from
+    reconnect_backoff (a DecorrelatedJitterBackoff by default).  Each reconnect gets reconnect_timeout seconds to
+    connect, as our other connections wait on it
     """
     command_handler_class = GearmanWorkerCommandHandler
 
-    def __init__(self, host_list=None):
+    def __init__(self, host_list=None, reconnect_backoff=None, reconnect_timeout=RECONNECT_TIMEOUT):
         super(GearmanWorker, self).__init__(host_list=host_list)
 
         self.randomized_connections = None
 
+        # Connections waiting in our deadline heap to be reconnected, and how long each waited for its last reconnect
+        self.reconnect_backoff = reconnect_backoff or DecorrelatedJitterBackoff()
+        self.reconnect_timeout = reconnect_timeout
+        self._reconnecting_connections = set()
+        self._connection_to_reconnect_delay = {}
+
         self.worker_abilities = {}
         self.worker_client_id = None
         self.command_handler_holding_job_lock = None
@@ -71,7 +86,6 @@ class GearmanWorker(GearmanConnectionManager):
     def work(self, poll_timeout=POLL_TIMEOUT_IN_SECONDS):
         """Loop indefinitely, complete tasks from all connections."""
         continue_working = True
-        worker_connections = []
 
         # We're going to track whether a previous call to our closure indicated
         # we were processing a job. This is just a list of possibly a single
@@ -91,36 +105,90 @@ class GearmanWorker(GearmanConnectionManager):
 
             return self.after_poll(any_activity)
 
-        # Shuffle our connections after the poll timeout
-        while continue_working:
-            worker_connections = self.establish_worker_connections()
-            continue_working = self.poll_connections_until_stopped(worker_connections, continue_while_connections_alive, timeout=poll_timeout)
+        try:
+            if not self.establish_worker_connections():
+                raise ServerUnavailable('Found no valid connections in list: %r' % self.connection_list)
+
+            # Our poll loop picks up connections as their reconnects succeed, and we shuffle them after the poll timeout
+            while continue_working:
+                continue_working = self.poll_connections_until_stopped(self.randomized_connections, continue_while_connections_alive, timeout=poll_timeout)
+                if continue_working:
+                    self.establish_worker_connections()
+        finally:
+            self._cancel_reconnects()
 
         # If we were kicked out of the worker loop, we should shutdown all our connections
-        for current_connection in worker_connections:
+        for current_connection in self.randomized_connections:
             current_connection.close()
 
     def shutdown(self):
         self.command_handler_holding_job_lock = None
+        self._cancel_reconnects()
         super(GearmanWorker, self).shutdown()
 
     ###############################################################
     ## Methods to override when dealing with connection polling ##
     ##############################################################
     def establish_worker_connections(self):
-        """Return a shuffled list of connections that are alive, and try to reconnect to dead connections if necessary."""
+        """Return a shuffled list of connections that are alive.  Tries connecting to any others, unless they're already
+        waiting to be reconnected, and schedules a reconnect for each one that fails."""
         self.randomized_connections = list(self.connection_list)
         random.shuffle(self.randomized_connections)
 
         output_connections = []
         for current_connection in self.randomized_connections:
+            if not current_connection.connected and current_connection not in self._reconnecting_connections:
+                self._connect_or_schedule_reconnect(current_connection)
+
+            if current_connection.connected:
+                output_connections.append(current_connection)
+
+        return output_connections
+
+    def _connect_or_schedule_reconnect(self, current_connection):
+        # Leave servers with open circuit breakers alone until their reconnects are due
+        if self.connection_available(current_connection):
             try:
-                valid_connection = self.establish_connection(current_connection)
-                output_connections.append(valid_connection)
+                self.establish_connection(current_connection, connect_timeout=self.reconnect_timeout)
+                return
             except ConnectionError:
                 pass
 
-        return output_connections
+        self._schedule_reconnect(current_connection)
+
+    def _schedule_reconnect(self, current_connection):
+        """Have our poll loop reconnect to current_connection's server once its backoff delay is up"""
+        # Delays keep growing until the server answers us, which resets its circuit breaker's failures
+        previous_delay = None
+        if current_connection.circuit_breaker.consecutive_failures > 1:
+            previous_delay = self._connection_to_reconnect_delay.get(current_connection)
+
+        reconnect_delay = self.reconnect_backoff.get_delay(previous_delay)
+        self._connection_to_reconnect_delay[current_connection] = reconnect_delay
+        self._reconnecting_connections.add(current_connection)
+        self.add_deadline(current_connection, time.time() + reconnect_delay)
+
+    def _cancel_reconnects(self):
+        for current_connection in self._reconnecting_connections:
+            self.cancel_deadline(current_connection)
+
+        self._reconnecting_connections.clear()
+
+    def on_deadline_expired(self, current_connection):
+        """Called by our poll loop once it's time to reconnect to a server we've lost.  The backoff has already spaced
+        these out, so we try the server whatever its circuit breaker says"""
+        self._reconnecting_connections.discard(current_connection)
+        if current_connection.connected:
+            return
+
+        try:
+            self.establish_connection(current_connection, connect_timeout=self.reconnect_timeout)
+        except ConnectionError:
+            self._schedule_reconnect(current_connection)
+
+    def awaiting_deadlines(self):
+        """Connections waiting to be reconnected may come back, even once we've no live connections"""
+        return bool(self._reconnecting_connections)
 
     def after_poll(self, any_activity):
         """Polling callback to notify any outside listeners whats going on with the GearmanWorker.
@@ -138,13 +206,16 @@ class GearmanWorker(GearmanConnectionManager):
         return True
 
     def handle_error(self, current_connection):
-        """If we discover that a connection has a problem, we better release the job lock"""
+        """If we discover that a connection has a problem, we better release the job lock, and reconnect later"""
         current_handler = self.connection_to_handler_map.get(current_connection)
         if current_handler:
             self.set_job_lock(current_handler, lock=False)
 
         super(GearmanWorker, self).handle_error(current_connection)
 
+        if current_connection not in self._reconnecting_connections:
+            self._schedule_reconnect(current_connection)
+
     #############################################################
     ## Public methods so Gearman jobs can send Gearman updates ##
     #############################################################
@@ -2,9 +2,13 @@
 
 import collections
 import random
+import select
+import socket
+import threading
+import time
 import unittest
 
-from gearman import compat
+from gearman import compat, protocol
 from gearman.connection import GearmanConnection
 from gearman.connection_manager import GearmanConnectionManager
 
@@ -30,7 +34,7 @@ class MockGearmanConnection(GearmanConnection):
         self._fail_on_read = False
         self._fail_on_write = False
 
-    def _create_client_socket(self):
+    def _create_client_socket(self, timeout=None):
         if self._fail_on_bind:
             self.throw_exception(message='mock bind failure')
 
@@ -132,3 +136,201 @@ class _GearmanAbstractTest(unittest.TestCase):
 
     def assert_commands_equal(self, cmd_type_actual, cmd_type_expected):
         assert get_command_name(cmd_type_actual) == get_command_name(cmd_type_expected)
+
+
+def run_until_complete(coroutine):
+    """Run a coroutine on an event loop of its own"""
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class FakeGearmanServer(object):
+    """A tiny in-process job server for tests that need real sockets
+
+    Every submitted job is accepted straight away, then completes with its data reversed, fails if its data is b'fail', or
+    never finishes if its data is b'hang'.
+    Jobs handed to queue_job() go to the workers instead, and whatever they send back is kept in worker_updates
+
+    With completions_per_tick set, jobs finish a few at a time rather than all at once, like they would with real workers.
+    With response_delay set, the server waits that many seconds before answering anything, like a badly degraded one.
+    With fail_jobs set, every foreground job fails, as though all its workers were broken.  With drop_connections set,
+    the server hangs up on that many connections as soon as they send it anything
+    """
+    BACKGROUND_SUBMIT_COMMANDS = (protocol.GEARMAN_COMMAND_SUBMIT_JOB_BG, protocol.GEARMAN_COMMAND_SUBMIT_JOB_HIGH_BG, protocol.GEARMAN_COMMAND_SUBMIT_JOB_LOW_BG)
+
+    COMMAND_HANDLERS = {
+        protocol.GEARMAN_COMMAND_ECHO_REQ: '_handle_echo_req',
+        protocol.GEARMAN_COMMAND_GET_STATUS: '_handle_get_status',
+        protocol.GEARMAN_COMMAND_PRE_SLEEP: '_handle_pre_sleep',
+        protocol.GEARMAN_COMMAND_GRAB_JOB_UNIQ: '_handle_grab_job_uniq',
+        protocol.GEARMAN_COMMAND_SUBMIT_JOB: '_handle_submit_job',
+        protocol.GEARMAN_COMMAND_SUBMIT_JOB_HIGH: '_handle_submit_job',
+        protocol.GEARMAN_COMMAND_SUBMIT_JOB_LOW: '_handle_submit_job',
+        protocol.GEARMAN_COMMAND_SUBMIT_JOB_BG: '_handle_submit_job',
+        protocol.GEARMAN_COMMAND_SUBMIT_JOB_HIGH_BG: '_handle_submit_job',
+        protocol.GEARMAN_COMMAND_SUBMIT_JOB_LOW_BG: '_handle_submit_job',
+    }
+
+    def __init__(self, completions_per_tick=None, response_delay=0.0, fail_jobs=False, drop_connections=0):
+        self.listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listening_socket.bind(('127.0.0.1', 0))
+        self.listening_socket.listen(128)
+        self.address = '127.0.0.1:%d' % self.listening_socket.getsockname()[1]
+
+        self.completions_per_tick = completions_per_tick
+        self.response_delay = response_delay
+        self.fail_jobs = fail_jobs
+        self.drop_connections = drop_connections
+        self.submitted_jobs = 0
+        self.connection_count = 0
+        self.open_connections = 0
+        self.worker_updates = collections.deque()
+        self._queued_jobs = collections.deque()
+        self._queued_job_count = 0
+        self._sleeping_workers = set()
+        self._pending_completions = collections.deque()
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def queue_job(self, task, data, unique=b''):
+        """Hand a job to the next worker that grabs one, and return its handle"""
+        self._queued_job_count += 1
+        job_handle = b'H:queued:%d' % self._queued_job_count
+        self._queued_jobs.append((job_handle, task, unique, data))
+        return job_handle
+
+    def stop(self):
+        if not self._running:
+            return
+
+        self._running = False
+        self._thread.join()
+        self.listening_socket.close()
+
+    def _serve(self):
+        decoders = {}
+        buffers = {}
+        try:
+            while self._running:
+                readable, _, _ = select.select([self.listening_socket] + list(decoders), [], [], 0.01)
+                for current_socket in readable:
+                    if current_socket is self.listening_socket:
+                        self._accept_connection(decoders, buffers)
+                    else:
+                        self._read_from_connection(current_socket, decoders, buffers)
+
+                if self._pending_completions:
+                    self._send_pending_completions(decoders)
+
+                if self._queued_jobs and self._sleeping_workers:
+                    self._wake_sleeping_workers(decoders)
+        finally:
+            for current_socket in decoders:
+                current_socket.close()
+
+    def _accept_connection(self, decoders, buffers):
+        client_socket, _ = self.listening_socket.accept()
+        decoders[client_socket] = protocol.BinaryCommandDecoder(is_response=False)
+        buffers[client_socket] = b''
+        self.connection_count += 1
+        self.open_connections += 1
+
+    def _read_from_connection(self, current_socket, decoders, buffers):
+        data = current_socket.recv(65536)
+        if data and self.drop_connections:
+            self.drop_connections -= 1
+            data = b''
+
+        if not data:
+            del decoders[current_socket], buffers[current_socket]
+            current_socket.close()
+            self.open_connections -= 1
+            return
+
+        buffers[current_socket] += data
+        buffers[current_socket] = self._handle_commands(current_socket, decoders[current_socket], buffers[current_socket])
+
+    def _wake_sleeping_workers(self, decoders):
+        """Wake up sleeping workers whenever there are jobs for them to grab"""
+        for current_socket in self._sleeping_workers:
+            if current_socket in decoders:
+                current_socket.sendall(protocol.pack_binary_command(protocol.GEARMAN_COMMAND_NOOP, {}, is_response=True))
+        self._sleeping_workers.clear()
+
+    def _send_pending_completions(self, decoders):
+        responses_by_socket = collections.defaultdict(list)
+        for _ in range(min(self.completions_per_tick, len(self._pending_completions))):
+            current_socket, response = self._pending_completions.popleft()
+            responses_by_socket[current_socket].append(response)
+
+        for current_socket, responses in responses_by_socket.items():
+            if current_socket in decoders:
+                current_socket.sendall(protocol.pack_binary_commands(responses, is_response=True))
+
+    def _handle_commands(self, current_socket, decoder, received_data):
+        responses = []
+        received_view = memoryview(received_data)
+        read_offset = 0
+        while read_offset < len(received_data):
+            cmd_type, cmd_args, cmd_len = decoder.decode(received_view[read_offset:])
+            if not cmd_len:
+                break
+
+            read_offset += cmd_len
+
+            # Everything we don't answer comes from workers, setting up or reporting back on their jobs
+            command_handler_name = self.COMMAND_HANDLERS.get(cmd_type, '_handle_worker_update')
+            getattr(self, command_handler_name)(current_socket, cmd_type, cmd_args, responses)
+
+        if responses and self.response_delay:
+            time.sleep(self.response_delay)
+
+        if responses:
+            current_socket.sendall(protocol.pack_binary_commands(responses, is_response=True))
+        return received_data[read_offset:]
+
+    def _handle_echo_req(self, current_socket, cmd_type, cmd_args, responses):
+        responses.append((protocol.GEARMAN_COMMAND_ECHO_RES, {'data': cmd_args['data']}))
+
+    def _handle_get_status(self, current_socket, cmd_type, cmd_args, responses):
+        responses.append((protocol.GEARMAN_COMMAND_STATUS_RES, {'job_handle': cmd_args['job_handle'], 'known': b'1', 'running': b'0', 'numerator': b'0', 'denominator': b'0'}))
+
+    def _handle_pre_sleep(self, current_socket, cmd_type, cmd_args, responses):
+        self._sleeping_workers.add(current_socket)
+
+    def _handle_grab_job_uniq(self, current_socket, cmd_type, cmd_args, responses):
+        self._sleeping_workers.discard(current_socket)
+        try:
+            job_handle, task, unique, data = self._queued_jobs.popleft()
+        except IndexError:
+            responses.append((protocol.GEARMAN_COMMAND_NO_JOB, {}))
+        else:
+            responses.append((protocol.GEARMAN_COMMAND_JOB_ASSIGN_UNIQ, {'job_handle': job_handle, 'task': task, 'unique': unique, 'data': data}))
+
+    def _handle_worker_update(self, current_socket, cmd_type, cmd_args, responses):
+        self.worker_updates.append((cmd_type, cmd_args))
+
+    def _handle_submit_job(self, current_socket, cmd_type, cmd_args, responses):
+        self.submitted_jobs += 1
+        job_handle = b'H:fake:%d' % self.submitted_jobs
+        responses.append((protocol.GEARMAN_COMMAND_JOB_CREATED, {'job_handle': job_handle}))
+        if cmd_type in self.BACKGROUND_SUBMIT_COMMANDS or cmd_args['data'] == b'hang':
+            return
+
+        if cmd_args['data'] == b'fail' or self.fail_jobs:
+            completion = (protocol.GEARMAN_COMMAND_WORK_FAIL, {'job_handle': job_handle})
+        else:
+            completion = (protocol.GEARMAN_COMMAND_WORK_COMPLETE, {'job_handle': job_handle, 'data': cmd_args['data'][::-1]})
+
+        if self.completions_per_tick:
+            self._pending_completions.append((current_socket, completion))
+        else:
+            responses.append(completion)
@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+
+from tests._core_testing import FakeGearmanServer
+
+# These tests need asyncio and concurrent.futures, which came with Python 3
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.extend(['test_asyncio_client.py', 'test_asyncio_worker.py', 'test_concurrent_client.py'])
+
+
+@pytest.fixture
+def start_server():
+    """Starts FakeGearmanServers with any of its options (fail_jobs, response_delay...), and stops them after the test"""
+    servers = []
+
+    def start_server(**kwargs):
+        server = FakeGearmanServer(**kwargs)
+        servers.append(server)
+        return server
+
+    yield start_server
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def server(start_server):
+    return start_server()
@@ -241,6 +241,17 @@ class CommandHandlerStateMachineTest(_StateMachineTest):
             {"handle": "bar", "queued": 4, "canceled": 5, "enabled": 6},
         )
 
+    def test_show_jobs_received_as_binary(self):
+        self.send_server_command(GEARMAN_SERVER_COMMAND_SHOW_JOBS)
+
+        # Lines come off the wire as binary strings
+        self.recv_server_response(b'foo\t1\t2\t3')
+        self.recv_server_response(b'.')
+        server_response = self.pop_response(GEARMAN_SERVER_COMMAND_SHOW_JOBS)
+        assert server_response == (
+            {"handle": "foo", "queued": 1, "canceled": 2, "enabled": 3},
+        )
+
     def test_show_unique_jobs_empty(self):
         self.send_server_command(GEARMAN_SERVER_COMMAND_SHOW_UNIQUE_JOBS)
 
@@ -0,0 +1,129 @@
+# -*- encoding: utf-8
+
+import asyncio
+
+import pytest
+
+from gearman.asyncio_client import AsyncGearmanClient
+from gearman.constants import JOB_COMPLETE, JOB_CREATED, JOB_FAILED
+from gearman.errors import InvalidClientState, ServerUnavailable
+from gearman.retry import ExponentialBackoffRetryPolicy
+from tests._core_testing import run_until_complete
+
+
+def run_with_client(server, client_coroutine):
+    async def run():
+        client = AsyncGearmanClient([server.address])
+        try:
+            return await asyncio.wait_for(client_coroutine(client), 10.0)
+        finally:
+            client.shutdown()
+
+    return run_until_complete(run())
+
+
+def test_submit_job(server):
+    async def submit(client):
+        return await client.submit_job('reverse', b'hello')
+
+    completed_request = run_with_client(server, submit)
+    assert completed_request.state == JOB_COMPLETE
+    assert completed_request.result == b'olleh'
+    assert not completed_request.timed_out
+
+
+def test_failed_and_background_jobs(server):
+    async def submit(client):
+        failed_request = await client.submit_job('reverse', b'fail')
+        background_request = await client.submit_job('reverse', b'hello', background=True)
+        return failed_request, background_request
+
+    failed_request, background_request = run_with_client(server, submit)
+    assert failed_request.state == JOB_FAILED
+    assert background_request.state == JOB_CREATED
+
+
+def test_wait_until_complete_later(server):
+    async def submit(client):
+        accepted_request = await client.submit_job('reverse', b'hello', wait_until_complete=False)
+        accepted_state = accepted_request.state
+        completed_requests = await client.wait_until_jobs_completed([accepted_request])
+        return accepted_state, completed_requests[0]
+
+    accepted_state, completed_request = run_with_client(server, submit)
+    assert accepted_state in (JOB_CREATED, JOB_COMPLETE)
+    assert completed_request.state == JOB_COMPLETE
+
+
+def test_many_outstanding_jobs_share_one_connection(server):
+    async def submit(client):
+        return await asyncio.gather(*[client.submit_job('reverse', b'%d' % job_index) for job_index in range(5000)])
+
+    completed_requests = run_with_client(server, submit)
+    assert set(current_request.result for current_request in completed_requests) == set((b'%d' % job_index)[::-1] for job_index in range(5000))
+    assert server.connection_count == 1
+
+
+def test_get_job_status(server):
+    async def fetch_status(client):
+        background_request = await client.submit_job('reverse', b'hello', background=True)
+        return await client.get_job_status(background_request)
+
+    status_request = run_with_client(server, fetch_status)
+    assert not status_request.timed_out
+    assert status_request.status['handle'] == status_request.job.handle
+
+
+def test_unreachable_server(server):
+    server.stop()
+
+    async def submit(client):
+        return await client.submit_job('reverse', b'hello')
+
+    with pytest.raises(ServerUnavailable):
+        run_with_client(server, submit)
+
+
+def test_identical_jobs_share_one_request(server):
+    async def submit(client):
+        return await asyncio.gather(*[client.submit_job('reverse', b'hello', unique='same') for _ in range(10)])
+
+    completed_requests = run_with_client(server, submit)
+    assert server.submitted_jobs == 1
+    assert len(set(completed_requests)) == 1
+    assert completed_requests[0].result == b'olleh'
+
+
+def test_jobs_time_out_on_their_own_deadlines(server):
+    async def submit(client):
+        return await client.submit_multiple_jobs([dict(task='reverse', data=b'hang', timeout=0.05), dict(task='reverse', data=b'abc')], poll_timeout=5.0)
+
+    hung_request, quick_request = run_with_client(server, submit)
+    assert hung_request.timed_out and hung_request.deadline_expired
+    assert hung_request.state == JOB_CREATED
+    assert quick_request.result == b'cba' and not quick_request.timed_out
+
+
+def test_failed_jobs_are_retried_on_another_server(start_server):
+    servers = [start_server(fail_jobs=True), start_server()]
+
+    async def submit():
+        retry_policy = ExponentialBackoffRetryPolicy(max_retries=1, base_delay=0.01, retry_failed_jobs=True)
+        client = AsyncGearmanClient([server.address for server in servers], retry_policy=retry_policy)
+        try:
+            return await asyncio.wait_for(client.submit_multiple_jobs([dict(task='reverse', data=b'job %d' % job_index) for job_index in range(20)]), 10.0)
+        finally:
+            client.shutdown()
+
+    completed_requests = run_until_complete(submit())
+    assert all(current_request.state == JOB_COMPLETE for current_request in completed_requests)
+    assert servers[1].submitted_jobs == 20
+
+
+def test_polling_points_callers_at_the_asyncio_api(server):
+    client = AsyncGearmanClient([server.address])
+    try:
+        with pytest.raises(InvalidClientState, match='asyncio API'):
+            client.poll_connections_until_stopped(client.connection_list, lambda any_activity: False)
+    finally:
+        client.shutdown()
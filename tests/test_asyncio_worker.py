@@ -0,0 +1,137 @@
+# -*- encoding: utf-8
+
+import asyncio
+import time
+
+from gearman import protocol
+from gearman.asyncio_worker import AsyncGearmanWorker
+from gearman.retry import DecorrelatedJitterBackoff
+from tests._core_testing import FakeGearmanServer, run_until_complete
+
+
+class StoppingWorker(AsyncGearmanWorker):
+    """Stops working once it has finished jobs_to_run jobs"""
+    def __init__(self, host_list, jobs_to_run, **kwargs):
+        super(StoppingWorker, self).__init__(host_list, **kwargs)
+        self.jobs_to_run = jobs_to_run
+
+    def after_job(self):
+        self.jobs_to_run -= 1
+        return self.jobs_to_run > 0
+
+
+def run_worker(worker, timeout=10.0):
+    async def run():
+        try:
+            await asyncio.wait_for(worker.work(poll_timeout=1.0), timeout)
+        finally:
+            worker.shutdown()
+
+    run_until_complete(run())
+
+
+def worker_results(server, cmd_type):
+    # Workers hang up as soon as they're done, so wait for the server to read everything they sent first
+    stop_time = time.time() + 5.0
+    while server.open_connections and time.time() < stop_time:
+        time.sleep(0.001)
+
+    return dict((cmd_args['job_handle'], cmd_args) for update_type, cmd_args in server.worker_updates if update_type == cmd_type)
+
+
+def test_coroutine_task_callbacks(server):
+    job_handles = [server.queue_job(b'reverse', b'hello %d' % job_index) for job_index in range(3)]
+
+    async def reverse(worker, job):
+        await asyncio.sleep(0)
+        return job.data[::-1]
+
+    worker = StoppingWorker([server.address], jobs_to_run=3)
+    worker.register_task(b'reverse', reverse)
+    run_worker(worker)
+
+    completed_jobs = worker_results(server, protocol.GEARMAN_COMMAND_WORK_COMPLETE)
+    assert [completed_jobs[job_handle]['data'] for job_handle in job_handles] == [b'0 olleh', b'1 olleh', b'2 olleh']
+
+
+def test_failing_task_callbacks(server):
+    job_handle = server.queue_job(b'explode', b'hello')
+
+    async def explode(worker, job):
+        raise ValueError(job.data)
+
+    worker = StoppingWorker([server.address], jobs_to_run=1)
+    worker.register_task(b'explode', explode)
+    run_worker(worker)
+
+    assert job_handle in worker_results(server, protocol.GEARMAN_COMMAND_WORK_FAIL)
+
+
+def test_jobs_run_concurrently(server):
+    job_count = 10
+    for job_index in range(job_count):
+        server.queue_job(b'wait', b'%d' % job_index)
+
+    running_jobs = []
+
+    async def wait_for_every_job(worker, job):
+        # Only finishes once every job is running at the same time
+        running_jobs.append(job)
+        while len(running_jobs) < job_count:
+            await asyncio.sleep(0.01)
+        return job.data
+
+    worker = StoppingWorker([server.address], jobs_to_run=job_count)
+    worker.max_concurrent_jobs = job_count
+    worker.register_task(b'wait', wait_for_every_job)
+    run_worker(worker)
+
+    assert len(worker_results(server, protocol.GEARMAN_COMMAND_WORK_COMPLETE)) == job_count
+
+
+def test_max_concurrent_jobs(server):
+    for job_index in range(6):
+        server.queue_job(b'count', b'%d' % job_index)
+
+    running_jobs = set()
+    most_running = []
+
+    async def count_running(worker, job):
+        running_jobs.add(job.handle)
+        most_running.append(len(running_jobs))
+        await asyncio.sleep(0.01)
+        running_jobs.discard(job.handle)
+        return job.data
+
+    worker = StoppingWorker([server.address], jobs_to_run=6)
+    worker.max_concurrent_jobs = 2
+    worker.register_task(b'count', count_running)
+    run_worker(worker)
+
+    assert max(most_running) <= 2
+    assert len(worker_results(server, protocol.GEARMAN_COMMAND_WORK_COMPLETE)) == 6
+
+
+def test_lost_servers_are_reconnected_in_the_background():
+    dropping_server, healthy_server = servers = [FakeGearmanServer(drop_connections=1), FakeGearmanServer()]
+    try:
+        for current_server in servers:
+            for job_index in range(3):
+                current_server.queue_job(b'reverse', b'job %d' % job_index)
+
+        async def reverse(worker, job):
+            return job.data[::-1]
+
+        worker = StoppingWorker([current_server.address for current_server in servers], jobs_to_run=6,
+                                reconnect_backoff=DecorrelatedJitterBackoff(base_delay=0.05, max_delay=0.1))
+        worker.register_task(b'reverse', reverse)
+        run_worker(worker)
+
+        # Each server got its jobs done, and the one that hung up on us only saw us come back once
+        assert len(worker_results(dropping_server, protocol.GEARMAN_COMMAND_WORK_COMPLETE)) == 3
+        assert len(worker_results(healthy_server, protocol.GEARMAN_COMMAND_WORK_COMPLETE)) == 3
+        assert dropping_server.connection_count == 2
+        assert healthy_server.connection_count == 1
+    finally:
+        for current_server in servers:
+            current_server.stop()
@@ -0,0 +1,52 @@
+# -*- encoding: utf-8
+
+from gearman.circuit_breaker import CircuitBreaker
+from gearman.constants import CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+
+
+def test_breaker_opens_after_enough_failures_in_a_row():
+    circuit_breaker = CircuitBreaker(failure_threshold=3, probe_interval=1.0)
+    circuit_breaker.record_failure(current_time=100.0)
+    circuit_breaker.record_failure(current_time=100.0)
+    assert circuit_breaker.state == CIRCUIT_CLOSED
+    assert circuit_breaker.allows_attempt(current_time=100.0)
+
+    # Hearing back from the server wipes the slate clean
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure(current_time=100.0)
+    circuit_breaker.record_failure(current_time=100.0)
+    assert circuit_breaker.state == CIRCUIT_CLOSED
+
+    circuit_breaker.record_failure(current_time=100.0)
+    assert circuit_breaker.state == CIRCUIT_OPEN
+    assert not circuit_breaker.allows_attempt(current_time=100.5)
+    assert circuit_breaker.allows_attempt(current_time=101.0)
+
+
+def test_breaker_lets_one_probe_through_at_a_time():
+    circuit_breaker = CircuitBreaker(failure_threshold=1, probe_interval=1.0)
+    circuit_breaker.record_failure(current_time=100.0)
+
+    circuit_breaker.record_attempt(current_time=101.0)
+    assert circuit_breaker.state == CIRCUIT_HALF_OPEN
+    assert not circuit_breaker.allows_attempt(current_time=101.5)
+
+    # A probe that never comes back doesn't keep the server shut out for good
+    assert circuit_breaker.allows_attempt(current_time=102.0)
+
+
+def test_half_open_breaker_closes_on_success_and_reopens_on_failure():
+    circuit_breaker = CircuitBreaker(failure_threshold=5, probe_interval=2.0)
+    for _ in range(5):
+        circuit_breaker.record_failure(current_time=100.0)
+
+    circuit_breaker.record_attempt(current_time=102.0)
+    circuit_breaker.record_failure(current_time=102.0)
+    assert circuit_breaker.state == CIRCUIT_OPEN
+    assert not circuit_breaker.allows_attempt(current_time=103.0)
+
+    circuit_breaker.record_attempt(current_time=104.0)
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CIRCUIT_CLOSED
+    assert circuit_breaker.consecutive_failures == 0
+    assert circuit_breaker.allows_attempt(current_time=104.0)
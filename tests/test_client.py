@@ -1,16 +1,20 @@
 # -*- encoding: utf-8
 
 import collections
+import time
 
 import pytest
 
+from gearman.circuit_breaker import CircuitBreaker
 from gearman.client import GearmanClient
 from gearman.client_handler import GearmanClientCommandHandler
 
-from gearman.constants import PRIORITY_NONE, PRIORITY_HIGH, PRIORITY_LOW, JOB_UNKNOWN, JOB_PENDING, JOB_CREATED, JOB_FAILED, JOB_COMPLETE
-from gearman.errors import ExceededConnectionAttempts, ServerUnavailable, InvalidClientState
+from gearman.constants import PRIORITY_NONE, PRIORITY_HIGH, PRIORITY_LOW, JOB_UNKNOWN, JOB_PENDING, JOB_CREATED, JOB_FAILED, JOB_COMPLETE, \
+    CIRCUIT_OPEN
+from gearman.errors import ConnectionError, ExceededConnectionAttempts, ServerUnavailable, InvalidClientState
 from gearman.protocol import submit_cmd_for_background_priority, GEARMAN_COMMAND_STATUS_RES, GEARMAN_COMMAND_GET_STATUS, GEARMAN_COMMAND_JOB_CREATED, \
-    GEARMAN_COMMAND_WORK_STATUS, GEARMAN_COMMAND_WORK_FAIL, GEARMAN_COMMAND_WORK_COMPLETE, GEARMAN_COMMAND_WORK_DATA, GEARMAN_COMMAND_WORK_WARNING
+    GEARMAN_COMMAND_WORK_STATUS, GEARMAN_COMMAND_WORK_FAIL, GEARMAN_COMMAND_WORK_COMPLETE, GEARMAN_COMMAND_WORK_DATA, GEARMAN_COMMAND_WORK_WARNING, \
+    GEARMAN_COMMAND_WORK_EXCEPTION
 
 from tests._core_testing import (
     _GearmanAbstractTest,
@@ -112,6 +116,32 @@ class ClientTest(_GearmanAbstractTest):
         with pytest.raises(ServerUnavailable):
             self.connection_manager.establish_request_connection(current_request)
 
+    def test_establish_request_connection_skips_open_circuits(self):
+        broken_connection = MockGearmanConnection()
+        broken_connection._fail_on_bind = True
+        broken_connection.circuit_breaker = CircuitBreaker(failure_threshold=2, probe_interval=60.0)
+
+        good_connection = MockGearmanConnection()
+        self.connection_manager.connection_list = [broken_connection, good_connection]
+
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                self.connection_manager.establish_connection(broken_connection)
+        assert broken_connection.circuit_breaker.state == CIRCUIT_OPEN
+
+        # We go straight to the good connection, without trying to connect to the broken one
+        broken_connection.connect = None
+        for _ in range(10):
+            current_request = self.generate_job_request(submitted=False, accepted=False)
+            assert self.connection_manager.establish_request_connection(current_request) is good_connection
+
+        # Once every breaker is open, there's nothing left to try
+        good_connection.close()
+        good_connection.circuit_breaker.state = CIRCUIT_OPEN
+        good_connection.circuit_breaker.next_probe_time = float('inf')
+        with pytest.raises(ServerUnavailable):
+            self.connection_manager.establish_request_connection(self.generate_job_request(submitted=False, accepted=False))
+
     def test_auto_retry_behavior(self):
         current_request = self.generate_job_request(submitted=False, accepted=False)
 
@@ -239,6 +269,20 @@ class ClientTest(_GearmanAbstractTest):
         assert not job_request.complete
         assert job_request.timed_out
 
+    def test_submit_stream_timeout(self):
+        job_dictionaries = [self.generate_job().to_dict() for _ in range(3)]
+
+        def job_failed_submission(rx_conns, wr_conns, ex_conns):
+            return rx_conns, wr_conns, ex_conns
+
+        self.connection_manager.handle_connection_activity = job_failed_submission
+        timed_out_requests = list(self.connection_manager.submit_stream(job_dictionaries, window=2, poll_timeout=0.01))
+
+        assert len(timed_out_requests) == 3
+        for current_request in timed_out_requests:
+            assert current_request.state == JOB_PENDING
+            assert current_request.timed_out
+
     def test_wait_for_multiple_jobs_to_complete_or_timeout(self):
         completed_request = self.generate_job_request()
         failed_request = self.generate_job_request()
@@ -279,6 +323,104 @@ class ClientTest(_GearmanAbstractTest):
         assert finished_timeout_request.timed_out
         assert finished_timeout_request.job.handle in self.command_handler.handle_to_request_map
 
+    def test_iter_completed_yields_jobs_as_they_finish(self):
+        slow_request = self.generate_job_request()
+        failed_request = self.generate_job_request()
+        exception_request = self.generate_job_request()
+        completed_request = self.generate_job_request()
+
+        # One job finishes on each wakeup, and the slow one never does
+        job_updates = collections.deque([
+            (GEARMAN_COMMAND_WORK_COMPLETE, dict(job_handle=completed_request.job.handle, data=b'12345')),
+            (GEARMAN_COMMAND_WORK_FAIL, dict(job_handle=failed_request.job.handle)),
+            (GEARMAN_COMMAND_WORK_EXCEPTION, dict(job_handle=exception_request.job.handle, data=b'oops')),
+        ])
+
+        def single_job_update(rx_conns, wr_conns, ex_conns):
+            if job_updates:
+                cmd_type, cmd_args = job_updates.popleft()
+                self.command_handler.recv_command(cmd_type, **cmd_args)
+
+            return rx_conns, wr_conns, ex_conns
+
+        self.connection_manager.handle_connection_activity = single_job_update
+
+        finished_requests = []
+        for current_request in self.connection_manager.iter_completed([slow_request, failed_request, exception_request, completed_request], timeout=0.05):
+            # Nothing else has happened by the time each request is handed over
+            assert len(job_updates) == 2 - len(finished_requests) or current_request is slow_request
+            finished_requests.append(current_request)
+
+        assert finished_requests == [completed_request, failed_request, exception_request, slow_request]
+        assert completed_request.state == JOB_COMPLETE
+        assert failed_request.state == JOB_FAILED
+        assert exception_request.exception == b'oops'
+        assert [current_request.timed_out for current_request in finished_requests] == [False, False, False, True]
+
+    def test_wait_loops_only_check_updated_requests(self):
+        job_requests = [self.generate_job_request() for _ in range(3)]
+        checked_requests = []
+
+        def complete_one_job(rx_conns, wr_conns, ex_conns):
+            current_request = job_requests[len(checked_requests)]
+            checked_requests.append(current_request)
+            self.command_handler.recv_command(GEARMAN_COMMAND_WORK_COMPLETE, job_handle=current_request.job.handle, data=b'12345')
+            return rx_conns, wr_conns, ex_conns
+
+        self.connection_manager.handle_connection_activity = complete_one_job
+
+        completed_requests = self.connection_manager.wait_until_jobs_completed(job_requests)
+        assert checked_requests == job_requests
+        assert all(current_request.complete and not current_request.timed_out for current_request in completed_requests)
+
+        # We stop hearing about requests once we're done waiting on them
+        assert self.connection_manager._request_trackers == []
+
+    def test_connection_load_follows_requests(self):
+        foreground_request = self.generate_job_request(submitted=False, accepted=False)
+        background_request = self.generate_job_request(submitted=False, accepted=False)
+        background_request.background = True
+
+        self.connection_manager.send_job_request(foreground_request)
+        self.connection_manager.send_job_request(background_request)
+        assert self.connection.outstanding_requests == 2
+        assert self.connection.job_created_rtt is None
+
+        # Background jobs are done with once they're accepted, but we wait for foreground jobs to finish
+        self.command_handler.recv_command(GEARMAN_COMMAND_JOB_CREATED, job_handle=foreground_request.job.handle)
+        self.command_handler.recv_command(GEARMAN_COMMAND_JOB_CREATED, job_handle=background_request.job.handle)
+        assert self.connection.outstanding_requests == 1
+        assert self.connection.job_created_rtt >= 0.0
+
+        self.command_handler.recv_command(GEARMAN_COMMAND_WORK_COMPLETE, job_handle=foreground_request.job.handle, data=b'12345')
+        assert self.connection.outstanding_requests == 0
+        assert not self.connection_manager._outstanding_requests
+
+    def test_connection_load_forgets_lost_requests(self):
+        current_request = self.generate_job_request(submitted=False, accepted=False)
+        self.connection_manager.send_job_request(current_request)
+        assert self.connection.outstanding_requests == 1
+
+        self.connection_manager.handle_error(self.connection)
+        assert current_request.state == JOB_UNKNOWN
+        assert self.connection.outstanding_requests == 0
+
+    def test_connection_load_forgets_requests_we_stop_waiting_on(self):
+        expiring_request = self.generate_job_request(submitted=False, accepted=False)
+        waiting_request = self.generate_job_request(submitted=False, accepted=False)
+        self.connection_manager.send_job_request(expiring_request)
+        self.connection_manager.send_job_request(waiting_request)
+        assert self.connection.outstanding_requests == 2
+
+        self.connection_manager.on_deadline_expired(expiring_request)
+        assert expiring_request.timed_out
+        assert self.connection.outstanding_requests == 1
+
+        self.connection_manager.wait_until_jobs_completed([waiting_request], poll_timeout=0.0)
+        assert waiting_request.timed_out
+        assert self.connection.outstanding_requests == 0
+        assert not self.connection_manager._outstanding_requests
+
     def test_get_job_status(self):
         single_request = self.generate_job_request()
 
@@ -514,3 +656,139 @@ class ClientCommandHandlerStateMachineTest(_GearmanAbstractTest):
         assert current_request.status['running']
         assert current_request.status['numerator'] == 0
         assert current_request.status['denominator'] == 1
+
+
+def test_submit_stream_pulls_jobs_lazily(server):
+    pulled_jobs = []
+
+    def generate_jobs():
+        for job_index in range(500):
+            pulled_jobs.append(job_index)
+            yield {'task': 'reverse', 'data': b'%03d' % job_index}
+
+    client = GearmanClient([server.address])
+    try:
+        completed_results = []
+        for completed_request in client.submit_stream(generate_jobs(), window=10):
+            # We never get more than a window's worth of jobs ahead of what's come back
+            assert len(pulled_jobs) <= len(completed_results) + 10
+            assert completed_request.state == JOB_COMPLETE
+            assert not completed_request.timed_out
+            completed_results.append(completed_request.result)
+    finally:
+        client.shutdown()
+
+    assert sorted(completed_results) == sorted((b'%03d' % job_index)[::-1] for job_index in range(500))
+
+
+def test_submit_stream_background_jobs(server):
+    client = GearmanClient([server.address])
+    try:
+        jobs = ({'task': 'reverse', 'data': b'hello'} for _ in range(20))
+        created_requests = list(client.submit_stream(jobs, window=3, background=True))
+    finally:
+        client.shutdown()
+
+    assert len(created_requests) == 20
+    assert all(current_request.state == JOB_CREATED for current_request in created_requests)
+
+
+def test_submit_stream_empty_iterable(server):
+    client = GearmanClient([server.address])
+    try:
+        assert list(client.submit_stream(iter([]))) == []
+    finally:
+        client.shutdown()
+
+
+def test_identical_foreground_jobs_share_one_request(server):
+    client = GearmanClient([server.address])
+    try:
+        jobs = [dict(task='reverse', data=b'abc', unique='same-%d' % (job_index % 2)) for job_index in range(10)]
+        completed_requests = client.submit_multiple_jobs(jobs)
+        assert server.submitted_jobs == 2
+        assert len(set(completed_requests)) == 2
+        assert all(current_request.result == b'cba' for current_request in completed_requests)
+
+        # Once a job's finished, the next identical one goes to the server again
+        resubmitted_request = client.submit_job('reverse', b'abc', unique='same-0')
+        assert resubmitted_request not in completed_requests
+        assert server.submitted_jobs == 3
+
+        # Background jobs have no results to share
+        client.submit_multiple_jobs([dict(task='reverse', data=b'abc', unique='same-0')] * 3, background=True)
+        assert server.submitted_jobs == 6
+    finally:
+        client.shutdown()
+
+
+def test_jobs_that_take_their_unique_from_their_data_are_not_shared(server):
+    client = GearmanClient([server.address])
+    try:
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'abc', unique='-'), dict(task='reverse', data=b'xyz', unique='-')])
+        assert server.submitted_jobs == 2
+        assert [current_request.result for current_request in completed_requests] == [b'cba', b'zyx']
+    finally:
+        client.shutdown()
+
+
+def test_coalescing_can_be_turned_off(server):
+    class UncoalescedClient(GearmanClient):
+        coalesce_requests = False
+
+    client = UncoalescedClient([server.address])
+    try:
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'abc', unique='same')] * 3)
+        assert len(set(completed_requests)) == 3
+        assert server.submitted_jobs == 3
+    finally:
+        client.shutdown()
+
+
+def test_each_job_times_out_on_its_own_deadline(server):
+    client = GearmanClient([server.address])
+    try:
+        start_time = time.time()
+        jobs = [
+            dict(task='reverse', data=b'hang', timeout=0.05),
+            dict(task='reverse', data=b'abc', timeout=5.0),
+            dict(task='reverse', data=b'def'),
+        ]
+        hung_request, quick_request, untimed_request = client.submit_multiple_jobs(jobs, poll_timeout=5.0)
+
+        # The batch only waits on the hung job for as long as its own timeout
+        assert time.time() - start_time < 1.0
+        assert hung_request.timed_out and hung_request.deadline_expired
+        assert hung_request.state == JOB_CREATED
+        assert quick_request.result == b'cba' and not quick_request.timed_out
+        assert untimed_request.result == b'fed' and not untimed_request.timed_out
+
+        # Requests that finish in time don't leave their deadlines behind
+        assert not client._item_to_deadline_entry
+        assert not client.request_to_rotating_connection_queue
+    finally:
+        client.shutdown()
+
+
+def test_iter_completed_yields_requests_as_their_deadlines_pass(server):
+    client = GearmanClient([server.address])
+    try:
+        jobs = [dict(task='reverse', data=b'hang', timeout=0.2), dict(task='reverse', data=b'hang', timeout=0.05), dict(task='reverse', data=b'abc')]
+        submitted_requests = client.submit_multiple_jobs(jobs, wait_until_complete=False)
+
+        yielded_requests = list(client.iter_completed(submitted_requests, timeout=5.0))
+        assert yielded_requests == [submitted_requests[2], submitted_requests[1], submitted_requests[0]]
+        assert [current_request.timed_out for current_request in yielded_requests] == [False, True, True]
+    finally:
+        client.shutdown()
+
+
+def test_jobs_with_deadlines_are_never_shared(server):
+    client = GearmanClient([server.address])
+    try:
+        jobs = [dict(task='reverse', data=b'abc', unique='same', timeout=5.0), dict(task='reverse', data=b'abc', unique='same')]
+        completed_requests = client.submit_multiple_jobs(jobs)
+        assert completed_requests[0] is not completed_requests[1]
+        assert server.submitted_jobs == 2
+    finally:
+        client.shutdown()
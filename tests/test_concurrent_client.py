@@ -0,0 +1,174 @@
+# -*- encoding: utf-8
+
+import threading
+
+import pytest
+
+from gearman.concurrent_client import ConcurrentGearmanClient
+from gearman.constants import JOB_COMPLETE, JOB_CREATED, JOB_FAILED
+from gearman.errors import GearmanError, InvalidClientState, ServerUnavailable
+from gearman.result_cache import ResultCache
+from gearman.retry import ExponentialBackoffRetryPolicy
+
+TIMEOUT = 10.0
+
+
+@pytest.fixture
+def client(server):
+    concurrent_client = ConcurrentGearmanClient([server.address])
+    yield concurrent_client
+    concurrent_client.shutdown()
+
+
+def test_submit_job_returns_a_future(client):
+    future = client.submit_job('reverse', b'hello')
+
+    completed_request = future.result(timeout=TIMEOUT)
+    assert completed_request.state == JOB_COMPLETE
+    assert completed_request.result == b'olleh'
+
+
+def test_failed_jobs_resolve_too(client):
+    failed_request = client.submit_job('reverse', b'fail').result(timeout=TIMEOUT)
+    assert failed_request.state == JOB_FAILED
+
+
+def test_background_jobs_resolve_once_accepted(client):
+    background_request = client.submit_job('reverse', b'hello', background=True).result(timeout=TIMEOUT)
+    assert background_request.state == JOB_CREATED
+
+
+def test_many_threads_share_one_connection(server, client):
+    futures = []
+    futures_lock = threading.Lock()
+
+    def submit_jobs(thread_index):
+        submitted = [client.submit_job('reverse', b'%d-%d' % (thread_index, job_index)) for job_index in range(100)]
+        with futures_lock:
+            futures.extend(submitted)
+
+    threads = [threading.Thread(target=submit_jobs, args=(thread_index, )) for thread_index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = set(future.result(timeout=TIMEOUT).result for future in futures)
+    assert len(results) == 2000
+    assert b'0-1' in results
+    assert server.connection_count == 1
+
+
+def test_unreachable_server_fails_the_future(server):
+    server.stop()
+    unreachable_client = ConcurrentGearmanClient([server.address])
+    try:
+        with pytest.raises(ServerUnavailable):
+            unreachable_client.submit_job('reverse', b'hello').result(timeout=TIMEOUT)
+    finally:
+        unreachable_client.shutdown()
+
+
+def test_methods_that_poll_point_callers_at_the_futures(client):
+    completed_request = client.submit_job('reverse', b'hello').result(timeout=TIMEOUT)
+
+    for blocking_call in [
+        lambda: client.get_job_status(completed_request),
+        lambda: client.get_job_statuses([completed_request]),
+        lambda: client.wait_until_jobs_accepted([completed_request]),
+        lambda: client.wait_until_jobs_completed([completed_request]),
+        lambda: client.wait_until_job_statuses_received([completed_request]),
+        lambda: client.submit_stream([dict(task='reverse', data=b'hello')]),
+        lambda: client.iter_completed([completed_request]),
+    ]:
+        with pytest.raises(InvalidClientState, match='Futures'):
+            blocking_call()
+
+    # The I/O thread carries on regardless
+    assert client.submit_job('reverse', b'abc').result(timeout=TIMEOUT).result == b'cba'
+
+
+def test_shutdown_stops_submissions(client):
+    client.shutdown()
+    with pytest.raises(GearmanError):
+        client.submit_job('reverse', b'hello')
+
+
+def test_identical_jobs_from_many_threads_share_one_request(start_server):
+    slow_server = start_server(response_delay=0.1)
+    client = ConcurrentGearmanClient([slow_server.address])
+    try:
+        futures = []
+
+        def submit_jobs():
+            futures.extend(client.submit_job('reverse', b'hello', unique='same') for _ in range(5))
+
+        threads = [threading.Thread(target=submit_jobs) for _ in range(4)]
+        for current_thread in threads:
+            current_thread.start()
+        for current_thread in threads:
+            current_thread.join()
+
+        completed_requests = [future.result(timeout=TIMEOUT) for future in futures]
+        assert slow_server.submitted_jobs == 1
+        assert len(set(completed_requests)) == 1
+        assert completed_requests[0].result == b'olleh'
+    finally:
+        client.shutdown()
+
+
+def test_cache_hits_resolve_straight_away(server):
+    result_cache = ResultCache({'reverse': 60.0})
+    client = ConcurrentGearmanClient([server.address], result_cache=result_cache)
+    try:
+        assert client.submit_job('reverse', b'abc').result(timeout=10.0).result == b'cba'
+
+        cached_future = client.submit_job('reverse', b'abc')
+        assert cached_future.done()
+        assert cached_future.result().result == b'cba'
+        assert server.submitted_jobs == 1
+    finally:
+        client.shutdown()
+
+
+def test_futures_resolve_once_their_deadlines_pass(client):
+    hung_future = client.submit_job('reverse', b'hang', timeout=0.05)
+    quick_future = client.submit_job('reverse', b'hello', timeout=5.0)
+
+    hung_request = hung_future.result(timeout=TIMEOUT)
+    assert hung_request.timed_out and hung_request.deadline_expired
+    assert hung_request.state == JOB_CREATED
+
+    quick_request = quick_future.result(timeout=TIMEOUT)
+    assert quick_request.result == b'olleh' and not quick_request.timed_out
+
+
+def test_poll_timeout_is_the_deadline_of_each_job(client):
+    hung_request = client.submit_job('reverse', b'hang', poll_timeout=0.05).result(timeout=TIMEOUT)
+    assert hung_request.timed_out and hung_request.deadline_expired
+
+    hung_future, quick_future = client.submit_multiple_jobs([
+        dict(task='reverse', data=b'hang'),
+        dict(task='reverse', data=b'hello', timeout=0.01),
+    ], poll_timeout=0.05)
+    assert hung_future.result(timeout=TIMEOUT).timed_out
+
+    # A job's own deadline wins when it's the sooner of the two
+    quick_request = quick_future.result(timeout=TIMEOUT)
+    assert quick_request.deadline < hung_future.result().deadline
+
+    completed_request = client.submit_job('reverse', b'hello', poll_timeout=TIMEOUT).result(timeout=TIMEOUT)
+    assert completed_request.result == b'olleh' and not completed_request.timed_out
+
+
+def test_failed_jobs_are_retried_on_another_server(start_server):
+    servers = [start_server(fail_jobs=True), start_server()]
+    retry_policy = ExponentialBackoffRetryPolicy(max_retries=1, base_delay=0.01, retry_failed_jobs=True)
+    retrying_client = ConcurrentGearmanClient([server.address for server in servers], retry_policy=retry_policy)
+    try:
+        futures = [retrying_client.submit_job('reverse', b'job %d' % job_index) for job_index in range(20)]
+        completed_requests = [future.result(timeout=TIMEOUT) for future in futures]
+        assert all(current_request.state == JOB_COMPLETE for current_request in completed_requests)
+        assert servers[1].submitted_jobs == 20
+    finally:
+        retrying_client.shutdown()
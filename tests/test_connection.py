@@ -1,8 +1,12 @@
 # -*- encoding: utf-8
 
+import collections
+import errno
+import socket
+
 import pytest
 
-from gearman import connection, compat
+from gearman import connection, protocol
 from gearman.errors import ConnectionError, ServerUnavailable
 from gearman.protocol import GEARMAN_COMMAND_TEXT_COMMAND, GEARMAN_COMMAND_ECHO_REQ
 
@@ -32,28 +36,219 @@ def test_use_ssl_only_if_all_three_files(keyfile, certfile, ca_certs, expected_u
     assert conn.use_ssl == expected_use_ssl
 
 
+def test_connect_cooldown_seconds_is_a_deprecated_probe_interval():
+    class CoolingConnection(connection.GearmanConnection):
+        connect_cooldown_seconds = 5.0
+
+    with pytest.warns(DeprecationWarning):
+        conn = CoolingConnection(host='localhost')
+    assert conn.circuit_breaker.probe_interval == 5.0
+
+
 def test_no_socket_means_no_fileno():
     conn = connection.GearmanConnection(host='localhost')
     with pytest.raises(ConnectionError, match='no socket set'):
         conn.fileno()
 
 
+def _outgoing_bytes(conn):
+    return b''.join(bytes(segment) for segment in conn._outgoing_segments)[conn._outgoing_offset:]
+
+
 def test_send_commands_to_buffer():
     conn = connection.GearmanConnection(host='localhost')
     assert conn.send_commands_to_buffer() is None
-    assert conn._outgoing_buffer == b''
+    assert _outgoing_bytes(conn) == b''
     conn._outgoing_commands.append((GEARMAN_COMMAND_ECHO_REQ, {"data": "test"}))
     conn.send_commands_to_buffer()
-    assert conn._outgoing_buffer == b"\x00REQ\x00\x00\x00\x10\x00\x00\x00\x04test"
-    if compat.PY3:
-        assert isinstance(conn._outgoing_buffer, compat.binary_type)
-    else:
-        assert isinstance(conn._outgoing_buffer, compat.binary_type)
+    assert _outgoing_bytes(conn) == b"\x00REQ\x00\x00\x00\x10\x00\x00\x00\x04test"
     conn._reset_connection()
     conn._outgoing_commands.append((GEARMAN_COMMAND_TEXT_COMMAND, {"raw_text": "raw---text"}))
     conn.send_commands_to_buffer()
-    assert conn._outgoing_buffer == b"raw---text"
-    if compat.PY3:
-        assert isinstance(conn._outgoing_buffer, compat.binary_type)
-    else:
-        assert isinstance(conn._outgoing_buffer, compat.binary_type)
+    assert _outgoing_bytes(conn) == b"raw---text"
+
+
+def test_send_commands_to_buffer_does_not_copy_large_payloads():
+    conn = connection.GearmanConnection(host='localhost')
+    large_data = b'x' * conn.outgoing_copy_threshold
+    conn.send_command(protocol.GEARMAN_COMMAND_SUBMIT_JOB, {"task": b"task", "unique": b"1", "data": large_data})
+    conn.send_command(protocol.GEARMAN_COMMAND_ECHO_REQ, {"data": b"small"})
+    conn.send_command(protocol.GEARMAN_COMMAND_ECHO_REQ, {"data": b"small"})
+    conn.send_commands_to_buffer()
+
+    # Small pieces share one write buffer, the large payload is queued by reference
+    header_segment, data_segment, small_segment = conn._outgoing_segments
+    assert data_segment.obj is large_data
+    assert bytes(small_segment) == protocol.pack_binary_command(protocol.GEARMAN_COMMAND_ECHO_REQ, {"data": b"small"}) * 2
+    assert conn._outgoing_size == len(header_segment) + len(data_segment) + len(small_segment)
+
+
+def test_send_commands_to_buffer_in_bulk():
+    commands = [(protocol.GEARMAN_COMMAND_SUBMIT_JOB_BG, {"task": b"task", "unique": str(index), "data": b"data"}) for index in range(100)]
+    large_data = b'x' * connection.GearmanConnection.outgoing_copy_threshold
+    commands.insert(50, (protocol.GEARMAN_COMMAND_SUBMIT_JOB_BG, {"task": b"task", "unique": b"large", "data": large_data}))
+
+    one_by_one = connection.GearmanConnection(host='localhost')
+    one_by_one.batch_pack_threshold = len(commands) + 1
+    in_bulk = connection.GearmanConnection(host='localhost')
+    for conn in (one_by_one, in_bulk):
+        for cmd_type, cmd_args in commands:
+            conn.send_command(cmd_type, dict(cmd_args))
+        conn.send_commands_to_buffer()
+
+    assert _outgoing_bytes(in_bulk) == _outgoing_bytes(one_by_one)
+
+    # The large payload still isn't copied
+    assert any(getattr(segment, 'obj', None) is large_data for segment in in_bulk._outgoing_segments)
+
+
+class FakeSendingSocket(object):
+    """Accepts at most max_bytes per call to sendmsg()"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.sent_data = b''
+
+    def sendmsg(self, buffers):
+        data = b''.join(bytes(buffer) for buffer in buffers)[:self.max_bytes]
+        self.sent_data += data
+        return len(data)
+
+    def send(self, data):
+        return self.sendmsg([data])
+
+
+def test_send_data_to_socket_partial_sends():
+    conn = connection.GearmanConnection(host='localhost')
+    conn.gearman_socket = FakeSendingSocket(max_bytes=7000)
+    conn.connected = True
+    conn._is_client_side = True
+
+    large_data = b'x' * (conn.outgoing_copy_threshold * 2)
+    conn.send_command(protocol.GEARMAN_COMMAND_SUBMIT_JOB, {"task": b"task", "unique": b"1", "data": large_data})
+    conn.send_command(protocol.GEARMAN_COMMAND_ECHO_REQ, {"data": b"small"})
+    conn.send_commands_to_buffer()
+    expected_data = _outgoing_bytes(conn)
+
+    while conn.writable():
+        remaining = conn.send_data_to_socket()
+        assert remaining == len(expected_data) - len(conn.gearman_socket.sent_data)
+        assert _outgoing_bytes(conn) == expected_data[len(conn.gearman_socket.sent_data):]
+
+    assert conn.gearman_socket.sent_data == expected_data
+    assert conn._outgoing_offset == 0
+
+
+class FakeSocket(object):
+    """Hands out queued chunks through recv_into(); None in the queue means "would block"
+
+    A short read already ends a drain, so None is only needed after a chunk that fills the read
+    """
+    def __init__(self, chunks):
+        self.chunks = collections.deque(chunks)
+        self.read_sizes = []
+
+    def recv_into(self, buffer, nbytes):
+        self.read_sizes.append(nbytes)
+        chunk = self.chunks.popleft() if self.chunks else None
+        if chunk is None:
+            raise socket.error(errno.EAGAIN, 'Resource temporarily unavailable')
+
+        if len(chunk) > nbytes:
+            self.chunks.appendleft(chunk[nbytes:])
+            chunk = chunk[:nbytes]
+
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def _client_side_connection(chunks=()):
+    conn = connection.GearmanConnection(host='localhost')
+    conn.gearman_socket = FakeSocket(chunks)
+    conn.connected = True
+    conn._is_client_side = True
+    conn._is_server_side = False
+    return conn
+
+
+def _echo_res_frame(data=b'test'):
+    return protocol.pack_binary_command(protocol.GEARMAN_COMMAND_ECHO_RES, {"data": data}, is_response=True)
+
+
+def test_read_commands_from_buffer_handles_partial_frames():
+    frames = _echo_res_frame() * 2
+
+    # Deliver two frames one byte per readiness event, so every frame boundary is split
+    conn = _client_side_connection([frames[i:i + 1] for i in range(len(frames))])
+
+    received_commands = 0
+    for _ in range(len(frames)):
+        conn.read_data_from_socket()
+        received_commands += conn.read_commands_from_buffer()
+
+    assert received_commands == 2
+    assert conn.read_command() == (protocol.GEARMAN_COMMAND_ECHO_RES, {"data": b"test"})
+    assert conn.read_command() == (protocol.GEARMAN_COMMAND_ECHO_RES, {"data": b"test"})
+    assert conn.read_command() is None
+    assert conn._incoming_offset == conn._incoming_end == 0
+
+
+def test_read_commands_from_buffer_reads_text_lines():
+    lines = b''.join(b'H:lap:%d\t0\t0\t1\n' % index for index in range(1000)) + b'.\n'
+
+    # Interleave a binary command, and split a line across reads
+    conn = _client_side_connection([lines[:1001], lines[1001:] + _echo_res_frame() + b'0.1.2\n'])
+    conn.read_data_from_socket()
+    received_commands = conn.read_commands_from_buffer()
+    assert conn._text_scan_size == conn._incoming_end - conn._incoming_offset > 0
+
+    conn.read_data_from_socket()
+    received_commands += conn.read_commands_from_buffer()
+    assert received_commands == 1003
+
+    received = [conn.read_command() for _ in range(received_commands)]
+    assert received[0] == (protocol.GEARMAN_COMMAND_TEXT_COMMAND, {"raw_text": b"H:lap:0\t0\t0\t1"})
+    assert received[1000] == (protocol.GEARMAN_COMMAND_TEXT_COMMAND, {"raw_text": b"."})
+    assert received[1001] == (protocol.GEARMAN_COMMAND_ECHO_RES, {"data": b"test"})
+    assert received[1002] == (protocol.GEARMAN_COMMAND_TEXT_COMMAND, {"raw_text": b"0.1.2"})
+    assert conn._incoming_offset == conn._incoming_end == 0
+
+
+def test_read_data_from_socket_drains_until_would_block():
+    conn = _client_side_connection([b'a' * 4096, b'b' * 4096, b'c' * 10, b'd' * 10, None])
+
+    # Stops after the short read, without waiting for the socket to say it would block
+    assert conn.read_data_from_socket() == 4096 * 2 + 10
+    assert conn.read_data_from_socket() == 4096 * 2 + 20
+    assert conn.read_data_from_socket() == 4096 * 2 + 20
+
+
+def test_read_data_from_socket_remote_disconnected():
+    conn = _client_side_connection([b''])
+    with pytest.raises(ConnectionError, match='remote disconnected'):
+        conn.read_data_from_socket()
+
+
+def test_read_size_follows_announced_frame_length():
+    payload_size = 3 * connection.GearmanConnection.min_read_size
+    frame = _echo_res_frame(b'x' * payload_size)
+    conn = _client_side_connection([frame[:100], frame[100:], None])
+
+    conn.read_data_from_socket()
+    assert conn.read_commands_from_buffer() == 0
+
+    # The second read asks for exactly the rest of the frame
+    conn.read_data_from_socket()
+    assert conn.gearman_socket.read_sizes[1] == len(frame) - 100
+    assert conn.read_commands_from_buffer() == 1
+    assert conn._incoming_offset == conn._incoming_end == 0
+
+
+def test_job_created_rtt_is_exponentially_weighted():
+    conn = connection.GearmanConnection(host='localhost')
+    assert conn.job_created_rtt is None
+
+    conn.record_job_created_rtt(1.0)
+    assert conn.job_created_rtt == 1.0
+
+    conn.record_job_created_rtt(2.0)
+    assert conn.job_created_rtt == pytest.approx(1.0 + conn.rtt_smoothing)
@@ -0,0 +1,260 @@
+# -*- encoding: utf-8
+
+import socket
+import time
+
+import pytest
+
+import gearman.io
+from gearman import protocol
+from gearman.connection_manager import GearmanConnectionManager
+from gearman.command_handler import GearmanCommandHandler
+
+
+class RecordingPoller(object):
+    """Stands in for select.epoll, remembering every registration call made on it"""
+    def __init__(self):
+        self.calls = []
+        self.closed = False
+
+    def register(self, conn, events):
+        self.calls.append(('register', conn, events))
+
+    def modify(self, conn, events):
+        self.calls.append(('modify', conn, events))
+
+    def unregister(self, conn):
+        self.calls.append(('unregister', conn))
+
+    def poll(self, timeout):
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSocket(object):
+    def __init__(self, fileno):
+        self._fileno = fileno
+
+    def fileno(self):
+        return self._fileno
+
+    def close(self):
+        pass
+
+
+class NoopCommandHandler(GearmanCommandHandler):
+    def __init__(self, *args, **kwargs):
+        super(NoopCommandHandler, self).__init__(*args, **kwargs)
+        self.noops = 0
+
+    def recv_noop(self):
+        self.noops += 1
+        return True
+
+
+class PollingConnectionManager(GearmanConnectionManager):
+    command_handler_class = GearmanCommandHandler
+
+    def __init__(self, *args, **kwargs):
+        super(PollingConnectionManager, self).__init__(*args, **kwargs)
+        self.expired_items = []
+
+    def on_deadline_expired(self, item):
+        self.expired_items.append(item)
+
+
+def _connected(conn, fileno):
+    conn.gearman_socket = FakeSocket(fileno)
+    conn.connected = True
+    return conn
+
+
+def _manager_with_poller(connection_count=2):
+    manager = PollingConnectionManager(host_list=['localhost:%d' % (4730 + index) for index in range(connection_count)])
+    manager._poller = RecordingPoller()
+    for index, conn in enumerate(manager.connection_list):
+        _connected(conn, 100 + index)
+    return manager
+
+
+def test_connections_are_registered_once():
+    manager = _manager_with_poller()
+    poller = manager._poller
+    first, second = manager.connection_list
+
+    for _ in range(3):
+        manager._register_connections_with_poller(manager.connection_list, poller)
+
+    assert poller.calls == [
+        ('register', first, gearman.io.READ),
+        ('register', second, gearman.io.READ),
+    ]
+
+
+def test_poller_is_only_told_about_changes():
+    manager = _manager_with_poller()
+    poller = manager._poller
+    first, second = manager.connection_list
+    manager._register_connections_with_poller(manager.connection_list, poller)
+    del poller.calls[:]
+
+    first.send_command(1, {'task': b'reverse'})
+    manager._register_connections_with_poller(manager.connection_list, poller)
+    manager._register_connections_with_poller(manager.connection_list, poller)
+    assert poller.calls == [('modify', first, gearman.io.READ | gearman.io.WRITE)]
+
+    # A reconnect gets a new socket, which needs registering from scratch
+    del poller.calls[:]
+    _connected(second, 200)
+    manager._register_connections_with_poller(manager.connection_list, poller)
+    assert poller.calls == [('unregister', second), ('register', second, gearman.io.READ)]
+
+
+def test_handle_error_unregisters_connection():
+    manager = _manager_with_poller(connection_count=1)
+    poller = manager._poller
+    conn, = manager.connection_list
+    manager._register_connections_with_poller(manager.connection_list, poller)
+
+    manager.handle_error(conn)
+    assert poller.calls[-1] == ('unregister', conn)
+    assert not conn.connected
+
+    # Reconnecting registers the connection again
+    _connected(conn, 100)
+    manager._register_connections_with_poller(manager.connection_list, poller)
+    assert poller.calls[-1] == ('register', conn, gearman.io.READ)
+
+
+def test_poller_lives_until_shutdown():
+    manager = _manager_with_poller(connection_count=1)
+    poller = manager._poller
+
+    manager.poll_connections_until_stopped(manager.connection_list, lambda any_activity: not any_activity, timeout=0.01)
+    manager.poll_connections_until_stopped(manager.connection_list, lambda any_activity: not any_activity, timeout=0.01)
+    assert manager._get_poller() is poller
+    assert [call[0] for call in poller.calls] == ['register']
+
+    manager.shutdown()
+    assert poller.closed
+    assert manager._poller is None
+
+
+def test_deadlines_expire_in_order():
+    manager = PollingConnectionManager()
+    current_time = time.time()
+    manager.add_deadline('late', current_time - 1)
+    manager.add_deadline('later', current_time + 60)
+    manager.add_deadline('early', current_time - 2)
+
+    assert manager.expire_deadlines()
+    assert manager.expired_items == ['early', 'late']
+    assert 59 < manager.get_time_until_next_deadline() <= 60
+
+    assert not manager.expire_deadlines()
+    assert manager.expired_items == ['early', 'late']
+
+
+def test_cancelled_and_replaced_deadlines_never_expire():
+    manager = PollingConnectionManager()
+    current_time = time.time()
+    manager.add_deadline('cancelled', current_time - 1)
+    manager.add_deadline('replaced', current_time - 1)
+    manager.cancel_deadline('cancelled')
+    manager.add_deadline('replaced', current_time + 60)
+
+    assert not manager.expire_deadlines()
+    assert manager.expired_items == []
+    assert 59 < manager.get_time_until_next_deadline() <= 60
+
+    manager.cancel_deadline('replaced')
+    assert manager.get_time_until_next_deadline() is None
+
+
+def test_cancelled_deadlines_dont_pile_up():
+    manager = PollingConnectionManager()
+    for item_index in range(1000):
+        manager.add_deadline(item_index, time.time() + 60)
+        manager.cancel_deadline(item_index)
+
+    assert len(manager._deadline_heap) <= 17
+
+
+def test_poll_loop_wakes_up_for_deadlines():
+    manager = _manager_with_poller(connection_count=1)
+    manager.add_deadline('request', time.time() + 0.01)
+
+    start_time = time.time()
+    manager.poll_connections_until_stopped(manager.connection_list, lambda any_activity: not manager.expired_items, timeout=5.0)
+    assert manager.expired_items == ['request']
+    assert time.time() - start_time < 1.0
+
+
+def _edge_triggered_manager():
+    """A manager polling with epoll_edge, connected to the remote socket it returns"""
+    manager = PollingConnectionManager(host_list=['localhost:4730'])
+    manager.poller_backend = 'epoll_edge'
+    conn, = manager.connection_list
+    local_socket, remote_socket = socket.socketpair()
+    local_socket.setblocking(0)
+    conn.gearman_socket = local_socket
+    conn.connected = True
+    conn._is_client_side = True
+
+    handler = NoopCommandHandler(connection_manager=manager)
+    manager.connection_to_handler_map[conn] = handler
+    manager.handler_to_connection_map[handler] = conn
+    return manager, remote_socket
+
+
+@pytest.mark.skipif('epoll_edge' not in gearman.io.available_poller_backends(), reason='needs epoll')
+def test_edge_triggered_poller_notices_data_then_close():
+    manager, remote_socket = _edge_triggered_manager()
+    conn, = manager.connection_list
+    handler = manager.connection_to_handler_map[conn]
+    poller = manager._get_poller()
+    manager._register_connections_with_poller(manager.connection_list, poller)
+
+    # The server answers and hangs up before we get round to polling
+    remote_socket.sendall(protocol.pack_binary_command(protocol.GEARMAN_COMMAND_NOOP, {}, is_response=True))
+    remote_socket.shutdown(socket.SHUT_WR)
+
+    rd_connections, wr_connections, ex_connections = manager.poll_connections_once(poller, {conn.fileno(): conn}, timeout=1.0)
+    manager.handle_connection_activity(rd_connections, wr_connections, set())
+
+    assert handler.noops == 1
+    assert not conn.connected
+    assert conn not in manager.connection_to_handler_map
+
+    remote_socket.close()
+    manager.shutdown()
+
+
+@pytest.mark.skipif('epoll_edge' not in gearman.io.available_poller_backends(), reason='needs epoll')
+def test_edge_triggered_poller_sends_every_queued_segment():
+    manager, remote_socket = _edge_triggered_manager()
+    conn, = manager.connection_list
+
+    # Like SSL sockets, send a segment at a time
+    conn.use_ssl = True
+    job_data = [(b'%d' % job_index) * conn.outgoing_copy_threshold for job_index in range(3)]
+    for current_data in job_data:
+        conn.send_command(protocol.GEARMAN_COMMAND_SUBMIT_JOB, {'task': b'reverse', 'unique': b'', 'data': current_data})
+
+    poller = manager._get_poller()
+    manager._register_connections_with_poller(manager.connection_list, poller)
+    rd_connections, wr_connections, ex_connections = manager.poll_connections_once(poller, {conn.fileno(): conn}, timeout=1.0)
+    manager.handle_connection_activity(rd_connections, wr_connections, ex_connections)
+
+    # The poller won't report the socket writable again, so everything has to have gone out already
+    assert conn._outgoing_size == 0
+    expected_data = b''.join(protocol.pack_binary_command(protocol.GEARMAN_COMMAND_SUBMIT_JOB, {'task': b'reverse', 'unique': b'', 'data': current_data}) for current_data in job_data)
+    received_data = b''
+    while len(received_data) < len(expected_data):
+        received_data += remote_socket.recv(65536)
+    assert received_data == expected_data
+
+    remote_socket.close()
+    manager.shutdown()
@@ -0,0 +1,88 @@
+# -*- encoding: utf-8
+
+import socket
+
+import pytest
+
+import gearman.io
+from gearman.errors import GearmanError
+
+
+@pytest.fixture(params=gearman.io.available_poller_backends())
+def poller(request):
+    poller = gearman.io.get_connection_poller(request.param)
+    yield poller
+    poller.close()
+
+
+@pytest.fixture
+def socket_pair():
+    local_socket, remote_socket = socket.socketpair()
+    yield local_socket, remote_socket
+    local_socket.close()
+    remote_socket.close()
+
+
+def _events_for(poller, sock, timeout=0.0):
+    return dict(poller.poll(timeout)).get(sock.fileno(), 0)
+
+
+def test_poller_reports_registered_events(poller, socket_pair):
+    local_socket, remote_socket = socket_pair
+    poller.register(local_socket, gearman.io.READ)
+    assert not _events_for(poller, local_socket) & gearman.io.READ
+
+    remote_socket.send(b'x')
+    assert _events_for(poller, local_socket, timeout=1.0) & gearman.io.READ
+
+    poller.modify(local_socket, gearman.io.WRITE)
+    assert _events_for(poller, local_socket, timeout=1.0) == gearman.io.WRITE
+
+    poller.unregister(local_socket)
+    assert _events_for(poller, local_socket) == 0
+
+
+def test_poller_hands_over_reused_filenos(poller):
+    if isinstance(poller, gearman.io._Select):
+        pytest.skip('select() watches connections, not file descriptors')
+
+    first_socket, first_remote = socket.socketpair()
+    poller.register(first_socket, gearman.io.READ)
+    fileno = first_socket.fileno()
+    first_socket.close()
+    first_remote.close()
+
+    # Closed without being unregistered, so the next socket may get the same fileno
+    second_socket, second_remote = socket.socketpair()
+    try:
+        if second_socket.fileno() != fileno:
+            pytest.skip('The operating system did not reuse the fileno')
+
+        poller.register(second_socket, gearman.io.READ)
+        second_remote.send(b'x')
+        assert _events_for(poller, second_socket, timeout=1.0) & gearman.io.READ
+    finally:
+        second_socket.close()
+        second_remote.close()
+
+
+def test_unknown_poller_backend():
+    with pytest.raises(GearmanError):
+        gearman.io.get_connection_poller('carrier_pigeon')
+
+
+def test_waker_wakes_up_the_poller(poller):
+    waker = gearman.io.Waker()
+    try:
+        poller.register(waker, gearman.io.READ)
+        assert not _events_for(poller, waker) & gearman.io.READ
+
+        waker.wake()
+        waker.wake()
+        assert _events_for(poller, waker, timeout=1.0) & gearman.io.READ
+
+        waker.drain()
+        assert not _events_for(poller, waker) & gearman.io.READ
+        poller.unregister(waker)
+    finally:
+        waker.close()
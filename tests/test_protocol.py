@@ -8,7 +8,8 @@ from hypothesis.strategies import binary
 import pytest
 
 from gearman import compat, protocol
-from gearman.errors import ProtocolError
+from gearman.command_handler import GearmanCommandHandler
+from gearman.errors import ProtocolError, UnknownCommandError
 from tests._core_testing import _GearmanAbstractTest
 
 
@@ -129,6 +130,44 @@ class TestProtocolBinaryCommands(object):
         }
         assert cmd_len == len(uniq_command_buffer)
 
+    def test_decoder_remembers_pending_header(self):
+        echoed_string = b'abcd' * 16
+        echo_command_buffer = struct.pack('!4sII64s', protocol.MAGIC_RES_STRING, protocol.GEARMAN_COMMAND_ECHO_RES, 64, echoed_string)
+        decoder = protocol.BinaryCommandDecoder(is_response=True)
+
+        assert decoder.decode(echo_command_buffer[:20]) == (None, None, 0)
+        assert decoder.pending_cmd_type == protocol.GEARMAN_COMMAND_ECHO_RES
+        assert decoder.pending_packet_size == len(echo_command_buffer)
+
+        # The header has already been validated, so it isn't looked at again
+        mangled_header_buffer = b'X' * protocol.COMMAND_HEADER_SIZE + echo_command_buffer[protocol.COMMAND_HEADER_SIZE:]
+        assert decoder.decode(mangled_header_buffer[:40]) == (None, None, 0)
+
+        cmd_type, cmd_args, cmd_len = decoder.decode(mangled_header_buffer)
+        assert cmd_type == protocol.GEARMAN_COMMAND_ECHO_RES
+        assert cmd_args == {u"data": echoed_string}
+        assert cmd_len == len(echo_command_buffer)
+        assert decoder.pending_packet_size == 0
+
+        # Once a command has been returned, the next header gets validated as usual
+        with pytest.raises(ProtocolError):
+            decoder.decode(mangled_header_buffer)
+
+    def test_parsing_returns_records(self):
+        binary_payload = protocol.NULL_CHAR.join([b'H:1', b'3', b'4'])
+        status_command_buffer = struct.pack('!4sII', protocol.MAGIC_RES_STRING, protocol.GEARMAN_COMMAND_WORK_STATUS, len(binary_payload)) + binary_payload
+        cmd_type, cmd_args, cmd_len = protocol.parse_binary_command(status_command_buffer)
+
+        assert isinstance(cmd_args, protocol.GEARMAN_RECORD_FOR_COMMAND[protocol.GEARMAN_COMMAND_WORK_STATUS])
+        assert tuple(cmd_args) == (b'H:1', b'3', b'4')
+        assert cmd_args.numerator == cmd_args['numerator'] == b'3'
+        assert dict(cmd_args) == dict(job_handle=b'H:1', numerator=b'3', denominator=b'4')
+        assert 'denominator' in cmd_args and 'data' not in cmd_args
+        assert cmd_args.get('data') is None
+
+        with pytest.raises(KeyError):
+            cmd_args['data']
+
     #######################
     # Begin packing tests #
     #######################
@@ -226,6 +265,62 @@ class TestProtocolBinaryCommands(object):
         packed_command_buffer = protocol.pack_binary_command(cmd_type, cmd_args)
         assert packed_command_buffer == expected_command_buffer
 
+    def test_packing_segments(self):
+        cmd_type = protocol.GEARMAN_COMMAND_SUBMIT_JOB
+        job_data = b'abcd' * 1024
+        cmd_args = dict(task=b'function', unique=b'12345', data=job_data)
+
+        segments = protocol.pack_binary_command_segments(cmd_type, cmd_args)
+        assert len(segments) == 6
+        assert segments[-1] is job_data
+        assert b''.join(segments) == protocol.pack_binary_command(cmd_type, cmd_args)
+
+    def test_packing_segments_no_arg(self):
+        cmd_type = protocol.GEARMAN_COMMAND_NOOP
+        segments = protocol.pack_binary_command_segments(cmd_type, {})
+        assert segments == [struct.pack('!4sII', protocol.MAGIC_REQ_STRING, cmd_type, 0)]
+
+    def test_packing_trusted_skips_name_check(self):
+        cmd_type = protocol.GEARMAN_COMMAND_JOB_CREATED
+        cmd_args = {u"job_handle": b"H:1", u"extra": b"ignored"}
+
+        with pytest.raises(ProtocolError):
+            protocol.pack_binary_command_segments(cmd_type, cmd_args)
+
+        segments = protocol.pack_binary_command_segments(cmd_type, cmd_args, trusted=True)
+        assert b''.join(segments) == protocol.pack_binary_command(cmd_type, {u"job_handle": b"H:1"})
+
+        # Missing arguments are still caught
+        with pytest.raises(ProtocolError):
+            protocol.pack_binary_command_segments(cmd_type, {}, trusted=True)
+
+    def test_packing_batch(self):
+        commands = [
+            (protocol.GEARMAN_COMMAND_SUBMIT_JOB, dict(task=b'function', unique=b'12345', data=b'ab\x00cd')),
+            (protocol.GEARMAN_COMMAND_NOOP, {}),
+            (protocol.GEARMAN_COMMAND_ECHO_REQ, dict(data=u'abcde')),
+            (protocol.GEARMAN_COMMAND_WORK_STATUS, dict(job_handle=b'H:1', numerator='1', denominator='2')),
+        ]
+        expected_buffer = b''.join(protocol.pack_binary_command(cmd_type, dict(cmd_args)) for cmd_type, cmd_args in commands)
+        assert protocol.pack_binary_commands(commands) == expected_buffer
+        assert protocol.pack_binary_commands([]) == b''
+
+    @pytest.mark.parametrize('cmd_type,cmd_args', [
+        (1234, {}),
+        (protocol.GEARMAN_COMMAND_TEXT_COMMAND, {u"raw_text": u"status"}),
+        (protocol.GEARMAN_COMMAND_GRAB_JOB, {u"extra": u"arguments"}),
+        (protocol.GEARMAN_COMMAND_JOB_CREATED, {}),
+        (protocol.GEARMAN_COMMAND_JOB_CREATED, {u"job_handle": 12345}),
+        (protocol.GEARMAN_COMMAND_SUBMIT_JOB,
+         {u"task": b"funct\x00ion", u"data": b"abcd", u"unique": b"12345"}),
+        (protocol.GEARMAN_COMMAND_SUBMIT_JOB,
+         {u"task": b"function", u"data": b"abcd", u"unique": u"123\x0045"}),
+    ])
+    def test_packing_batch_errors(self, cmd_type, cmd_args):
+        commands = [(protocol.GEARMAN_COMMAND_NOOP, {}), (cmd_type, cmd_args)]
+        with pytest.raises(ProtocolError):
+            protocol.pack_binary_commands(commands)
+
 
 class TestProtocolTextCommands(object):
     #######################
@@ -321,3 +416,68 @@ class GearmanCommandHandlerTest(_GearmanAbstractTest):
         assert handler_cmd_args == expected_cmd_args
 
         super(GearmanCommandHandlerTest, self).assert_sent_command(expected_cmd_type, **expected_cmd_args)
+
+
+class FakeCommandConnectionManager(object):
+    def __init__(self, commands):
+        self.commands = list(commands)
+
+    def read_command(self, command_handler):
+        if not self.commands:
+            return None
+        return self.commands.pop(0)
+
+
+class RecordingCommandHandler(GearmanCommandHandler):
+    def recv_work_status(self, job_handle, numerator, denominator):
+        self.received = (job_handle, numerator, denominator)
+        return True
+
+
+class OverridingCommandHandler(RecordingCommandHandler):
+    def recv_command(self, cmd_type, **cmd_args):
+        self.overridden = (cmd_type, cmd_args)
+        return super(OverridingCommandHandler, self).recv_command(cmd_type, **cmd_args)
+
+
+def _work_status_command():
+    record_class = protocol.GEARMAN_RECORD_FOR_COMMAND[protocol.GEARMAN_COMMAND_WORK_STATUS]
+    return protocol.GEARMAN_COMMAND_WORK_STATUS, record_class((b'H:1', b'3', b'4'))
+
+
+def test_fetch_commands_dispatches_records_positionally():
+    command_handler = RecordingCommandHandler(FakeCommandConnectionManager([_work_status_command()]))
+    command_handler.fetch_commands()
+
+    assert command_handler.received == (b'H:1', b'3', b'4')
+    assert RecordingCommandHandler._recv_callback_names() == {protocol.GEARMAN_COMMAND_WORK_STATUS: 'recv_work_status', protocol.GEARMAN_COMMAND_ERROR: 'recv_error'}
+
+
+def test_fetch_commands_passes_arguments_by_name_to_callbacks_in_another_order():
+    class ReorderedCommandHandler(GearmanCommandHandler):
+        def recv_work_status(self, numerator, denominator, job_handle):
+            self.received = (job_handle, numerator, denominator)
+            return True
+
+    command_handler = ReorderedCommandHandler(FakeCommandConnectionManager([_work_status_command()]))
+    command_handler.fetch_commands()
+
+    assert command_handler.received == (b'H:1', b'3', b'4')
+    assert protocol.GEARMAN_COMMAND_WORK_STATUS not in ReorderedCommandHandler._positional_cmd_types()
+    assert protocol.GEARMAN_COMMAND_WORK_STATUS in RecordingCommandHandler._positional_cmd_types()
+
+
+def test_fetch_commands_honours_recv_command_overrides():
+    command_handler = OverridingCommandHandler(FakeCommandConnectionManager([_work_status_command()]))
+    command_handler.fetch_commands()
+
+    assert command_handler.overridden == (protocol.GEARMAN_COMMAND_WORK_STATUS, dict(job_handle=b'H:1', numerator=b'3', denominator=b'4'))
+    assert command_handler.received == (b'H:1', b'3', b'4')
+
+
+def test_fetch_commands_rejects_unhandled_commands():
+    record_class = protocol.GEARMAN_RECORD_FOR_COMMAND[protocol.GEARMAN_COMMAND_NOOP]
+    command_handler = RecordingCommandHandler(FakeCommandConnectionManager([(protocol.GEARMAN_COMMAND_NOOP, record_class())]))
+
+    with pytest.raises(UnknownCommandError):
+        command_handler.fetch_commands()
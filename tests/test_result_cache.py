@@ -0,0 +1,107 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+
+from gearman.client import GearmanClient
+from gearman.constants import JOB_COMPLETE, JOB_FAILED
+from gearman.result_cache import MemoryResultStore, ResultCache, SqliteResultStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make_store(max_size):
+        if request.param == 'memory':
+            return MemoryResultStore(max_size)
+        return SqliteResultStore(str(tmp_path / 'results.db'), max_size)
+    return make_store
+
+
+def test_store_evicts_the_least_recently_used(make_store):
+    store = make_store(max_size=2)
+    store.set(b'first', b'1', None)
+    store.set(b'second', b'2', None)
+    assert store.get(b'first') == b'1'
+
+    store.set(b'third', b'3', None)
+    assert len(store) == 2
+    assert store.get(b'second') is None
+    assert store.get(b'first') == b'1'
+    assert store.get(b'third') == b'3'
+
+
+def test_store_forgets_expired_results(make_store):
+    store = make_store(max_size=2)
+    store.set(b'stale', b'1', time.time() - 1.0)
+    store.set(b'fresh', b'2', time.time() + 60.0)
+    assert store.get(b'stale') is None
+    assert store.get(b'fresh') == b'2'
+
+
+def test_sqlite_store_outlives_the_process(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    first_store = SqliteResultStore(db_path)
+    first_store.set(b'key', b'result', None)
+    first_store.close()
+
+    assert SqliteResultStore(db_path).get(b'key') == b'result'
+
+
+def test_client_answers_repeated_jobs_from_the_cache(server):
+    result_cache = ResultCache({'reverse': 60.0})
+    client = GearmanClient([server.address], result_cache=result_cache)
+    try:
+        first_request = client.submit_job('reverse', b'abc')
+        assert first_request.result == b'cba'
+
+        # Same data, no unique: answered without going near the server
+        cached_request = client.submit_job('reverse', b'abc')
+        assert cached_request is not first_request
+        assert cached_request.state == JOB_COMPLETE
+        assert cached_request.result == b'cba'
+        assert cached_request.job.connection is None
+        assert server.submitted_jobs == 1
+
+        # Explicit uniques are cached by the unique instead
+        client.submit_job('reverse', b'xyz', unique='mine')
+        assert client.submit_job('reverse', b'other data', unique='mine').result == b'zyx'
+        assert server.submitted_jobs == 2
+
+        assert (result_cache.hits, result_cache.misses) == (2, 2)
+    finally:
+        client.shutdown()
+
+
+def test_client_only_caches_what_it_should(server):
+    result_cache = ResultCache({'reverse': 60.0, 'expiring': 0.0})
+    client = GearmanClient([server.address], result_cache=result_cache)
+    try:
+        # Failures aren't results
+        assert client.submit_job('reverse', b'fail').state == JOB_FAILED
+        assert client.submit_job('reverse', b'fail').state == JOB_FAILED
+
+        # Tasks we weren't asked to cache, background jobs and expired results all go to the server
+        client.submit_job('uncached', b'abc')
+        client.submit_job('uncached', b'abc')
+        client.submit_job('reverse', b'abc', background=True)
+        client.submit_job('reverse', b'abc', background=True)
+        client.submit_job('expiring', b'abc')
+        client.submit_job('expiring', b'abc')
+        assert server.submitted_jobs == 8
+        assert result_cache.hits == 0
+    finally:
+        client.shutdown()
+
+
+def test_uniques_taken_from_the_data_are_cached_by_the_data(server):
+    result_cache = ResultCache({'reverse': 60.0})
+    client = GearmanClient([server.address], result_cache=result_cache)
+    try:
+        assert client.submit_job('reverse', b'abc', unique='-').result == b'cba'
+        assert client.submit_job('reverse', b'xyz', unique='-').result == b'zyx'
+        assert client.submit_job('reverse', b'abc', unique='-').result == b'cba'
+        assert server.submitted_jobs == 2
+        assert (result_cache.hits, result_cache.misses) == (1, 2)
+    finally:
+        client.shutdown()
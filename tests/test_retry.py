@@ -0,0 +1,195 @@
+# -*- encoding: utf-8
+
+import time
+
+import pytest
+
+from gearman.client import GearmanClient
+from gearman.constants import JOB_COMPLETE, JOB_FAILED
+import gearman.io
+from gearman.errors import ServerUnavailable
+from gearman.job import GearmanJob, GearmanJobRequest
+from gearman.retry import DecorrelatedJitterBackoff, ExponentialBackoffRetryPolicy, RetryBudget, RetryPolicy
+from tests._core_testing import FakeGearmanServer
+
+
+class FixedDelayRetryPolicy(RetryPolicy):
+    def __init__(self, retry_delay, max_retries=3):
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+
+    def get_retry_delay(self, current_request):
+        return self.retry_delay if current_request.retry_count < self.max_retries else None
+
+
+def _request(retry_count=0):
+    current_request = GearmanJobRequest(GearmanJob(None, None, 'reverse', 'unique', b'data'))
+    current_request.retry_count = retry_count
+    return current_request
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    retry_policy = ExponentialBackoffRetryPolicy(max_retries=10, base_delay=0.1, max_delay=1.0)
+    for retry_count in range(10):
+        retry_delays = [retry_policy.get_retry_delay(_request(retry_count)) for _ in range(200)]
+        longest_delay = min(1.0, 0.1 * 2 ** retry_count)
+        assert all(0.0 <= retry_delay <= longest_delay for retry_delay in retry_delays)
+
+        # Jitter spreads retries out across the whole window
+        assert max(retry_delays) > longest_delay * 0.8
+        assert min(retry_delays) < longest_delay * 0.2
+
+
+def test_backoff_gives_up_after_max_retries():
+    retry_policy = ExponentialBackoffRetryPolicy(max_retries=2)
+    assert retry_policy.get_retry_delay(_request(1)) is not None
+    assert retry_policy.get_retry_delay(_request(2)) is None
+
+
+def test_budget_refills_as_requests_are_sent():
+    retry_budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert retry_budget.withdraw()
+    assert retry_budget.withdraw()
+    assert not retry_budget.withdraw()
+
+    retry_budget.deposit()
+    assert not retry_budget.withdraw()
+    retry_budget.deposit()
+    assert retry_budget.withdraw()
+
+    # Quiet spells don't save up more retries than the budget holds
+    for _ in range(100):
+        retry_budget.deposit()
+    assert retry_budget.tokens == 2.0
+
+
+def test_backoff_gives_up_once_its_budget_runs_out():
+    retry_policy = ExponentialBackoffRetryPolicy(budget=RetryBudget(ratio=1.0, max_tokens=1))
+    assert retry_policy.get_retry_delay(_request()) is not None
+    assert retry_policy.get_retry_delay(_request()) is None
+
+    retry_policy.on_request_sent(_request())
+    assert retry_policy.get_retry_delay(_request()) is not None
+
+
+def test_reconnect_delays_grow_with_decorrelated_jitter():
+    reconnect_backoff = DecorrelatedJitterBackoff(base_delay=0.1, max_delay=5.0)
+    previous_delays = [None] * 200
+    for _ in range(10):
+        reconnect_delays = [reconnect_backoff.get_delay(previous_delay) for previous_delay in previous_delays]
+        assert all(0.1 <= reconnect_delay <= min(5.0, (previous_delay or 0.1) * 3) for reconnect_delay, previous_delay in zip(reconnect_delays, previous_delays))
+        previous_delays = reconnect_delays
+
+    # Workers that started out together have long since drifted apart, and most of them are waiting much longer
+    assert len(set(previous_delays)) > 100
+    assert sum(reconnect_delay > 0.5 for reconnect_delay in previous_delays) > 100
+
+
+@pytest.fixture
+def failing_and_healthy_servers(start_server):
+    return [start_server(fail_jobs=True), start_server()]
+
+
+def test_failed_jobs_are_retried_on_another_server(failing_and_healthy_servers):
+    failing_server, healthy_server = failing_and_healthy_servers
+    retry_policy = ExponentialBackoffRetryPolicy(max_retries=1, base_delay=0.01, retry_failed_jobs=True)
+    client = GearmanClient([server.address for server in failing_and_healthy_servers], task_retry_policies={'reverse': retry_policy})
+    try:
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'job %d' % job_index) for job_index in range(20)])
+        assert [current_request.result for current_request in completed_requests] == [(b'job %d' % job_index)[::-1] for job_index in range(20)]
+        assert all(current_request.retry_count <= 1 for current_request in completed_requests)
+        assert healthy_server.submitted_jobs == 20
+        assert failing_server.submitted_jobs == sum(current_request.retry_count for current_request in completed_requests)
+
+        # Tasks without a policy that retries failures get them back as they are
+        failed_requests = client.submit_multiple_jobs([dict(task='echo', data=b'job %d' % job_index) for job_index in range(20)])
+        assert JOB_FAILED in set(current_request.state for current_request in failed_requests)
+        assert all(current_request.retry_count == 0 for current_request in failed_requests)
+    finally:
+        client.shutdown()
+
+
+def test_retried_requests_outlive_the_server_that_failed_them(failing_and_healthy_servers):
+    failing_server, healthy_server = failing_and_healthy_servers
+    retry_policy = ExponentialBackoffRetryPolicy(max_retries=1, base_delay=0.01, retry_failed_jobs=True)
+    client = GearmanClient([server.address for server in failing_and_healthy_servers], retry_policy=retry_policy)
+    try:
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'job %d' % job_index) for job_index in range(20)])
+        assert any(current_request.retry_count for current_request in completed_requests)
+        assert all(current_request.state == JOB_COMPLETE for current_request in completed_requests)
+
+        # Losing the server that failed them first mustn't take back requests that have since completed elsewhere
+        failing_server.stop()
+        next_request = client.submit_job('reverse', b'abc', poll_timeout=5.0)
+        assert next_request.state == JOB_COMPLETE
+        assert all(current_request.state == JOB_COMPLETE for current_request in completed_requests)
+        assert not client._request_to_scheduled_retry
+    finally:
+        client.shutdown()
+
+
+def test_lost_requests_wait_out_their_retry_delay():
+    servers = [FakeGearmanServer(drop_connections=1), FakeGearmanServer()]
+    client = GearmanClient([server.address for server in servers], retry_policy=FixedDelayRetryPolicy(0.1))
+    try:
+        start_time = time.time()
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'job %d' % job_index) for job_index in range(20)])
+        assert all(current_request.state == JOB_COMPLETE for current_request in completed_requests)
+
+        # Requests the dropped connection lost came back once their delay was up, and went to the other server
+        retried_requests = [current_request for current_request in completed_requests if current_request.retry_count]
+        assert retried_requests
+        assert time.time() - start_time >= 0.1
+        assert all(current_request.job.connection.gearman_port == client.connection_list[1].gearman_port for current_request in retried_requests)
+        assert not client._request_to_scheduled_retry
+    finally:
+        client.shutdown()
+        for server in servers:
+            server.stop()
+
+
+def test_retries_give_up_when_no_server_can_be_reached():
+    stopped_server = FakeGearmanServer()
+    stopped_server.stop()
+
+    client = GearmanClient([stopped_server.address], retry_policy=ExponentialBackoffRetryPolicy(max_retries=2, base_delay=0.01))
+    try:
+        with pytest.raises(ServerUnavailable):
+            client.submit_job('reverse', b'abc', poll_timeout=5.0)
+    finally:
+        client.shutdown()
+
+
+def test_a_jobs_own_policy_comes_first(failing_and_healthy_servers):
+    client = GearmanClient([server.address for server in failing_and_healthy_servers], retry_policy=ExponentialBackoffRetryPolicy(max_retries=0))
+    try:
+        retrying_policy = ExponentialBackoffRetryPolicy(max_retries=1, base_delay=0.01, retry_failed_jobs=True)
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'job %d' % job_index, retry_policy=retrying_policy) for job_index in range(20)])
+        assert all(current_request.state == JOB_COMPLETE for current_request in completed_requests)
+    finally:
+        client.shutdown()
+
+
+def test_retry_delays_wait_on_the_select_backend(monkeypatch):
+    poll_calls = []
+    original_poll = gearman.io._Select.poll
+
+    def counting_poll(poller, timeout):
+        poll_calls.append(timeout)
+        return original_poll(poller, timeout)
+
+    monkeypatch.setattr(gearman.io._Select, 'poll', counting_poll)
+
+    server = FakeGearmanServer(drop_connections=1)
+    client = GearmanClient([server.address], retry_policy=FixedDelayRetryPolicy(0.2))
+    client.poller_backend = 'select'
+    try:
+        completed_request = client.submit_job('reverse', b'abc', poll_timeout=5.0)
+        assert completed_request.state == JOB_COMPLETE
+        assert completed_request.retry_count == 1
+
+        # With no connections to watch, waiting out the retry delay shouldn't spin round the poll loop
+        assert len(poll_calls) < 20
+    finally:
+        client.shutdown()
+        server.stop()
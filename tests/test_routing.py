@@ -0,0 +1,154 @@
+# -*- encoding: utf-8
+
+import collections
+
+import pytest
+
+from gearman.client import GearmanClient
+from gearman.connection import GearmanConnection
+from gearman.job import GearmanJob, GearmanJobRequest
+from gearman.routing import ConsistentHashRouter, PowerOfTwoChoicesRouter, connection_address
+
+ADDRESSES = ['10.0.0.%d:4730' % host_index for host_index in range(1, 5)]
+
+
+def _connections(addresses):
+    return [GearmanConnection(*current_address.split(':')) for current_address in addresses]
+
+
+def _requests(request_count, task='reverse'):
+    return [GearmanJobRequest(GearmanJob(None, None, task, 'unique-%d' % job_index, b'data')) for job_index in range(request_count)]
+
+
+def _owners(router, connection_list, job_requests):
+    return [connection_address(router.route(current_request, connection_list)[0]) for current_request in job_requests]
+
+
+def test_route_returns_every_connection_once():
+    connection_list = _connections(ADDRESSES)
+    routed_connections = ConsistentHashRouter().route(_requests(1)[0], connection_list)
+    assert sorted(routed_connections, key=connection_address) == connection_list
+
+
+def test_route_is_the_same_for_every_client():
+    job_requests = _requests(200)
+    first_owners = _owners(ConsistentHashRouter(), _connections(ADDRESSES), job_requests)
+    second_owners = _owners(ConsistentHashRouter(), _connections(reversed(ADDRESSES)), job_requests)
+    assert first_owners == second_owners
+
+
+def test_route_keys_on_task_and_unique():
+    connection_list = _connections(ADDRESSES)
+    router = ConsistentHashRouter()
+    assert _owners(router, connection_list, _requests(200, task='reverse')) != _owners(router, connection_list, _requests(200, task='echo'))
+
+
+def test_losing_a_server_only_moves_its_own_requests():
+    connection_list = _connections(ADDRESSES)
+    router = ConsistentHashRouter()
+    job_requests = _requests(2000)
+    owners_before = _owners(router, connection_list, job_requests)
+    owners_after = _owners(router, connection_list[:-1], job_requests)
+
+    moved_from = set(before for before, after in zip(owners_before, owners_after) if before != after)
+    assert moved_from == set([ADDRESSES[-1]])
+
+    # A server going down takes its own share of requests with it, but no more
+    assert owners_before.count(ADDRESSES[-1]) < 2000 * 0.4
+
+
+def test_weights_scale_a_servers_share():
+    connection_list = _connections(ADDRESSES[:2])
+    router = ConsistentHashRouter(weights={ADDRESSES[0]: 3})
+    owner_counts = collections.Counter(_owners(router, connection_list, _requests(4000)))
+    assert 2.0 < float(owner_counts[ADDRESSES[0]]) / owner_counts[ADDRESSES[1]] < 4.5
+
+
+def test_fractional_weights_scale_a_servers_share():
+    connection_list = _connections(ADDRESSES[:2])
+    router = ConsistentHashRouter(weights={ADDRESSES[0]: 1.5, ADDRESSES[1]: 0.001})
+    owner_counts = collections.Counter(_owners(router, connection_list, _requests(4000)))
+
+    # Even the tiniest weight keeps a server on the ring
+    assert owner_counts[ADDRESSES[0]] > owner_counts[ADDRESSES[1]] > 0
+
+
+def test_power_of_two_choices_prefers_the_less_loaded_connection():
+    busy_connection, idle_connection = _connections(ADDRESSES[:2])
+    busy_connection.outstanding_requests = 10
+    busy_connection.record_job_created_rtt(0.01)
+    idle_connection.record_job_created_rtt(0.01)
+
+    router = PowerOfTwoChoicesRouter()
+    assert all(router.route(current_request, [busy_connection, idle_connection])[0] is idle_connection for current_request in _requests(20))
+
+    # A slow server loses out to a quicker one that's busier, but only up to a point
+    slow_connection, quick_connection = _connections(ADDRESSES[:2])
+    slow_connection.record_job_created_rtt(0.05)
+    quick_connection.record_job_created_rtt(0.01)
+    quick_connection.outstanding_requests = 3
+    assert router.route(_requests(1)[0], [slow_connection, quick_connection])[0] is quick_connection
+
+    quick_connection.outstanding_requests = 10
+    assert router.route(_requests(1)[0], [slow_connection, quick_connection])[0] is slow_connection
+
+
+def test_power_of_two_choices_tries_unmeasured_connections():
+    measured_connection, new_connection = _connections(ADDRESSES[:2])
+    measured_connection.record_job_created_rtt(0.01)
+    assert PowerOfTwoChoicesRouter().route(_requests(1)[0], [measured_connection, new_connection])[0] is new_connection
+
+
+def test_power_of_two_choices_falls_back_on_every_connection():
+    connection_list = _connections(ADDRESSES)
+    routed_connections = PowerOfTwoChoicesRouter().route(_requests(1)[0], connection_list)
+    assert sorted(routed_connections, key=connection_address) == connection_list
+
+
+@pytest.fixture
+def fake_servers(start_server):
+    return [start_server(), start_server()]
+
+
+def test_client_sends_duplicate_jobs_to_the_same_server(fake_servers):
+    client = GearmanClient([server.address for server in fake_servers], router=ConsistentHashRouter())
+    try:
+        jobs = [dict(task='reverse', data=b'abc', unique='unique-%d' % (job_index % 10)) for job_index in range(100)]
+        completed_requests = client.submit_multiple_jobs(jobs)
+        assert all(current_request.complete for current_request in completed_requests)
+
+        jobs_by_unique = collections.defaultdict(set)
+        for current_request in completed_requests:
+            jobs_by_unique[current_request.job.unique].add(current_request.job.connection)
+
+        assert all(len(used_connections) == 1 for used_connections in jobs_by_unique.values())
+        assert not client.request_to_rotating_connection_queue
+    finally:
+        client.shutdown()
+
+
+def test_client_fails_over_to_the_next_server_on_the_ring(fake_servers):
+    live_server = fake_servers[0]
+    unreachable_address = '127.0.0.1:%s' % fake_servers[1].address.split(':')[1]
+    fake_servers[1].stop()
+
+    client = GearmanClient([live_server.address, unreachable_address], router=ConsistentHashRouter())
+    try:
+        completed_requests = client.submit_multiple_jobs([dict(task='reverse', data=b'abc', unique='unique-%d' % job_index) for job_index in range(20)])
+        assert all(current_request.complete for current_request in completed_requests)
+        assert live_server.submitted_jobs == 20
+    finally:
+        client.shutdown()
+
+
+def test_client_steers_clear_of_a_slow_server(start_server):
+    servers = [start_server(), start_server(response_delay=0.02)]
+    client = GearmanClient([server.address for server in servers], router=PowerOfTwoChoicesRouter())
+    try:
+        for job_index in range(50):
+            assert client.submit_job('reverse', b'job %d' % job_index).complete
+
+        # Once we've timed both servers, everything goes to the quick one
+        assert servers[1].submitted_jobs <= 2
+    finally:
+        client.shutdown()
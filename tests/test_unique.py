@@ -0,0 +1,121 @@
+# -*- encoding: utf-8
+
+import os
+import threading
+
+import pytest
+
+from gearman.client import GearmanClient
+from gearman.unique import CONTENT_HASH, MAX_UNIQUE_LENGTH, ContentHashUniqueGenerator, CounterUniqueGenerator, RandomPoolUniqueGenerator
+from tests._core_testing import FakeGearmanServer
+
+
+@pytest.fixture(params=[RandomPoolUniqueGenerator, CounterUniqueGenerator])
+def unique_generator(request):
+    return request.param()
+
+
+def test_generated_uniques_are_all_different(unique_generator):
+    generated_uniques = [unique_generator.generate_unique('task', None) for _ in range(10000)]
+    assert len(set(generated_uniques)) == len(generated_uniques)
+    assert max(len(current_unique) for current_unique in generated_uniques) <= MAX_UNIQUE_LENGTH
+
+
+def test_generated_uniques_are_all_different_across_threads(unique_generator):
+    generated_uniques = []
+
+    def generate_uniques():
+        generated_uniques.extend([unique_generator.generate_unique('task', None) for _ in range(5000)])
+
+    threads = [threading.Thread(target=generate_uniques) for _ in range(4)]
+    for current_thread in threads:
+        current_thread.start()
+    for current_thread in threads:
+        current_thread.join()
+
+    assert len(set(generated_uniques)) == 20000
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='Needs os.fork()')
+def test_generated_uniques_differ_after_fork(unique_generator):
+    unique_generator.generate_unique('task', None)
+
+    read_fd, write_fd = os.pipe()
+    child_pid = os.fork()
+    if child_pid == 0:
+        os.close(read_fd)
+        os.write(write_fd, unique_generator.generate_unique('task', None).encode('ascii'))
+        os._exit(0)
+
+    os.close(write_fd)
+    os.waitpid(child_pid, 0)
+    child_unique = os.read(read_fd, MAX_UNIQUE_LENGTH).decode('ascii')
+    os.close(read_fd)
+
+    assert child_unique != unique_generator.generate_unique('task', None)
+
+
+def test_random_pool_uniques_are_hex_of_the_requested_size():
+    unique_generator = RandomPoolUniqueGenerator(unique_bytes=8, pool_size=3)
+    generated_uniques = [unique_generator.generate_unique('task', None) for _ in range(10)]
+    assert all(len(current_unique) == 16 for current_unique in generated_uniques)
+    assert all(int(current_unique, 16) >= 0 for current_unique in generated_uniques)
+
+    with pytest.raises(AssertionError):
+        RandomPoolUniqueGenerator(unique_bytes=32)
+
+
+def test_content_hash_uniques_follow_task_and_data():
+    unique_generator = ContentHashUniqueGenerator()
+    assert unique_generator.generate_unique('task', b'data') == unique_generator.generate_unique(b'task', b'data')
+    assert unique_generator.generate_unique('task', b'data') != unique_generator.generate_unique('task', b'other data')
+    assert unique_generator.generate_unique('task', b'data') != unique_generator.generate_unique('other task', b'data')
+
+    # Moving bytes between the task and the data still makes a different job
+    assert unique_generator.generate_unique('ab', b'c') != unique_generator.generate_unique('a', b'bc')
+    assert len(unique_generator.generate_unique('task', b'data')) == 32
+
+
+def test_client_uses_its_unique_generator():
+    server = FakeGearmanServer()
+    client = GearmanClient([server.address], unique_generator=ContentHashUniqueGenerator())
+    try:
+        first_request, second_request, third_request = client.submit_multiple_jobs([
+            dict(task='reverse', data=b'abc'),
+            dict(task='reverse', data=b'abc'),
+            dict(task='reverse', data=b'abc', unique='mine'),
+        ])
+        assert first_request.complete and second_request.complete
+        assert first_request.job.unique == second_request.job.unique
+        assert third_request.job.unique == 'mine'
+    finally:
+        client.shutdown()
+        server.stop()
+
+
+def test_content_hash_uniques_per_task_or_per_job():
+    client = GearmanClient(['localhost:4730'], task_unique_generators={'thumbnail': CONTENT_HASH})
+
+    def unique_for(task, data, **job_info):
+        job_info.update(task=task, data=data)
+        return client._create_request_from_dictionary(job_info).job.unique
+
+    # Only the tasks and jobs that ask for them get content-addressed uniques
+    assert unique_for('thumbnail', b'cat.png') == unique_for('thumbnail', b'cat.png') == CONTENT_HASH.generate_unique('thumbnail', b'cat.png')
+    assert unique_for('reverse', b'cat.png') != unique_for('reverse', b'cat.png')
+    assert unique_for('reverse', b'cat.png', unique_generator=CONTENT_HASH) == unique_for('reverse', b'cat.png', unique_generator=CONTENT_HASH)
+
+    # Jobs that name their own unique keep it
+    assert unique_for('thumbnail', b'cat.png', unique='mine') == 'mine'
+
+
+def test_content_hash_uniques_hash_the_encoded_data():
+    class UpperCaseEncoder(object):
+        @classmethod
+        def encode(cls, encodable_object):
+            return encodable_object.upper()
+
+    client = GearmanClient(['localhost:4730'], unique_generator=CONTENT_HASH)
+    client.data_encoder = UpperCaseEncoder
+    current_request = client._create_request_from_dictionary({'task': 'reverse', 'data': b'abc'})
+    assert current_request.job.unique == CONTENT_HASH.generate_unique('reverse', b'ABC')
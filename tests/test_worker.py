@@ -1,9 +1,15 @@
 # -*- encoding: utf-8
 
 import collections
+import socket
+import time
 
 import pytest
 
+import gearman.io
+from gearman.circuit_breaker import CircuitBreaker
+from gearman.constants import CIRCUIT_OPEN
+from gearman.retry import DecorrelatedJitterBackoff
 from gearman.worker import GearmanWorker
 from gearman.worker_handler import GearmanWorkerCommandHandler
 
@@ -12,7 +18,7 @@ from gearman.protocol import get_command_name, GEARMAN_COMMAND_RESET_ABILITIES,
     GEARMAN_COMMAND_NOOP, GEARMAN_COMMAND_PRE_SLEEP, GEARMAN_COMMAND_NO_JOB, GEARMAN_COMMAND_GRAB_JOB_UNIQ, GEARMAN_COMMAND_JOB_ASSIGN_UNIQ, \
     GEARMAN_COMMAND_WORK_STATUS, GEARMAN_COMMAND_WORK_FAIL, GEARMAN_COMMAND_WORK_COMPLETE, GEARMAN_COMMAND_WORK_DATA, GEARMAN_COMMAND_WORK_EXCEPTION, GEARMAN_COMMAND_WORK_WARNING
 
-from tests._core_testing import _GearmanAbstractTest, MockGearmanConnectionManager, MockGearmanConnection
+from tests._core_testing import _GearmanAbstractTest, FakeGearmanServer, MockGearmanConnectionManager, MockGearmanConnection
 
 
 class MockGearmanWorker(MockGearmanConnectionManager, GearmanWorker):
@@ -120,6 +126,21 @@ class WorkerTest(_GearmanAbstractWorkerTest):
         assert failed_then_retried_connection in alive_connections
         assert failed_connection not in alive_connections
 
+    def test_establish_worker_connections_skips_open_circuits(self):
+        good_connection = MockGearmanConnection()
+
+        broken_connection = MockGearmanConnection()
+        broken_connection._fail_on_bind = True
+        broken_connection.circuit_breaker = CircuitBreaker(failure_threshold=1, probe_interval=60.0)
+
+        self.connection_manager.connection_list = [good_connection, broken_connection]
+        assert self.connection_manager.establish_worker_connections() == [good_connection]
+        assert broken_connection.circuit_breaker.state == CIRCUIT_OPEN
+
+        # Until its probe is due, we leave the broken connection alone
+        broken_connection.connect = None
+        assert self.connection_manager.establish_worker_connections() == [good_connection]
+
     def test_establish_worker_connections_dead(self):
         self.connection_manager.connection_list = []
         self.connection_manager.command_handlers = {}
@@ -367,3 +388,100 @@ class WorkerCommandHandlerStateMachineTest(_GearmanAbstractWorkerTest):
     def assert_job_lock(self, is_locked):
         expected_value = (is_locked and self.command_handler) or None
         assert self.connection_manager.command_handler_holding_job_lock == expected_value
+
+
+class StoppingWorker(GearmanWorker):
+    """Reverses jobs, and stops working once it has finished jobs_to_run of them or run out of time"""
+    def __init__(self, host_list, jobs_to_run, **kwargs):
+        super(StoppingWorker, self).__init__(host_list, **kwargs)
+        self.jobs_to_run = jobs_to_run
+        self.stop_time = time.time() + 10.0
+        self.register_task(b'reverse', self.reverse)
+
+    def reverse(self, gearman_worker, gearman_job):
+        self.jobs_to_run -= 1
+        return gearman_job.data[::-1]
+
+    def after_poll(self, any_activity):
+        return self.jobs_to_run > 0 and time.time() < self.stop_time
+
+
+def test_worker_reconnects_in_the_background():
+    dropping_server, healthy_server = servers = [FakeGearmanServer(drop_connections=1), FakeGearmanServer()]
+    try:
+        for current_server in servers:
+            for job_index in range(3):
+                current_server.queue_job(b'reverse', b'job %d' % job_index)
+
+        worker = StoppingWorker([current_server.address for current_server in servers], jobs_to_run=6,
+                                reconnect_backoff=DecorrelatedJitterBackoff(base_delay=0.05, max_delay=0.1))
+        start_time = time.time()
+        worker.work(poll_timeout=5.0)
+        worker.shutdown()
+
+        # The server that hung up on us got its jobs done too, without waiting for the poll timeout to come back to it
+        assert worker.jobs_to_run == 0
+        assert time.time() - start_time < 5.0
+        assert dropping_server.connection_count == 2
+        assert healthy_server.connection_count == 1
+        assert not worker._reconnecting_connections
+    finally:
+        for current_server in servers:
+            current_server.stop()
+
+
+def test_worker_reconnect_delays_wait_on_the_select_backend(monkeypatch):
+    poll_calls = []
+    original_poll = gearman.io._Select.poll
+
+    def counting_poll(poller, timeout):
+        poll_calls.append(timeout)
+        return original_poll(poller, timeout)
+
+    monkeypatch.setattr(gearman.io._Select, 'poll', counting_poll)
+
+    server = FakeGearmanServer(drop_connections=1)
+    try:
+        server.queue_job(b'reverse', b'job 0')
+        worker = StoppingWorker([server.address], jobs_to_run=1,
+                                reconnect_backoff=DecorrelatedJitterBackoff(base_delay=0.2, max_delay=0.2))
+        worker.poller_backend = 'select'
+        worker.work(poll_timeout=5.0)
+        worker.shutdown()
+
+        # With the only server down, waiting to reconnect shouldn't spin round the poll loop
+        assert worker.jobs_to_run == 0
+        assert server.connection_count == 2
+        assert len(poll_calls) < 20
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def hanging_address():
+    """The address of a server whose backlog is full, so connecting to it hangs rather than failing"""
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.bind(('127.0.0.1', 0))
+    listening_socket.listen(0)
+    queued_socket = socket.create_connection(listening_socket.getsockname())
+    yield '127.0.0.1:%d' % listening_socket.getsockname()[1]
+    queued_socket.close()
+    listening_socket.close()
+
+
+def test_reconnects_to_a_hanging_server_give_up_quickly(start_server, hanging_address):
+    healthy_server = start_server()
+    for job_index in range(3):
+        healthy_server.queue_job(b'reverse', b'job %d' % job_index)
+
+    worker = StoppingWorker([healthy_server.address, hanging_address], jobs_to_run=3,
+                            reconnect_backoff=DecorrelatedJitterBackoff(base_delay=0.05, max_delay=0.05), reconnect_timeout=0.1)
+    start_time = time.time()
+    worker.work(poll_timeout=5.0)
+    worker.shutdown()
+
+    # Our reconnects kept timing out, without holding up the jobs on the healthy server for long
+    assert worker.jobs_to_run == 0
+    assert time.time() - start_time < 2.0
+    hanging_connection, = [current_connection for current_connection in worker.connection_list if current_connection.gearman_port != int(healthy_server.address.split(':')[1])]
+    assert hanging_connection.circuit_breaker.consecutive_failures >= 1